@@ -8,16 +8,20 @@ from vyper.interfaces import ERC20
 
 collateral: public(ERC20)
 
+interface ERC20Permit:
+    def permit(_owner: address, _spender: address, _value: uint256, _deadline: uint256, _v: uint8, _r: bytes32, _s: bytes32) -> bool: nonpayable
+
 interface Token:
     def balanceOf(_owner: address) -> uint256: view
-    def allowance(_owner : address, _spender : address) -> uint256: view
     def mintTo(_to: address, _value: uint256) -> bool: nonpayable
+    def mintBatch(_recipients: DynArray[address, 100], _values: DynArray[uint256, 100]) -> bool: nonpayable
     def burnFrom(_from: address, _value: uint256) -> bool: nonpayable
 
 stablecoin: public(Token)
 
 interface StabilityPool:
     def update_values(_debt_value: uint256, _collateral_value: uint256) -> bool: nonpayable
+    def total_stablecoin() -> uint256: view
 
 stability_pool: public(StabilityPool)
 stability_pool_address: public(address)
@@ -26,6 +30,48 @@ import interfaces.AggregatorV3Interface as AggregatorV3Interface
 
 collateral_price_feed: public(AggregatorV3Interface)
 
+# Loan events carry the loan values after the call, or the values settled when the loan ends
+event LoanOpened:
+    user: indexed(address)
+    collateral_value: uint256
+    debt_value: uint256
+
+event LoanClosed:
+    user: indexed(address)
+    collateral_value: uint256
+    debt_value: uint256
+
+event CollateralDeposited:
+    user: indexed(address)
+    value: uint256
+    collateral_value: uint256
+    debt_value: uint256
+
+event CollateralWithdrawn:
+    user: indexed(address)
+    value: uint256
+    collateral_value: uint256
+    debt_value: uint256
+
+event DebtBorrowed:
+    user: indexed(address)
+    value: uint256
+    collateral_value: uint256
+    debt_value: uint256
+
+event DebtRepaid:
+    user: indexed(address)
+    value: uint256
+    collateral_value: uint256
+    debt_value: uint256
+
+event Liquidated:
+    user: indexed(address)
+    liquidator: indexed(address)
+    collateral_value: uint256
+    debt_value: uint256
+    collateral_price: uint256
+
 # bps
 max_ltv_ratio: public(uint256)
 borrow_fee: public(uint256)
@@ -44,7 +90,44 @@ struct Loan:
     debt_value: uint256
     active: bool
 
-user_loans: public(HashMap[address, Loan])
+# Loans are packed into one slot, collateral value in the high 128 bits and debt value in the low 128 bits
+packed_loans: HashMap[address, uint256]
+
+LOAN_SHIFT: constant(uint256) = 2 ** 128
+
+# The last oracle read is packed into one slot, price in the high 128 bits, round id in the next 80 bits
+# and block number in the low 48 bits, so views later in the same block skip the oracle
+packed_price: uint256
+max_price_age: public(uint256)
+
+PRICE_SHIFT: constant(uint256) = 2 ** 128
+BLOCK_SHIFT: constant(uint256) = 2 ** 48
+DEFAULT_MAX_PRICE_AGE: constant(uint256) = 3600
+
+MAX_LIQUIDATIONS: constant(uint256) = 100
+
+MAX_VIEW_BATCH: constant(uint256) = 500
+
+struct SystemSnapshot:
+    total_collateral: uint256
+    total_debt: uint256
+    total_stablecoin: uint256
+    collateral_price: uint256
+    lq_price: uint256
+    max_ltv_ratio: uint256
+    borrow_fee: uint256
+    lq_reserve_fee: uint256
+    min_debt_value: uint256
+    lowest_loan: address
+    highest_loan: address
+
+# Active loans sorted by collateral to debt ratio, from lowest (riskiest) to highest
+lowest_loan: public(address)
+highest_loan: public(address)
+next_loan: public(HashMap[address, address])
+prev_loan: public(HashMap[address, address])
+
+MAX_SORTED_STEPS: constant(uint256) = 10 ** 9
 
 
 @external
@@ -67,70 +150,488 @@ def __init__(
     self.borrow_fee = _borrow_fee
     self.lq_reserve_fee = _lq_reserve_fee
     self.min_debt_value = _min_debt_value
+    self.max_price_age = DEFAULT_MAX_PRICE_AGE
     self.rewards = msg.sender
     self.deployer = msg.sender
 
 
+@view
+@internal
+def load_loan(_user: address) -> Loan:
+    """
+    @notice Unpacks the loan of a user
+    @param _user The address with loan
+    @return Returns the unpacked loan
+    """
+    packed: uint256 = self.packed_loans[_user]
+    return Loan({collateral_value: packed / LOAN_SHIFT, debt_value: packed % LOAN_SHIFT, active: packed != 0})
+
+
+@internal
+def store_loan(_user: address, _loan: Loan):
+    """
+    @notice Packs and stores the loan of a user
+    @param _user The address with loan
+    @param _loan The loan to store
+    """
+    # Run Checks
+    assert _loan.collateral_value < LOAN_SHIFT
+    assert _loan.debt_value < LOAN_SHIFT
+    # Store Loan
+    self.packed_loans[_user] = _loan.collateral_value * LOAN_SHIFT + _loan.debt_value
+
+
+@view
 @internal
-def get_collateral_latest_price() -> uint256:
+def read_collateral_price() -> (uint256, uint256):
     """
-    @notice Returns the current price of ETH on the price oracle
-    @return Returns the current price of ETH
+    @notice Reads the latest round of the price oracle
+    @dev Reverts on a nonpositive price, an incomplete round, or a round older than max_price_age
+    @return Returns the price of collateral and its round id
     """
-    # temporary
-    a: uint80 = 0
+    round_id: uint80 = 0
     price: int256 = 0
-    b: uint256 = 0
-    c: uint256 = 0
-    d: uint80 = 0
-    (a, price, b, c, d) = self.collateral_price_feed.latestRoundData()
-    return convert(price, uint256)
+    started_at: uint256 = 0
+    updated_at: uint256 = 0
+    answered_in_round: uint80 = 0
+    (round_id, price, started_at, updated_at, answered_in_round) = self.collateral_price_feed.latestRoundData()
+    # Run Checks
+    assert price > 0, "Invalid price"
+    assert answered_in_round >= round_id, "Stale round"
+    assert updated_at + self.max_price_age >= block.timestamp, "Stale price"
+    return (convert(price, uint256), convert(round_id, uint256))
+
+
+@view
+@internal
+def peek_collateral_price() -> uint256:
+    """
+    @notice Returns the price of collateral for views, which cannot update the cache
+    @return Returns the price cached in this block, or else the oracle's price
+    """
+    packed: uint256 = self.packed_price
+    if packed % BLOCK_SHIFT == block.number:
+        return packed / PRICE_SHIFT
+    price: uint256 = 0
+    round_id: uint256 = 0
+    (price, round_id) = self.read_collateral_price()
+    return price
+
+
+@view
+@internal
+def get_collateral_oracle_price() -> uint256:
+    """
+    @notice Returns the current price of collateral from the oracle, bypassing the cache
+    @dev Every state change reads the oracle, since a round published earlier in the block would otherwise let a
+         loan borrow, withdraw or be liquidated at the old price
+    @return Returns the current price of collateral
+    """
+    price: uint256 = 0
+    round_id: uint256 = 0
+    (price, round_id) = self.read_collateral_price()
+    return price
+
+
+@view
+@external
+def cached_collateral_price() -> (uint256, uint256, uint256):
+    """
+    @notice Getter to check the last price read from the oracle
+    @return Returns the price, its round id and the block it was read in
+    """
+    packed: uint256 = self.packed_price
+    return (packed / PRICE_SHIFT, packed % PRICE_SHIFT / BLOCK_SHIFT, packed % BLOCK_SHIFT)
 
 
+@external
+def refresh_collateral_price() -> uint256:
+    """
+    @notice Reads the oracle into the price cache, unless it was already read in this block
+    @dev Lets a keeper pay for the oracle read once, so views later in the block skip the oracle
+    @return Returns the current price of collateral
+    """
+    packed: uint256 = self.packed_price
+    # If Oracle Was Already Read In This Block, Then Reuse Its Price
+    if packed % BLOCK_SHIFT == block.number:
+        return packed / PRICE_SHIFT
+    price: uint256 = 0
+    round_id: uint256 = 0
+    (price, round_id) = self.read_collateral_price()
+    assert price < PRICE_SHIFT
+    # Cache Price
+    self.packed_price = price * PRICE_SHIFT + round_id * BLOCK_SHIFT + block.number
+    return price
+
+
+@pure
 @internal
-def get_lq_price(_collateralValue: uint256, _debtValue: uint256) -> uint256:
+def get_lq_price(_collateralValue: uint256, _debtValue: uint256, _collateralPrice: uint256) -> uint256:
     """
     @notice Returns liquidation price depending on collateral and debt given
+    @dev A loan whose collateral ratio rounds to zero is underwater at any price, so it gets the highest liquidation price
     @param _collateral_value The amount of collateral
     @param _debt_value The amount of debt
+    @param _collateral_price The current price of collateral
     @return Returns liquidation price
     """
     # Compute USD Value of Collateral
-    collateralUsdValue: uint256 = _collateralValue * self.get_collateral_latest_price() / 10 ** 18
+    collateralUsdValue: uint256 = _collateralValue * _collateralPrice / 10 ** 18
     # Compute Collaterization ratio
     collatRatio: uint256 = 10 ** 18 * collateralUsdValue / _debtValue
+    if collatRatio == 0:
+        return max_value(uint256)
     # Return Liquidate Price
-    return 10 ** 18 * self.get_collateral_latest_price() / collatRatio * 11 / 10
+    return 10 ** 18 * _collateralPrice / collatRatio * 11 / 10
 
 
-# Open/Close Loans
+@view
+@external
+def loan_of(_user: address) -> Loan:
+    """
+    @notice Getter to check the loan of a user
+    @param _user The address with loan
+    @return Returns the loan
+    """
+    return self.load_loan(_user)
 
 
+@view
 @external
-def open_loan(_collateral_value: uint256, _debt_value: uint256) -> bool:
+def user_loans(_user: address) -> Loan:
     """
-    @notice Creates a loan that holds collateral and mints stablecoins as debt
+    @notice Getter to check the loan of a user, kept for existing integrations
+    @param _user The address with loan
+    @return Returns the loan
+    """
+    return self.load_loan(_user)
+
+
+@view
+@external
+def loans_of(_users: DynArray[address, MAX_VIEW_BATCH]) -> DynArray[Loan, MAX_VIEW_BATCH]:
+    """
+    @notice Getter to check the loans of many users in one call
+    @param _users The addresses with loans
+    @return Returns the loans, in the same order as the addresses
+    """
+    loans: DynArray[Loan, MAX_VIEW_BATCH] = []
+    for user in _users:
+        loans.append(self.load_loan(user))
+    return loans
+
+
+@view
+@external
+def system_snapshot() -> SystemSnapshot:
+    """
+    @notice Getter to check every global value of the system in one call
+    @dev The liquidation price is the one of all collateral against all debt, zero without debt
+    @return Returns the totals, the current price and the system's liquidation price
+    """
+    collateral_price: uint256 = self.peek_collateral_price()
+    total_collateral: uint256 = self.total_collateral
+    total_debt: uint256 = self.total_debt
+    # Only Compute Liquidation Price Where The Collaterization Ratio Is Nonzero
+    lq_price: uint256 = 0
+    if total_debt > 0 and 10 ** 18 * (total_collateral * collateral_price / 10 ** 18) >= total_debt:
+        lq_price = self.get_lq_price(total_collateral, total_debt, collateral_price)
+    return SystemSnapshot({
+        total_collateral: total_collateral,
+        total_debt: total_debt,
+        total_stablecoin: self.stability_pool.total_stablecoin(),
+        collateral_price: collateral_price,
+        lq_price: lq_price,
+        max_ltv_ratio: self.max_ltv_ratio,
+        borrow_fee: self.borrow_fee,
+        lq_reserve_fee: self.lq_reserve_fee,
+        min_debt_value: self.min_debt_value,
+        lowest_loan: self.lowest_loan,
+        highest_loan: self.highest_loan
+    })
+
+
+# Sorted Loans
+
+
+@pure
+@internal
+def get_loan_ratio(_collateral_value: uint256, _debt_value: uint256) -> uint256:
+    """
+    @notice Returns the collateral to debt ratio used to sort loans
+    @param _collateral_value The amount of collateral
+    @param _debt_value The amount of debt
+    @return Returns the collateral to debt ratio
+    """
+    if _debt_value == 0:
+        return max_value(uint256)
+    return _collateral_value * 10 ** 18 / _debt_value
+
+
+@view
+@internal
+def get_user_ratio(_user: address) -> uint256:
+    """
+    @notice Returns the collateral to debt ratio of a stored loan
+    @param _user The address with loan
+    @return Returns the collateral to debt ratio
+    """
+    packed: uint256 = self.packed_loans[_user]
+    return self.get_loan_ratio(packed / LOAN_SHIFT, packed % LOAN_SHIFT)
+
+
+@view
+@internal
+def is_valid_position(_ratio: uint256, _prev: address, _next: address) -> bool:
+    """
+    @notice Checks if a ratio belongs between two adjacent loans
+    @param _ratio The collateral to debt ratio
+    @param _prev The loan with the next lower ratio, or empty for the lowest position
+    @param _next The loan with the next higher ratio, or empty for the highest position
+    @return Returns True if the position is valid
+    """
+    if _prev == empty(address) and _next == empty(address):
+        return self.lowest_loan == empty(address)
+    if _prev == empty(address):
+        return self.lowest_loan == _next and _ratio <= self.get_user_ratio(_next)
+    if _next == empty(address):
+        return self.highest_loan == _prev and _ratio >= self.get_user_ratio(_prev)
+    return self.next_loan[_prev] == _next and self.get_user_ratio(_prev) <= _ratio and _ratio <= self.get_user_ratio(_next)
+
+
+@view
+@internal
+def find_position(_user: address, _ratio: uint256, _prev_hint: address, _next_hint: address) -> (address, address):
+    """
+    @notice Finds the adjacent loans a ratio belongs between, starting from the given hints
+    @dev Hints that are inactive, belong to the user or are on the wrong side of the ratio are ignored
+    @param _user The address with loan being positioned, which must not be in the list
+    @param _ratio The collateral to debt ratio
+    @param _prev_hint A loan with a lower or equal ratio, close to the position
+    @param _next_hint A loan with a higher or equal ratio, close to the position
+    @return Returns the loans with the next lower and next higher ratio
+    """
+    prev: address = _prev_hint
+    next: address = _next_hint
+    # Drop Invalid Hints
+    if prev != empty(address):
+        if prev == _user or self.packed_loans[prev] == 0 or self.get_user_ratio(prev) > _ratio:
+            prev = empty(address)
+    if next != empty(address):
+        if next == _user or self.packed_loans[next] == 0 or self.get_user_ratio(next) < _ratio:
+            next = empty(address)
+    # If Hints Are Already Adjacent, Then Use Them
+    if self.is_valid_position(_ratio, prev, next):
+        return (prev, next)
+    # If Only Next Hint Is Usable, Then Walk Towards Lower Ratios
+    if prev == empty(address) and next != empty(address):
+        for i in range(MAX_SORTED_STEPS):
+            prev = self.prev_loan[next]
+            if prev == empty(address) or self.get_user_ratio(prev) <= _ratio:
+                return (prev, next)
+            next = prev
+    # Otherwise Walk Towards Higher Ratios From Previous Hint, Or From Lowest Loan
+    if prev == empty(address):
+        next = self.lowest_loan
+        if next == empty(address) or _ratio <= self.get_user_ratio(next):
+            return (empty(address), next)
+        prev = next
+    for i in range(MAX_SORTED_STEPS):
+        next = self.next_loan[prev]
+        if next == empty(address) or _ratio <= self.get_user_ratio(next):
+            return (prev, next)
+        prev = next
+    raise "Position not found"
+
+
+@internal
+def insert_loan(_user: address, _ratio: uint256, _prev_hint: address, _next_hint: address):
+    """
+    @notice Inserts a loan into the sorted list
+    @param _user The address with loan
+    @param _ratio The collateral to debt ratio of the loan
+    @param _prev_hint A loan with a lower or equal ratio, close to the position
+    @param _next_hint A loan with a higher or equal ratio, close to the position
+    """
+    prev: address = empty(address)
+    next: address = empty(address)
+    (prev, next) = self.find_position(_user, _ratio, _prev_hint, _next_hint)
+    # Link Loan To Its Neighbours
+    self.prev_loan[_user] = prev
+    self.next_loan[_user] = next
+    if prev == empty(address):
+        self.lowest_loan = _user
+    else:
+        self.next_loan[prev] = _user
+    if next == empty(address):
+        self.highest_loan = _user
+    else:
+        self.prev_loan[next] = _user
+
+
+@internal
+def remove_loan(_user: address):
+    """
+    @notice Removes a loan from the sorted list
+    @param _user The address with loan
+    """
+    prev: address = self.prev_loan[_user]
+    next: address = self.next_loan[_user]
+    # Link Neighbours To Each Other
+    if prev == empty(address):
+        self.lowest_loan = next
+    else:
+        self.next_loan[prev] = next
+    if next == empty(address):
+        self.highest_loan = prev
+    else:
+        self.prev_loan[next] = prev
+    # Reset Links
+    self.prev_loan[_user] = empty(address)
+    self.next_loan[_user] = empty(address)
+
+
+@internal
+def reposition_loan(_user: address, _loan: Loan, _prev_hint: address, _next_hint: address):
+    """
+    @notice Moves a loan to its position in the sorted list after its ratio changed
+    @param _user The address with loan
+    @param _loan The updated loan
+    @param _prev_hint A loan with a lower or equal ratio, close to the new position
+    @param _next_hint A loan with a higher or equal ratio, close to the new position
+    """
+    ratio: uint256 = self.get_loan_ratio(_loan.collateral_value, _loan.debt_value)
+    # If Loan Is Still Between Its Neighbours, Then Keep Position
+    prev: address = self.prev_loan[_user]
+    next: address = self.next_loan[_user]
+    if (prev == empty(address) or self.get_user_ratio(prev) <= ratio) and (next == empty(address) or ratio <= self.get_user_ratio(next)):
+        return
+    self.remove_loan(_user)
+    self.insert_loan(_user, ratio, _prev_hint, _next_hint)
+
+
+@view
+@external
+def find_insert_position(_collateral_value: uint256, _debt_value: uint256, _prev_hint: address, _next_hint: address) -> (address, address):
+    """
+    @notice Getter to find the hints for a loan with the given values
+    @param _collateral_value The amount of collateral
+    @param _debt_value The amount of debt
+    @param _prev_hint A loan with a lower or equal ratio, close to the position
+    @param _next_hint A loan with a higher or equal ratio, close to the position
+    @return Returns the loans with the next lower and next higher ratio
+    """
+    return self.find_position(empty(address), self.get_loan_ratio(_collateral_value, _debt_value), _prev_hint, _next_hint)
+
+
+@view
+@external
+def lowest_ratio_loans(_count: uint256) -> DynArray[address, MAX_LIQUIDATIONS]:
+    """
+    @notice Getter to list the loans with the lowest collateral to debt ratio
+    @param _count The number of loans to list
+    @return Returns the addresses with loans, from lowest ratio to highest
+    """
+    users: DynArray[address, MAX_LIQUIDATIONS] = []
+    user: address = self.lowest_loan
+    for i in range(MAX_LIQUIDATIONS):
+        if i >= _count or user == empty(address):
+            break
+        users.append(user)
+        user = self.next_loan[user]
+    return users
+
+
+# Permits
+
+
+@internal
+def permit_collateral(_value: uint256, _deadline: uint256, _v: uint8, _r: bytes32, _s: bytes32):
+    """
+    @notice Approves this contract to spend collateral of msg.sender with a signed EIP-2612 approval
+    @dev Skipped when the allowance is already there, so a permit submitted first by someone else cannot block the call
+    @param _value The amount of collateral to approve
+    @param _deadline The deadline of the signed approval
+    @param _v The recovery id of the signed approval
+    @param _r The first half of the signed approval
+    @param _s The second half of the signed approval
+    """
+    if self.collateral.allowance(msg.sender, self) < _value:
+        ERC20Permit(self.collateral.address).permit(msg.sender, self, _value, _deadline, _v, _r, _s)
+
+
+# Open/Close Loans
+
+
+@internal
+def _open_loan(_collateral_value: uint256, _debt_value: uint256, _prev_hint: address, _next_hint: address):
+    """
+    @notice Creates a loan for msg.sender that holds collateral and mints stablecoins as debt
     @param _collateral_value The initial amount of collateral for loan
     @param _debt_value The initial amount of debt taken from loan
-    @return Success boolean
+    @param _prev_hint A loan with a lower or equal ratio, close to the new position
+    @param _next_hint A loan with a higher or equal ratio, close to the new position
     """
     _borrow_fee_value: uint256 = _debt_value * self.borrow_fee / 10000
+    collateral_price: uint256 = self.get_collateral_oracle_price()
+    loan: Loan = Loan({collateral_value: _collateral_value, debt_value: _debt_value + _borrow_fee_value + self.lq_reserve_fee, active: True})
     # Run Checks
-    assert self.user_loans[msg.sender].active == False
+    assert self.packed_loans[msg.sender] == 0
     assert _debt_value >= self.min_debt_value
-    assert self.collateral.balanceOf(msg.sender) >= _collateral_value
-    assert self.collateral.allowance(msg.sender, self) >= _collateral_value
-    assert self.get_collateral_latest_price() > self.get_lq_price(_collateral_value, _debt_value + _borrow_fee_value + self.lq_reserve_fee)
-    # Transfer Collateral
-    self.collateral.transferFrom(msg.sender, self, _collateral_value)
+    assert collateral_price > self.get_lq_price(loan.collateral_value, loan.debt_value, collateral_price)
+    # Transfer Collateral, Which Checks Balance And Allowance
+    assert self.collateral.transferFrom(msg.sender, self, _collateral_value), "Collateral transfer failed"
     # Mint Stablecoins
-    self.stablecoin.mintTo(msg.sender, _debt_value)
-    self.stablecoin.mintTo(self.rewards, _borrow_fee_value)
+    self.stablecoin.mintBatch([msg.sender, self.rewards], [_debt_value, _borrow_fee_value])
     # Update Values
-    self.total_collateral += _collateral_value
-    self.total_debt += _debt_value + _borrow_fee_value + self.lq_reserve_fee
+    self.total_collateral += loan.collateral_value
+    self.total_debt += loan.debt_value
     # Initiate Loan
-    self.user_loans[msg.sender] = Loan({collateral_value: _collateral_value, debt_value: _debt_value + _borrow_fee_value + self.lq_reserve_fee, active: True})
+    self.store_loan(msg.sender, loan)
+    self.insert_loan(msg.sender, self.get_loan_ratio(loan.collateral_value, loan.debt_value), _prev_hint, _next_hint)
+    log LoanOpened(msg.sender, loan.collateral_value, loan.debt_value)
+
+
+@external
+def open_loan(_collateral_value: uint256, _debt_value: uint256, _prev_hint: address = empty(address), _next_hint: address = empty(address)) -> bool:
+    """
+    @notice Creates a loan that holds collateral and mints stablecoins as debt
+    @param _collateral_value The initial amount of collateral for loan
+    @param _debt_value The initial amount of debt taken from loan
+    @param _prev_hint A loan with a lower or equal ratio, close to the new position
+    @param _next_hint A loan with a higher or equal ratio, close to the new position
+    @return Success boolean
+    """
+    self._open_loan(_collateral_value, _debt_value, _prev_hint, _next_hint)
+    # Return Success
+    return True
+
+
+@external
+def open_loan_with_permit(
+    _collateral_value: uint256,
+    _debt_value: uint256,
+    _deadline: uint256,
+    _v: uint8,
+    _r: bytes32,
+    _s: bytes32,
+    _prev_hint: address = empty(address),
+    _next_hint: address = empty(address)
+) -> bool:
+    """
+    @notice Creates a loan in one transaction, using a signed EIP-2612 approval for the collateral
+    @param _collateral_value The initial amount of collateral for loan
+    @param _debt_value The initial amount of debt taken from loan
+    @param _deadline The deadline of the signed approval
+    @param _v The recovery id of the signed approval
+    @param _r The first half of the signed approval
+    @param _s The second half of the signed approval
+    @param _prev_hint A loan with a lower or equal ratio, close to the new position
+    @param _next_hint A loan with a higher or equal ratio, close to the new position
+    @return Success boolean
+    """
+    self.permit_collateral(_collateral_value, _deadline, _v, _r, _s)
+    self._open_loan(_collateral_value, _debt_value, _prev_hint, _next_hint)
     # Return Success
     return True
 
@@ -141,18 +642,21 @@ def close_loan() -> bool:
     @notice Closes a loan by burning the debt and transfering back the collateral
     @return Success boolean
     """
+    loan: Loan = self.load_loan(msg.sender)
     # Run Checks
-    assert self.user_loans[msg.sender].active == True
-    assert self.stablecoin.balanceOf(msg.sender) >= self.user_loans[msg.sender].debt_value - self.lq_reserve_fee
-    # Burn Stablecoins
-    self.stablecoin.burnFrom(msg.sender, self.user_loans[msg.sender].debt_value - self.lq_reserve_fee)
+    assert loan.active == True
+    repay_value: uint256 = loan.debt_value - self.lq_reserve_fee
+    # Burn Stablecoins, Which Checks Balance
+    self.stablecoin.burnFrom(msg.sender, repay_value)
     # Transfer Collateral
-    self.collateral.transfer(msg.sender, self.user_loans[msg.sender].collateral_value)
+    self.collateral.transfer(msg.sender, loan.collateral_value)
     # Update Values
-    self.total_collateral -= self.user_loans[msg.sender].collateral_value
-    self.total_debt -= self.user_loans[msg.sender].debt_value
+    self.total_collateral -= loan.collateral_value
+    self.total_debt -= loan.debt_value
     # Reset Loan
-    self.user_loans[msg.sender] = Loan({collateral_value: 0, debt_value: 0, active: False})
+    self.packed_loans[msg.sender] = 0
+    self.remove_loan(msg.sender)
+    log LoanClosed(msg.sender, loan.collateral_value, loan.debt_value)
     # Return Success
     return True
 
@@ -160,43 +664,92 @@ def close_loan() -> bool:
 # Collateral
 
 
-@external
-def deposit_collateral(_value: uint256) -> bool:
+@internal
+def _deposit_collateral(_value: uint256, _prev_hint: address, _next_hint: address):
     """
-    @notice Deposit Collateral into a loan
+    @notice Deposit Collateral into the loan of msg.sender
     @param _value The amount of collateral to deposit
-    @return Success boolean
+    @param _prev_hint A loan with a lower or equal ratio, close to the new position
+    @param _next_hint A loan with a higher or equal ratio, close to the new position
     """
+    loan: Loan = self.load_loan(msg.sender)
     # Run Checks
     assert _value > 0
-    assert self.user_loans[msg.sender].active == True
-    assert self.collateral.balanceOf(msg.sender) >= _value
-    assert self.collateral.allowance(msg.sender, self) >= _value
-    # Transfer Collateral
-    self.collateral.transferFrom(msg.sender, self, _value)
+    assert loan.active == True
+    # Transfer Collateral, Which Checks Balance And Allowance
+    assert self.collateral.transferFrom(msg.sender, self, _value), "Collateral transfer failed"
     # Update Values
-    self.user_loans[msg.sender].collateral_value += _value
+    loan.collateral_value += _value
+    self.store_loan(msg.sender, loan)
+    self.reposition_loan(msg.sender, loan, _prev_hint, _next_hint)
     self.total_collateral += _value
+    log CollateralDeposited(msg.sender, _value, loan.collateral_value, loan.debt_value)
+
+
+@external
+def deposit_collateral(_value: uint256, _prev_hint: address = empty(address), _next_hint: address = empty(address)) -> bool:
+    """
+    @notice Deposit Collateral into a loan
+    @param _value The amount of collateral to deposit
+    @param _prev_hint A loan with a lower or equal ratio, close to the new position
+    @param _next_hint A loan with a higher or equal ratio, close to the new position
+    @return Success boolean
+    """
+    self._deposit_collateral(_value, _prev_hint, _next_hint)
     # Return Success
     return True
 
 
 @external
-def withdraw_collateral(_value: uint256) -> bool:
+def deposit_collateral_with_permit(
+    _value: uint256,
+    _deadline: uint256,
+    _v: uint8,
+    _r: bytes32,
+    _s: bytes32,
+    _prev_hint: address = empty(address),
+    _next_hint: address = empty(address)
+) -> bool:
+    """
+    @notice Deposit Collateral into a loan in one transaction, using a signed EIP-2612 approval
+    @param _value The amount of collateral to deposit
+    @param _deadline The deadline of the signed approval
+    @param _v The recovery id of the signed approval
+    @param _r The first half of the signed approval
+    @param _s The second half of the signed approval
+    @param _prev_hint A loan with a lower or equal ratio, close to the new position
+    @param _next_hint A loan with a higher or equal ratio, close to the new position
+    @return Success boolean
+    """
+    self.permit_collateral(_value, _deadline, _v, _r, _s)
+    self._deposit_collateral(_value, _prev_hint, _next_hint)
+    # Return Success
+    return True
+
+
+@external
+def withdraw_collateral(_value: uint256, _prev_hint: address = empty(address), _next_hint: address = empty(address)) -> bool:
     """
     @notice Withdraw Collateral from loan
     @param _value The amount of collateral to withdraw
+    @param _prev_hint A loan with a lower or equal ratio, close to the new position
+    @param _next_hint A loan with a higher or equal ratio, close to the new position
     @return Success boolean
     """
+    collateral_price: uint256 = self.get_collateral_oracle_price()
+    loan: Loan = self.load_loan(msg.sender)
     # Run Checks
     assert _value > 0
-    assert self.user_loans[msg.sender].active == True
-    assert self.get_collateral_latest_price() > self.get_lq_price(self.user_loans[msg.sender].collateral_value - _value, self.user_loans[msg.sender].debt_value)
+    assert loan.active == True
+    loan.collateral_value -= _value
+    assert collateral_price > self.get_lq_price(loan.collateral_value, loan.debt_value, collateral_price)
     # Transfer Collateral
     self.collateral.transfer(msg.sender, _value)
     # Update Values
-    self.user_loans[msg.sender].collateral_value -= _value
+    self.store_loan(msg.sender, loan)
+    self.reposition_loan(msg.sender, loan, _prev_hint, _next_hint)
     self.total_collateral -= _value
+    log CollateralWithdrawn(msg.sender, _value, loan.collateral_value, loan.debt_value)
     # Return Success
     return True
 
@@ -205,44 +758,55 @@ def withdraw_collateral(_value: uint256) -> bool:
 
 
 @external
-def borrow_stablecoin(_value: uint256) -> bool:
+def borrow_stablecoin(_value: uint256, _prev_hint: address = empty(address), _next_hint: address = empty(address)) -> bool:
     """
     @notice Mints debt from loan as stablecoins
     @param _value The amount of stablecoins to borrow
+    @param _prev_hint A loan with a lower or equal ratio, close to the new position
+    @param _next_hint A loan with a higher or equal ratio, close to the new position
     @return Success boolean
     """
+    _borrow_fee_value: uint256 = _value * self.borrow_fee / 10000
+    collateral_price: uint256 = self.get_collateral_oracle_price()
+    loan: Loan = self.load_loan(msg.sender)
     # Run Checks
     assert _value > 0
-    assert self.user_loans[msg.sender].active == True
-    assert self.get_collateral_latest_price() > self.get_lq_price(self.user_loans[msg.sender].collateral_value, self.user_loans[msg.sender].debt_value - _value)
+    assert loan.active == True
+    loan.debt_value += _value + _borrow_fee_value
+    assert collateral_price > self.get_lq_price(loan.collateral_value, loan.debt_value, collateral_price)
     # Mint Stablecoins
-    _borrow_fee_value: uint256 = _value * self.borrow_fee / 10000
-    self.stablecoin.mintTo(msg.sender, _value)
-    self.stablecoin.mintTo(self.rewards, _borrow_fee_value)
+    self.stablecoin.mintBatch([msg.sender, self.rewards], [_value, _borrow_fee_value])
     # Update Values
-    self.user_loans[msg.sender].debt_value += _value + _borrow_fee_value
+    self.store_loan(msg.sender, loan)
+    self.reposition_loan(msg.sender, loan, _prev_hint, _next_hint)
     self.total_debt += _value + _borrow_fee_value
+    log DebtBorrowed(msg.sender, _value, loan.collateral_value, loan.debt_value)
     # Return Success
     return True
 
 
 @external
-def repay_stablecoin(_value: uint256) -> bool:
+def repay_stablecoin(_value: uint256, _prev_hint: address = empty(address), _next_hint: address = empty(address)) -> bool:
     """
     @notice Repay debt from loan as stablecoins
     @param _value The amount of stablecoins to repay debt
+    @param _prev_hint A loan with a lower or equal ratio, close to the new position
+    @param _next_hint A loan with a higher or equal ratio, close to the new position
     @return Success boolean
     """
+    loan: Loan = self.load_loan(msg.sender)
     # Run Checks
     assert _value > 0
-    assert self.user_loans[msg.sender].active == True
-    assert self.stablecoin.balanceOf(msg.sender) >= _value
-    assert self.user_loans[msg.sender].debt_value - _value >= self.min_debt_value + self.lq_reserve_fee
-    # Burn Stablecoins
+    assert loan.active == True
+    loan.debt_value -= _value
+    assert loan.debt_value >= self.min_debt_value + self.lq_reserve_fee
+    # Burn Stablecoins, Which Checks Balance
     self.stablecoin.burnFrom(msg.sender, _value)
     # Update Values
-    self.user_loans[msg.sender].debt_value -= _value
+    self.store_loan(msg.sender, loan)
+    self.reposition_loan(msg.sender, loan, _prev_hint, _next_hint)
     self.total_debt -= _value
+    log DebtRepaid(msg.sender, _value, loan.collateral_value, loan.debt_value)
     # Return Success
     return True
 
@@ -257,28 +821,122 @@ def liquidate(_user: address) -> bool:
     @param _user The address with loan to liquidate
     @return Success boolean
     """
+    collateral_price: uint256 = self.get_collateral_oracle_price()
+    loan: Loan = self.load_loan(_user)
     # Run Checks
-    assert self.user_loans[_user].active == True
-    assert self.stablecoin.balanceOf(self.stability_pool_address) >= self.user_loans[_user].debt_value
-    assert self.get_lq_price(self.user_loans[_user].collateral_value, self.user_loans[_user].debt_value) >= self.get_collateral_latest_price()
-    # Burn Stablecoins
-    self.stablecoin.burnFrom(self.stability_pool_address, self.user_loans[_user].debt_value)
+    assert loan.active == True
+    assert self.get_lq_price(loan.collateral_value, loan.debt_value, collateral_price) >= collateral_price
+    pool_collateral_value: uint256 = loan.collateral_value * 199 / 200
+    # Burn Stablecoins, Which Checks The Stability Pool Can Cover The Debt
+    self.stablecoin.burnFrom(self.stability_pool_address, loan.debt_value)
     # Transfer Collateral
-    self.collateral.transfer(self.stability_pool_address, self.user_loans[_user].collateral_value * 199 / 200)
-    self.collateral.transfer(msg.sender, self.user_loans[_user].collateral_value / 200)
+    self.collateral.transfer(self.stability_pool_address, pool_collateral_value)
+    self.collateral.transfer(msg.sender, loan.collateral_value - pool_collateral_value)
     # Mint Stablecoins
     self.stablecoin.mintTo(msg.sender, self.lq_reserve_fee)
     # Update Values
-    self.total_collateral -= self.user_loans[_user].collateral_value
-    self.total_debt -= self.user_loans[_user].debt_value
+    self.total_collateral -= loan.collateral_value
+    self.total_debt -= loan.debt_value
     # Update Stability Pool Values
-    self.stability_pool.update_values(self.user_loans[_user].debt_value, self.user_loans[_user].collateral_value * 199 / 200)
+    self.stability_pool.update_values(loan.debt_value, pool_collateral_value)
     # Reset Loan
-    self.user_loans[_user] = Loan({collateral_value: 0, debt_value: 0, active: False})
+    self.packed_loans[_user] = 0
+    self.remove_loan(_user)
+    log Liquidated(_user, msg.sender, loan.collateral_value, loan.debt_value, collateral_price)
     # Return Success
     return True
 
 
+@internal
+def liquidate_loans(_users: DynArray[address, MAX_LIQUIDATIONS], _collateral_price: uint256) -> uint256:
+    """
+    @notice Liquidate every risky loan in a list of users in a single pass
+    @dev Healthy or inactive loans, and loans the stability pool can no longer cover, are skipped
+    @param _users The addresses with loans to liquidate
+    @param _collateral_price The current price of collateral
+    @return Returns the number of loans liquidated
+    """
+    # Initialize Variables
+    pool_stablecoin: uint256 = self.stability_pool.total_stablecoin()
+    liquidated: uint256 = 0
+    debt_value: uint256 = 0
+    collateral_value: uint256 = 0
+    # Reset Risky Loans
+    for user in _users:
+        loan: Loan = self.load_loan(user)
+        # If Loan Is Inactive, Then Move On To Next Loan
+        if loan.active == False:
+            continue
+        # If Stability Pool Deposits Cannot Cover Debt, Then Move On To Next Loan
+        if debt_value + loan.debt_value > pool_stablecoin:
+            continue
+        # If Loan Is Healthy, Then Move On To Next Loan
+        if self.get_lq_price(loan.collateral_value, loan.debt_value, _collateral_price) < _collateral_price:
+            continue
+        # Update Values
+        debt_value += loan.debt_value
+        collateral_value += loan.collateral_value
+        liquidated += 1
+        # Reset Loan
+        self.packed_loans[user] = 0
+        self.remove_loan(user)
+        log Liquidated(user, msg.sender, loan.collateral_value, loan.debt_value, _collateral_price)
+    # If No Loans Were Liquidated, Then Stop
+    if liquidated == 0:
+        return 0
+    pool_collateral_value: uint256 = collateral_value * 199 / 200
+    # Burn Stablecoins
+    self.stablecoin.burnFrom(self.stability_pool_address, debt_value)
+    # Transfer Collateral
+    self.collateral.transfer(self.stability_pool_address, pool_collateral_value)
+    self.collateral.transfer(msg.sender, collateral_value - pool_collateral_value)
+    # Mint Stablecoins
+    self.stablecoin.mintTo(msg.sender, self.lq_reserve_fee * liquidated)
+    # Update Values
+    self.total_collateral -= collateral_value
+    self.total_debt -= debt_value
+    # Update Stability Pool Values
+    self.stability_pool.update_values(debt_value, pool_collateral_value)
+    # Return Number Of Liquidated Loans
+    return liquidated
+
+
+@external
+def batch_liquidate(_users: DynArray[address, MAX_LIQUIDATIONS]) -> uint256:
+    """
+    @notice Liquidate every risky loan in a list of users in a single pass
+    @dev Healthy or inactive loans, and loans the stability pool can no longer cover, are skipped
+    @param _users The addresses with loans to liquidate
+    @return Returns the number of loans liquidated
+    """
+    return self.liquidate_loans(_users, self.get_collateral_oracle_price())
+
+
+@external
+def liquidate_lowest(_count: uint256) -> uint256:
+    """
+    @notice Liquidate the risky loans with the lowest collateral to debt ratio
+    @dev Stops at the first healthy loan, since every loan after it has a higher ratio
+    @param _count The maximum number of loans to liquidate
+    @return Returns the number of loans liquidated
+    """
+    # Initialize Variables
+    collateral_price: uint256 = self.get_collateral_oracle_price()
+    users: DynArray[address, MAX_LIQUIDATIONS] = []
+    user: address = self.lowest_loan
+    # Collect Risky Loans From Lowest Ratio
+    for i in range(MAX_LIQUIDATIONS):
+        if i >= _count or user == empty(address):
+            break
+        loan: Loan = self.load_loan(user)
+        if self.get_lq_price(loan.collateral_value, loan.debt_value, collateral_price) < collateral_price:
+            break
+        users.append(user)
+        user = self.next_loan[user]
+    # Liquidate Collected Loans
+    return self.liquidate_loans(users, collateral_price)
+
+
 # Deployer
 
 
@@ -292,3 +950,15 @@ def set_rewards(_to: address):
     assert self.deployer == msg.sender
     # Update Rewards
     self.rewards = _to
+
+
+@external
+def set_max_price_age(_max_price_age: uint256):
+    """
+    @notice Changes how old the oracle's latest round can be before prices are refused
+    @param _max_price_age The maximum age in seconds
+    """
+    # Run Checks
+    assert self.deployer == msg.sender
+    # Update Max Price Age
+    self.max_price_age = _max_price_age
@@ -2,27 +2,87 @@
 
 """
 @title Stability Pool to provide liquidity for liquidations
+@notice Liquidations are absorbed pro-rata by every deposit through a running
+        product (stablecoin loss) and sum (collateral gain), so their cost does
+        not depend on the number of deposits. Each deposit is settled lazily
+        from a snapshot of those accumulators.
 """
 
 from vyper.interfaces import ERC20
 
+interface ERC20Permit:
+    def permit(_owner: address, _spender: address, _value: uint256, _deadline: uint256, _v: uint8, _r: bytes32, _s: bytes32) -> bool: nonpayable
+
 wand: public(address)
 stablecoin: public(ERC20)
 collateral: public(ERC20)
 
 total_stablecoin: public(uint256)
 
+event DepositOpened:
+    depositer: indexed(address)
+    stablecoin_value: uint256
+    total_stablecoin: uint256
+
+# Values paid out to the depositer
+event DepositClosed:
+    depositer: indexed(address)
+    stablecoin_value: uint256
+    collateral_value: uint256
+    total_stablecoin: uint256
+
+# Deposit left after the call, and the collateral paid out
+event DepositUpdated:
+    depositer: indexed(address)
+    stablecoin_value: uint256
+    collateral_value: uint256
+    total_stablecoin: uint256
+
+# Running product, epoch and scale after the liquidation, enough to settle any deposit off-chain
+event PoolAbsorbed:
+    debt_value: uint256
+    collateral_value: uint256
+    total_stablecoin: uint256
+    product: uint256
+    epoch: uint256
+    scale: uint256
+
 struct Deposit:
-    depositer: address
     active: bool
     index: uint256
     stablecoin_value: uint256
-    collateral_value: uint256
 
-deposit_list: public(DynArray[Deposit, 10 ** 18])
+struct Snapshot:
+    product: uint256
+    sum: uint256
+    epoch: uint256
+    scale: uint256
+
+struct DepositState:
+    active: bool
+    stablecoin_value: uint256
+    compounded_stablecoin: uint256
+    collateral_gain: uint256
+
+MAX_VIEW_BATCH: constant(uint256) = 500
+
+# Deposits live only in deposits, the list holds the depositer addresses so deposits can be enumerated
+deposit_list: public(DynArray[address, 10 ** 18])
 deposits: public(HashMap[address, Deposit])
+deposit_snapshots: public(HashMap[address, Snapshot])
+
+DECIMAL_PRECISION: constant(uint256) = 10 ** 18
+SCALE_FACTOR: constant(uint256) = 10 ** 9
+
+# Running product of (1 - stablecoin lost per unit deposited)
+product: public(uint256)
+# Running sum of collateral gained per unit deposited, per epoch and scale
+epoch_to_scale_to_sum: public(HashMap[uint256, HashMap[uint256, uint256]])
+# Incremented when a liquidation empties the pool
+current_epoch: public(uint256)
+# Incremented when the product is rescaled to keep its precision
+current_scale: public(uint256)
 
-start_index: public(uint256)
 min_deposit_value: public(uint256)
 
 deployer: public(address)
@@ -34,33 +94,174 @@ def __init__(_stablecoin_address: address, _collateral_address: address, _min_de
     self.stablecoin = ERC20(_stablecoin_address)
     self.collateral = ERC20(_collateral_address)
     self.deposit_list = []
+    self.product = DECIMAL_PRECISION
     self.min_deposit_value = _min_deposit_value
     self.deployer = msg.sender
 
 
-# Open/Close Deposits
+@view
+@internal
+def _compounded_stablecoin(_depositer: address) -> uint256:
+    """
+    @notice Returns the stablecoins left in a deposit after the liquidations since its snapshot
+    @param _depositer The address of the deposit
+    @return Returns the compounded stablecoin value
+    """
+    initial_value: uint256 = self.deposits[_depositer].stablecoin_value
+    if initial_value == 0:
+        return 0
+    snapshot: Snapshot = self.deposit_snapshots[_depositer]
+    # If The Pool Was Emptied Since The Snapshot, Then Deposit Was Fully Used
+    if snapshot.epoch < self.current_epoch:
+        return 0
+    scale_diff: uint256 = self.current_scale - snapshot.scale
+    if scale_diff == 0:
+        return initial_value * self.product / snapshot.product
+    # Product Was Rescaled Once Since The Snapshot
+    if scale_diff == 1:
+        return initial_value * self.product / snapshot.product / SCALE_FACTOR
+    # Product Was Rescaled More Than Once, Remaining Value Is Negligible
+    return 0
+
+
+@view
+@internal
+def _collateral_gain(_depositer: address) -> uint256:
+    """
+    @notice Returns the collateral a deposit has gained from liquidations since its snapshot
+    @param _depositer The address of the deposit
+    @return Returns the collateral gain
+    """
+    initial_value: uint256 = self.deposits[_depositer].stablecoin_value
+    if initial_value == 0:
+        return 0
+    snapshot: Snapshot = self.deposit_snapshots[_depositer]
+    # Gains In The Snapshot's Scale, Plus Gains In The Next Scale Reduced By The Scale Factor
+    first_portion: uint256 = self.epoch_to_scale_to_sum[snapshot.epoch][snapshot.scale] - snapshot.sum
+    second_portion: uint256 = self.epoch_to_scale_to_sum[snapshot.epoch][snapshot.scale + 1] / SCALE_FACTOR
+    return initial_value * (first_portion + second_portion) / snapshot.product / DECIMAL_PRECISION
 
 
+@view
 @external
-def open_deposit(_value: uint256) -> bool:
+def get_compounded_stablecoin(_depositer: address) -> uint256:
     """
-    @notice Creates a deposit by depositing stablecoins
+    @notice Getter to check the stablecoins currently left in a deposit
+    @param _depositer The address of the deposit
+    @return Returns the compounded stablecoin value
+    """
+    return self._compounded_stablecoin(_depositer)
+
+
+@view
+@external
+def get_collateral_gain(_depositer: address) -> uint256:
+    """
+    @notice Getter to check the collateral currently gained by a deposit
+    @param _depositer The address of the deposit
+    @return Returns the collateral gain
+    """
+    return self._collateral_gain(_depositer)
+
+
+@view
+@external
+def deposits_of(_depositers: DynArray[address, MAX_VIEW_BATCH]) -> DynArray[DepositState, MAX_VIEW_BATCH]:
+    """
+    @notice Getter to check the deposits of many addresses in one call
+    @param _depositers The addresses of the deposits
+    @return Returns each deposit with its compounded stablecoins and collateral gain, in the same order as the addresses
+    """
+    states: DynArray[DepositState, MAX_VIEW_BATCH] = []
+    for depositer in _depositers:
+        states.append(DepositState({
+            active: self.deposits[depositer].active,
+            stablecoin_value: self.deposits[depositer].stablecoin_value,
+            compounded_stablecoin: self._compounded_stablecoin(depositer),
+            collateral_gain: self._collateral_gain(depositer)
+        }))
+    return states
+
+
+@view
+@external
+def deposit_count() -> uint256:
+    """
+    @notice Getter to check the number of open deposits
+    @return Returns the length of the deposit list
+    """
+    return len(self.deposit_list)
+
+
+# Permits
+
+
+@internal
+def permit_stablecoin(_value: uint256, _deadline: uint256, _v: uint8, _r: bytes32, _s: bytes32):
+    """
+    @notice Approves this contract to spend stablecoins of msg.sender with a signed EIP-2612 approval
+    @dev Skipped when the allowance is already there, so a permit submitted first by someone else cannot block the call
+    @param _value The amount of stablecoins to approve
+    @param _deadline The deadline of the signed approval
+    @param _v The recovery id of the signed approval
+    @param _r The first half of the signed approval
+    @param _s The second half of the signed approval
+    """
+    if self.stablecoin.allowance(msg.sender, self) < _value:
+        ERC20Permit(self.stablecoin.address).permit(msg.sender, self, _value, _deadline, _v, _r, _s)
+
+
+# Open/Close Deposits
+
+
+@internal
+def _open_deposit(_value: uint256):
+    """
+    @notice Creates a deposit for msg.sender by depositing stablecoins
     @param _value The amount of stablecoins to deposit
-    @return Success boolean
     """
     # Run Checks
     assert _value >= self.min_deposit_value
     assert self.deposits[msg.sender].active == False
-    assert self.stablecoin.balanceOf(msg.sender) >= _value
-    assert self.stablecoin.allowance(msg.sender, self) >= _value
-    # Transfer Stablecoins
-    self.stablecoin.transferFrom(msg.sender, self, _value)
+    # Transfer Stablecoins, Which Checks Balance And Allowance
+    assert self.stablecoin.transferFrom(msg.sender, self, _value), "Stablecoin transfer failed"
     # Update Values
     self.total_stablecoin += _value
     # Create Deposit
-    new_Deposit: Deposit = Deposit({depositer: msg.sender, active: True, index: len(self.deposit_list), stablecoin_value: _value, collateral_value: 0})
-    self.deposits[msg.sender] = new_Deposit
-    self.deposit_list.append(new_Deposit)
+    self.deposits[msg.sender] = Deposit({active: True, index: len(self.deposit_list), stablecoin_value: _value})
+    self.deposit_list.append(msg.sender)
+    # Snapshot Running Product And Sum
+    epoch: uint256 = self.current_epoch
+    scale: uint256 = self.current_scale
+    self.deposit_snapshots[msg.sender] = Snapshot({product: self.product, sum: self.epoch_to_scale_to_sum[epoch][scale], epoch: epoch, scale: scale})
+    log DepositOpened(msg.sender, _value, self.total_stablecoin)
+
+
+@external
+def open_deposit(_value: uint256) -> bool:
+    """
+    @notice Creates a deposit by depositing stablecoins
+    @param _value The amount of stablecoins to deposit
+    @return Success boolean
+    """
+    self._open_deposit(_value)
+    # Return Success
+    return True
+
+
+@external
+def open_deposit_with_permit(_value: uint256, _deadline: uint256, _v: uint8, _r: bytes32, _s: bytes32) -> bool:
+    """
+    @notice Creates a deposit in one transaction, using a signed EIP-2612 approval for the stablecoins
+    @param _value The amount of stablecoins to deposit
+    @param _deadline The deadline of the signed approval
+    @param _v The recovery id of the signed approval
+    @param _r The first half of the signed approval
+    @param _s The second half of the signed approval
+    @return Success boolean
+    """
+    self.permit_stablecoin(_value, _deadline, _v, _r, _s)
+    self._open_deposit(_value)
     # Return Success
     return True
 
@@ -73,19 +274,140 @@ def close_deposit() -> bool:
     """
     # Run Checks
     assert self.deposits[msg.sender].active == True
+    # Settle Deposit Against Liquidations Since Snapshot
+    stablecoin_value: uint256 = min(self._compounded_stablecoin(msg.sender), self.total_stablecoin)
+    collateral_value: uint256 = self._collateral_gain(msg.sender)
     # Transfer Stablecoins, If Any
-    if self.deposits[msg.sender].stablecoin_value > 0:
-        self.stablecoin.transfer(msg.sender, self.deposits[msg.sender].stablecoin_value)
+    if stablecoin_value > 0:
+        self.stablecoin.transfer(msg.sender, stablecoin_value)
     # Transfer Collateral, If Any
-    if self.deposits[msg.sender].collateral_value > 0:
-        self.collateral.transfer(msg.sender, self.deposits[msg.sender].collateral_value)
+    if collateral_value > 0:
+        self.collateral.transfer(msg.sender, collateral_value)
     # Update Values
-    self.total_stablecoin -= self.deposits[msg.sender].stablecoin_value
-    # Reset Deposit
+    self.total_stablecoin -= stablecoin_value
+    # Remove Deposit From List By Moving The Last Depositer Into Its Slot
     old_index: uint256 = self.deposits[msg.sender].index
-    new_Deposit: Deposit = Deposit({depositer: empty(address), active: False, index: old_index, stablecoin_value: 0, collateral_value: 0})
-    self.deposits[msg.sender] = new_Deposit
-    self.deposit_list[old_index] = new_Deposit
+    last_depositer: address = self.deposit_list.pop()
+    if last_depositer != msg.sender:
+        self.deposit_list[old_index] = last_depositer
+        self.deposits[last_depositer].index = old_index
+    # Reset Deposit
+    self.deposits[msg.sender] = empty(Deposit)
+    self.deposit_snapshots[msg.sender] = empty(Snapshot)
+    log DepositClosed(msg.sender, stablecoin_value, collateral_value, self.total_stablecoin)
+    # Return Success
+    return True
+
+
+# Update Deposits In Place
+
+
+@internal
+def settle_deposit(_depositer: address, _stablecoin_value: uint256) -> uint256:
+    """
+    @notice Pays out the collateral gained by a deposit and restarts it from the current product and sum
+    @param _depositer The address of the deposit
+    @param _stablecoin_value The stablecoins left in the deposit
+    @return Returns the collateral paid out
+    """
+    collateral_value: uint256 = self._collateral_gain(_depositer)
+    # Transfer Collateral, If Any
+    if collateral_value > 0:
+        self.collateral.transfer(_depositer, collateral_value)
+    # Update Deposit
+    self.deposits[_depositer].stablecoin_value = _stablecoin_value
+    # Snapshot Running Product And Sum
+    epoch: uint256 = self.current_epoch
+    scale: uint256 = self.current_scale
+    self.deposit_snapshots[_depositer] = Snapshot({product: self.product, sum: self.epoch_to_scale_to_sum[epoch][scale], epoch: epoch, scale: scale})
+    return collateral_value
+
+
+@internal
+def _add_to_deposit(_value: uint256):
+    """
+    @notice Adds stablecoins to the deposit of msg.sender and pays out the collateral it gained
+    @param _value The amount of stablecoins to add
+    """
+    # Run Checks
+    assert _value > 0
+    assert self.deposits[msg.sender].active == True
+    # Transfer Stablecoins, Which Checks Balance And Allowance
+    assert self.stablecoin.transferFrom(msg.sender, self, _value), "Stablecoin transfer failed"
+    # Update Values
+    stablecoin_value: uint256 = min(self._compounded_stablecoin(msg.sender), self.total_stablecoin) + _value
+    self.total_stablecoin += _value
+    # Settle Deposit Against Liquidations Since Snapshot
+    collateral_value: uint256 = self.settle_deposit(msg.sender, stablecoin_value)
+    log DepositUpdated(msg.sender, stablecoin_value, collateral_value, self.total_stablecoin)
+
+
+@external
+def add_to_deposit(_value: uint256) -> bool:
+    """
+    @notice Adds stablecoins to a deposit and pays out the collateral it gained
+    @param _value The amount of stablecoins to add
+    @return Success boolean
+    """
+    self._add_to_deposit(_value)
+    # Return Success
+    return True
+
+
+@external
+def add_to_deposit_with_permit(_value: uint256, _deadline: uint256, _v: uint8, _r: bytes32, _s: bytes32) -> bool:
+    """
+    @notice Adds stablecoins to a deposit in one transaction, using a signed EIP-2612 approval
+    @param _value The amount of stablecoins to add
+    @param _deadline The deadline of the signed approval
+    @param _v The recovery id of the signed approval
+    @param _r The first half of the signed approval
+    @param _s The second half of the signed approval
+    @return Success boolean
+    """
+    self.permit_stablecoin(_value, _deadline, _v, _r, _s)
+    self._add_to_deposit(_value)
+    # Return Success
+    return True
+
+
+@external
+def withdraw_from_deposit(_value: uint256) -> bool:
+    """
+    @notice Withdraws stablecoins from a deposit and pays out the collateral it gained
+    @dev The deposit must keep at least the minimum deposit value, close_deposit withdraws everything
+    @param _value The amount of stablecoins to withdraw
+    @return Success boolean
+    """
+    compounded_value: uint256 = min(self._compounded_stablecoin(msg.sender), self.total_stablecoin)
+    # Run Checks
+    assert _value > 0
+    assert self.deposits[msg.sender].active == True
+    assert compounded_value >= _value + self.min_deposit_value
+    # Transfer Stablecoins
+    self.stablecoin.transfer(msg.sender, _value)
+    # Update Values
+    stablecoin_value: uint256 = compounded_value - _value
+    self.total_stablecoin -= _value
+    # Settle Deposit Against Liquidations Since Snapshot
+    collateral_value: uint256 = self.settle_deposit(msg.sender, stablecoin_value)
+    log DepositUpdated(msg.sender, stablecoin_value, collateral_value, self.total_stablecoin)
+    # Return Success
+    return True
+
+
+@external
+def claim_collateral() -> bool:
+    """
+    @notice Pays out the collateral a deposit gained from liquidations, keeping its stablecoins deposited
+    @return Success boolean
+    """
+    # Run Checks
+    assert self.deposits[msg.sender].active == True
+    # Settle Deposit Against Liquidations Since Snapshot
+    stablecoin_value: uint256 = min(self._compounded_stablecoin(msg.sender), self.total_stablecoin)
+    collateral_value: uint256 = self.settle_deposit(msg.sender, stablecoin_value)
+    log DepositUpdated(msg.sender, stablecoin_value, collateral_value, self.total_stablecoin)
     # Return Success
     return True
 
@@ -96,57 +418,48 @@ def close_deposit() -> bool:
 @external
 def update_values(_debt_value: uint256, _collateral_value: uint256) -> bool:
     """
-    @notice Updates values of used deposits during a liquidation
+    @notice Absorbs a liquidation into every deposit pro-rata
+    @dev Only updates the running product and sum, so the cost does not depend on the number of deposits
     @param _debt_value The amount of debt needed from deposits
     @param _collateral_value The amount of collateral gained from paying off debt
     @return Success boolean
     """
     # Run Checks
     assert msg.sender == self.wand
+    assert _debt_value > 0
+    assert _debt_value <= self.total_stablecoin
     # Initialize Variables
-    debt_payed: uint256 = 0
-    deposits_emptied: uint256 = 0
-    # Start Updating Deposits To Clear Debt
-    for i in range(self.start_index, self.start_index + 10 ** 18):
-        deposit: Deposit = self.deposit_list[i]
-        # If Deposit Has No Stablecoins, Then Move On To Next Deposit
-        if deposit.stablecoin_value == 0:
-            deposits_emptied += 1
-            continue
-        # Calculate Remaining Debt
-        remaining_debt: uint256 = _debt_value - debt_payed
-        # If Deposit Has Less Than Or Equal To Stablecoins Needed
-        if remaining_debt >= deposit.stablecoin_value:
-            # Update Values
-            debt_payed += deposit.stablecoin_value
-            deposits_emptied += 1
-            # Update Deposit List
-            self.deposit_list[i].stablecoin_value = 0
-            # Update Gained Collateral
-            self.deposit_list[i].collateral_value = deposit.stablecoin_value * _collateral_value / _debt_value
-            # Update Deposit
-            self.deposits[deposit.depositer].stablecoin_value = 0
-            # Update Gained Collateral
-            self.deposits[deposit.depositer].collateral_value = deposit.stablecoin_value * _collateral_value / _debt_value
-            # If Deposit Is Emptied And Clears Remaining Debt, Then Stop For Loop
-            if remaining_debt == deposit.stablecoin_value:
-                break
-        # If Deposit Has More Stablecoins Than Needed
-        else:
-            # Update Deposit List
-            self.deposit_list[i].stablecoin_value -= remaining_debt
-            # Update Gained Collateral
-            self.deposit_list[i].collateral_value = remaining_debt * _collateral_value / _debt_value
-            # Update Deposit
-            self.deposits[deposit.depositer].stablecoin_value -= remaining_debt
-            # Update Gained Collateral
-            self.deposits[deposit.depositer].collateral_value = remaining_debt * _collateral_value / _debt_value
-            # Stop For Loop, Since Debt Is Cleared
-            break
-    # Increase Start Index Pass Emptied Deposits
-    self.start_index += deposits_emptied
-    # Update Stablecoin Total
-    self.total_stablecoin -= _debt_value
+    total_stablecoin: uint256 = self.total_stablecoin
+    product: uint256 = self.product
+    epoch: uint256 = self.current_epoch
+    scale: uint256 = self.current_scale
+    # Calculate Collateral Gained Per Unit Of Stablecoin
+    collateral_per_unit: uint256 = _collateral_value * DECIMAL_PRECISION / total_stablecoin
+    # Calculate Stablecoins Lost Per Unit Of Stablecoin, Rounded Up So Deposits Never Exceed The Pool
+    loss_per_unit: uint256 = DECIMAL_PRECISION
+    if _debt_value < total_stablecoin:
+        loss_per_unit = (_debt_value * DECIMAL_PRECISION + total_stablecoin - 1) / total_stablecoin
+    # Update Running Sum Of Gained Collateral
+    self.epoch_to_scale_to_sum[epoch][scale] += collateral_per_unit * product
+    # If Pool Is Emptied, Then Start A New Epoch
+    if _debt_value == total_stablecoin:
+        self.current_epoch = epoch + 1
+        self.current_scale = 0
+        self.product = DECIMAL_PRECISION
+        self.total_stablecoin = 0
+    else:
+        # Update Running Product Of Remaining Stablecoins
+        product_factor: uint256 = DECIMAL_PRECISION - loss_per_unit
+        new_product: uint256 = product * product_factor / DECIMAL_PRECISION
+        # If Product Gets Too Small, Then Rescale It To Keep Precision
+        if new_product < SCALE_FACTOR:
+            new_product = product * product_factor * SCALE_FACTOR / DECIMAL_PRECISION
+            self.current_scale = scale + 1
+        # Near-Total Losses Can Round The Product To Zero, Keep It Positive So The Stablecoins Left Stay With Deposits
+        self.product = max(new_product, 1)
+        # Update Stablecoin Total
+        self.total_stablecoin -= _debt_value
+    log PoolAbsorbed(_debt_value, _collateral_value, self.total_stablecoin, self.product, self.current_epoch, self.current_scale)
     # Return Success
     return True
 
@@ -7,6 +7,7 @@
 interface Token:
     def balanceOf(_owner: address) -> uint256: view
     def mintTo(_to: address, _value: uint256) -> bool: nonpayable
+    def mintBatch(_recipients: DynArray[address, 100], _values: DynArray[uint256, 100]) -> bool: nonpayable
     def burnFrom(_from: address, _value: uint256) -> bool: nonpayable
 
 stablecoin: public(Token)
@@ -16,6 +17,9 @@ collateral_value: public(uint256)
 rewards: public(address)
 deployer: public(address)
 
+# Maximum number of recipients in mint_to_many, leaving room in the mint batch for the rewards fee
+MAX_RECIPIENTS: constant(uint256) = 99
+
 
 @external
 def __init__(_stablecoin_address: address):
@@ -36,8 +40,7 @@ def mint() -> bool:
     # If Fees Are Enabled
     if self.rewards != self:
         # Mint Stablecoins
-        self.stablecoin.mintTo(msg.sender, msg.value * 199 / 200)
-        self.stablecoin.mintTo(self.rewards, msg.value / 200)
+        self.stablecoin.mintBatch([msg.sender, self.rewards], [msg.value * 199 / 200, msg.value / 200])
     # If Fees Are Disabled
     else:
         # Mint Stablecoins
@@ -49,21 +52,89 @@ def mint() -> bool:
 
 
 @external
-def redeem(_value: uint256) -> bool:
+@payable
+def mint_to_many(_recipients: DynArray[address, MAX_RECIPIENTS], _values: DynArray[uint256, MAX_RECIPIENTS]) -> bool:
     """
-    @notice Redeems a quantity of ETH for a quantity of stablecoins
-    @param _value The amount of tokens to redeem
+    @notice Mints stablecoins to several addresses for the ETH sent, in a single mint
+    @dev The fee of every recipient is minted to rewards in one amount
+    @param _recipients The addresses to mint to
+    @param _values The amount of ETH converted for each address, which must add up to msg.value
     @return Success boolean
     """
+    # Initialize Variables
+    recipients: DynArray[address, 100] = []
+    values: DynArray[uint256, 100] = []
+    total_value: uint256 = 0
+    minted_value: uint256 = 0
+    fees_enabled: bool = self.rewards != self
+    # Run Checks
+    assert msg.value > 0
+    assert len(_recipients) == len(_values), "Length mismatch"
+    # Split Each Value Between Recipient And Rewards
+    for i in range(MAX_RECIPIENTS):
+        if i >= len(_recipients):
+            break
+        assert _values[i] > 0
+        value: uint256 = _values[i]
+        # If Fees Are Enabled
+        if fees_enabled:
+            value = value * 199 / 200
+        total_value += _values[i]
+        minted_value += value
+        recipients.append(_recipients[i])
+        values.append(value)
+    assert total_value == msg.value, "Value mismatch"
+    # If Fees Are Enabled, Then Mint Every Fee To Rewards At Once
+    if fees_enabled:
+        recipients.append(self.rewards)
+        values.append(msg.value - minted_value)
+    # Mint Stablecoins
+    self.stablecoin.mintBatch(recipients, values)
+    # Update Values
+    self.collateral_value += msg.value
+    # Return Success
+    return True
+
+
+@internal
+def _redeem(_receiver: address, _value: uint256):
+    """
+    @notice Redeems a quantity of ETH for a quantity of msg.sender's stablecoins
+    @param _receiver The address to send the ETH to
+    @param _value The amount of tokens to redeem
+    """
     # Run Checks
     assert _value > 0
     assert self.stablecoin.balanceOf(msg.sender) >= _value
     # Burn Stablecoins
     self.stablecoin.burnFrom(msg.sender, _value)
     # Send Equal Amount Of ETH
-    send(msg.sender, _value)
+    send(_receiver, _value)
     # Update Values
     self.collateral_value -= _value
+
+
+@external
+def redeem(_value: uint256) -> bool:
+    """
+    @notice Redeems a quantity of ETH for a quantity of stablecoins
+    @param _value The amount of tokens to redeem
+    @return Success boolean
+    """
+    self._redeem(msg.sender, _value)
+    # Return Success
+    return True
+
+
+@external
+def redeem_to(_receiver: address, _value: uint256) -> bool:
+    """
+    @notice Redeems a quantity of ETH for a quantity of msg.sender's stablecoins, sent to another address
+    @param _receiver The address to send the ETH to
+    @param _value The amount of tokens to redeem
+    @return Success boolean
+    """
+    self._redeem(_receiver, _value)
     # Return Success
     return True
 
@@ -4,6 +4,8 @@
 @title Mintable Token implementation
 @notice Based on the ERC-20 token standard as defined at
         https://eips.ethereum.org/EIPS/eip-20
+        with signed approvals as defined at
+        https://eips.ethereum.org/EIPS/eip-2612
 """
 
 from vyper.interfaces import ERC20
@@ -33,6 +35,20 @@ allowances: HashMap[address, HashMap[address, uint256]]
 deployer: public(address)
 wand: public(address)
 
+EIP712_TYPEHASH: constant(bytes32) = keccak256("EIP712Domain(string name,string version,uint256 chainId,address verifyingContract)")
+PERMIT_TYPEHASH: constant(bytes32) = keccak256("Permit(address owner,address spender,uint256 value,uint256 nonce,uint256 deadline)")
+VERSION: constant(String[8]) = "1"
+# Signatures with s above half the curve order are rejected, each signature then has a single valid form
+SECP256K1N_HALF: constant(uint256) = 57896044618658097711785492504343953926418782139537452191302581570759080747168
+
+# Domain separator for the chain id at deployment, recomputed if the chain id changes in a fork
+cached_chain_id: uint256
+cached_domain_separator: bytes32
+nonces: public(HashMap[address, uint256])
+
+# Maximum number of accounts in a single mintBatch call
+MAX_BATCH: constant(uint256) = 100
+
 
 @external
 def __init__(_name: String[64], _symbol: String[32], _decimals: uint256, _total_supply: uint256):
@@ -43,6 +59,10 @@ def __init__(_name: String[64], _symbol: String[32], _decimals: uint256, _total_
     self.totalSupply = _total_supply
     self.deployer = msg.sender
     self.wand = msg.sender
+    self.cached_chain_id = chain.id
+    self.cached_domain_separator = keccak256(
+        _abi_encode(EIP712_TYPEHASH, keccak256(_name), keccak256(VERSION), chain.id, self)
+    )
     log Transfer(ZERO_ADDRESS, msg.sender, _total_supply)
 
 
@@ -86,6 +106,63 @@ def approve(_spender : address, _value : uint256) -> bool:
     return True
 
 
+@view
+@internal
+def _domain_separator() -> bytes32:
+    """
+    @notice Returns the EIP-712 domain separator for the current chain id
+    @return The domain separator
+    """
+    if chain.id == self.cached_chain_id:
+        return self.cached_domain_separator
+    return keccak256(_abi_encode(EIP712_TYPEHASH, keccak256(self.name), keccak256(VERSION), chain.id, self))
+
+
+@view
+@external
+def DOMAIN_SEPARATOR() -> bytes32:
+    """
+    @notice Getter to check the EIP-712 domain separator that permit signatures are made against
+    @return The domain separator
+    """
+    return self._domain_separator()
+
+
+@external
+def permit(_owner: address, _spender: address, _value: uint256, _deadline: uint256, _v: uint8, _r: bytes32, _s: bytes32) -> bool:
+    """
+    @notice Approve an address to spend tokens on behalf of an owner who signed the approval
+    @dev The signature covers the owner's current nonce, so it can only be used once
+    @param _owner The address which owns the funds
+    @param _spender The address which will spend the funds
+    @param _value The amount of tokens to be spent
+    @param _deadline The timestamp after which the signature is no longer valid
+    @param _v The recovery id of the signature
+    @param _r The first half of the signature
+    @param _s The second half of the signature
+    @return Success boolean
+    """
+    # Run Checks
+    assert _owner != empty(address), "Invalid owner"
+    assert _deadline >= block.timestamp, "Permit expired"
+    assert convert(_s, uint256) <= SECP256K1N_HALF, "Invalid signature"
+    nonce: uint256 = self.nonces[_owner]
+    digest: bytes32 = keccak256(
+        concat(
+            b"\x19\x01",
+            self._domain_separator(),
+            keccak256(_abi_encode(PERMIT_TYPEHASH, _owner, _spender, _value, nonce, _deadline))
+        )
+    )
+    signer: address = ecrecover(digest, convert(_v, uint256), convert(_r, uint256), convert(_s, uint256))
+    assert signer == _owner, "Invalid signature"
+    # Update Values
+    self.nonces[_owner] = nonce + 1
+    self.allowances[_owner][_spender] = _value
+    log Approval(_owner, _spender, _value)
+    return True
+
+
 @internal
 def _transfer(_from: address, _to: address, _value: uint256):
     """
@@ -157,15 +234,44 @@ def burnFrom(_from: address, _value: uint256) -> bool:
     """
     # Run Checks
     assert self.wand == msg.sender
+    balance: uint256 = self.balances[_from]
+    assert balance >= _value, "Insufficient balance"
     # Update Values
     self.totalSupply -= _value
-    self.balances[_from] -= _value
+    self.balances[_from] = unsafe_sub(balance, _value)
     # Log Transfer
     log Transfer(_from, ZERO_ADDRESS, _value)
     # Return Success
     return True
 
 
+@external
+def mintBatch(_recipients: DynArray[address, MAX_BATCH], _values: DynArray[uint256, MAX_BATCH]) -> bool:
+    """
+    @notice Mint tokens to several addresses in a single call
+    @dev totalSupply is written once for the whole batch, a Transfer is still logged per recipient
+    @param _recipients The addresses to mint to
+    @param _values The amount of tokens to mint to each address
+    @return Success boolean
+    """
+    # Run Checks
+    assert self.wand == msg.sender
+    assert len(_recipients) == len(_values), "Length mismatch"
+    # Initialize Variables
+    total_value: uint256 = 0
+    # Mint To Each Recipient
+    for i in range(MAX_BATCH):
+        if i >= len(_recipients):
+            break
+        total_value += _values[i]
+        self.balances[_recipients[i]] += _values[i]
+        log Transfer(ZERO_ADDRESS, _recipients[i], _values[i])
+    # Update Values
+    self.totalSupply += total_value
+    # Return Success
+    return True
+
+
 @external
 def set_wand(_to: address):
     """
@@ -1,6 +1,9 @@
 # @version ^0.3.3
 
 price: public(int256)
+round_id: public(uint80)
+updated_at: public(uint256)
+answered_in_round: public(uint80)
 deployer: public(address)
 
 
@@ -36,10 +39,28 @@ def getRoundData(_roundId: uint80) -> (uint80, int256, uint256, uint256, uint80)
 @view
 @external
 def latestRoundData() -> (uint80, int256, uint256, uint256, uint80):
-    return (0, self.price, 0, 0, 0)
+    return (self.round_id, self.price, self.updated_at, self.updated_at, self.answered_in_round)
+
+
+@external
+def setDeployer(_deployer: address):
+    assert self.deployer == msg.sender
+    self.deployer = _deployer
 
 
 @external
 def setCurrentPrice(_price: int256):
     assert self.deployer == msg.sender
     self.price = _price
+    self.round_id += 1
+    self.updated_at = block.timestamp
+    self.answered_in_round = self.round_id
+
+
+@external
+def setRoundData(_round_id: uint80, _price: int256, _updated_at: uint256, _answered_in_round: uint80):
+    assert self.deployer == msg.sender
+    self.round_id = _round_id
+    self.price = _price
+    self.updated_at = _updated_at
+    self.answered_in_round = _answered_in_round
@@ -0,0 +1,74 @@
+# @version ^0.3.7
+
+"""
+@title Calls BorrowWand several times in one transaction, to test and measure the price cache
+"""
+
+interface BorrowWand:
+    def refresh_collateral_price() -> uint256: nonpayable
+    def open_loan(_collateral_value: uint256, _debt_value: uint256) -> bool: nonpayable
+    def borrow_stablecoin(_value: uint256) -> bool: nonpayable
+    def withdraw_collateral(_value: uint256) -> bool: nonpayable
+    def liquidate(_user: address) -> bool: nonpayable
+    def batch_liquidate(_users: DynArray[address, 100]) -> uint256: nonpayable
+    def liquidate_lowest(_count: uint256) -> uint256: nonpayable
+
+interface ERC20:
+    def approve(_spender: address, _value: uint256) -> bool: nonpayable
+
+interface PriceOracle:
+    def setCurrentPrice(_price: int256): nonpayable
+
+event PriceReads:
+    first_gas: uint256
+    second_gas: uint256
+
+
+@external
+def refresh_twice(_wand: address):
+    gas_start: uint256 = msg.gas
+    BorrowWand(_wand).refresh_collateral_price()
+    gas_middle: uint256 = msg.gas
+    BorrowWand(_wand).refresh_collateral_price()
+    log PriceReads(gas_start - gas_middle, gas_middle - msg.gas)
+
+
+@external
+def open_loan(_wand: address, _collateral: address, _collateral_value: uint256, _debt_value: uint256):
+    ERC20(_collateral).approve(_wand, _collateral_value)
+    BorrowWand(_wand).open_loan(_collateral_value, _debt_value)
+
+
+@external
+def refresh_update_and_borrow(_wand: address, _oracle: address, _price: int256, _value: uint256):
+    BorrowWand(_wand).refresh_collateral_price()
+    PriceOracle(_oracle).setCurrentPrice(_price)
+    BorrowWand(_wand).borrow_stablecoin(_value)
+
+
+@external
+def refresh_update_and_withdraw(_wand: address, _oracle: address, _price: int256, _value: uint256):
+    BorrowWand(_wand).refresh_collateral_price()
+    PriceOracle(_oracle).setCurrentPrice(_price)
+    BorrowWand(_wand).withdraw_collateral(_value)
+
+
+@external
+def refresh_update_and_liquidate(_wand: address, _oracle: address, _price: int256, _user: address):
+    BorrowWand(_wand).refresh_collateral_price()
+    PriceOracle(_oracle).setCurrentPrice(_price)
+    BorrowWand(_wand).liquidate(_user)
+
+
+@external
+def refresh_update_and_batch_liquidate(_wand: address, _oracle: address, _price: int256, _users: DynArray[address, 100]):
+    BorrowWand(_wand).refresh_collateral_price()
+    PriceOracle(_oracle).setCurrentPrice(_price)
+    BorrowWand(_wand).batch_liquidate(_users)
+
+
+@external
+def refresh_update_and_liquidate_lowest(_wand: address, _oracle: address, _price: int256, _count: uint256):
+    BorrowWand(_wand).refresh_collateral_price()
+    PriceOracle(_oracle).setCurrentPrice(_price)
+    BorrowWand(_wand).liquidate_lowest(_count)
@@ -0,0 +1,3 @@
+"""
+Off-chain services for the magic-eth contracts
+"""
@@ -0,0 +1,68 @@
+"""
+Compact contract artifacts for the off-chain services
+
+Each contract has a JSON file next to this module holding only its ABI,
+bytecode, deployed bytecode hash and method selectors, written by:
+
+    python -m magic_bank.artifacts.build
+
+The loader only uses the standard library, and reads each file on first use.
+"""
+
+import json
+from functools import lru_cache
+from pathlib import Path
+
+# Bumped whenever the layout of the artifact files changes
+FORMAT_VERSION = 1
+
+ARTIFACTS_PATH = Path(__file__).resolve().parent
+
+# Contract name and source file of every artifact in the bundle
+SOURCES = {
+    "Token": "contracts/Token.vy",
+    "SwapWand": "contracts/SwapWand.vy",
+    "BorrowWand": "contracts/BorrowWand.vy",
+    "StabilityPool": "contracts/StabilityPool.vy",
+    "AggregatorV3Interface": "interfaces/AggregatorV3Interface.vy",
+}
+
+
+def available(name):
+    """
+    Returns True when the bundle has a usable artifact for a contract
+    """
+    try:
+        load(name)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+@lru_cache(maxsize=None)
+def load(name):
+    """
+    Returns the artifact of a contract, reading it once per process
+    """
+    path = ARTIFACTS_PATH / f"{name}.json"
+    if not path.is_file():
+        raise FileNotFoundError(f"No compact artifact for {name}, run `python -m magic_bank.artifacts.build` first")
+    artifact = json.loads(path.read_text())
+    # An artifact in another format is as unusable as a missing one, so callers fall back the same way
+    if artifact.get("version") != FORMAT_VERSION:
+        raise FileNotFoundError(
+            f"{path.name} has artifact format {artifact.get('version')}, expected {FORMAT_VERSION}, "
+            "run `python -m magic_bank.artifacts.build` again"
+        )
+    return artifact
+
+
+def abi(name):
+    return load(name)["abi"]
+
+
+def selectors(name):
+    """
+    Returns the 4 byte selector of each method, keyed by signature
+    """
+    return load(name)["selectors"]
@@ -0,0 +1,94 @@
+"""
+Writes the compact artifact bundle of magic_bank.artifacts
+
+Compiles each contract in SOURCES with the installed vyper and keeps only what
+the services need, instead of the AST, source maps and sources in brownie's
+build folder:
+
+    python -m magic_bank.artifacts.build
+"""
+
+import argparse
+import hashlib
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from eth_utils import keccak
+
+from magic_bank.artifacts import ARTIFACTS_PATH, FORMAT_VERSION, SOURCES
+
+PROJECT_PATH = Path(__file__).resolve().parent.parent.parent
+
+# Matches the compiler settings of brownie's build artifacts
+EVM_VERSION = "istanbul"
+
+
+def vyper_version():
+    return subprocess.run(
+        [sys.executable, "-m", "vyper", "--version"], check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+def build_artifact(name, source_path, compiler):
+    """
+    Compiles a contract and returns its compact artifact
+    """
+    path = PROJECT_PATH / source_path
+    output = subprocess.run(
+        [
+            sys.executable, "-m", "vyper",
+            "-f", "abi,bytecode,bytecode_runtime,method_identifiers",
+            "--evm-version", EVM_VERSION,
+            "-p", str(PROJECT_PATH),
+            str(path),
+        ],
+        cwd=PROJECT_PATH, check=True, capture_output=True, text=True
+    ).stdout.splitlines()
+    abi, bytecode, bytecode_runtime, method_identifiers = output[0], output[1], output[2], output[3]
+    runtime = bytes.fromhex(bytecode_runtime.removeprefix("0x"))
+    return {
+        "version": FORMAT_VERSION,
+        "contractName": name,
+        "sourcePath": source_path,
+        "sha1": hashlib.sha1(path.read_bytes()).hexdigest(),
+        "compiler": {"version": compiler, "evm_version": EVM_VERSION},
+        "abi": json.loads(abi),
+        "bytecode": bytecode,
+        "deployedBytecodeHash": "0x" + keccak(runtime).hex().removeprefix("0x"),
+        "selectors": json.loads(method_identifiers),
+    }
+
+
+def build(out_path=ARTIFACTS_PATH, names=None):
+    """
+    Writes the artifact of each contract to out_path, returns the paths written
+    """
+    out_path = Path(out_path)
+    out_path.mkdir(parents=True, exist_ok=True)
+    compiler = vyper_version()
+    written = []
+    for name in names or SOURCES:
+        artifact = build_artifact(name, SOURCES[name], compiler)
+        path = out_path / f"{name}.json"
+        path.write_text(json.dumps(artifact, separators=(",", ":"), sort_keys=True))
+        written.append(path)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the compact contract artifacts")
+    parser.add_argument("--out", default=str(ARTIFACTS_PATH), help="folder to write the artifacts to")
+    parser.add_argument("names", nargs="*", help=f"contracts to build, from {', '.join(SOURCES)}, all by default")
+    args = parser.parse_args()
+    unknown = sorted(set(args.names) - set(SOURCES))
+    if unknown:
+        parser.error(f"unknown contracts: {', '.join(unknown)}")
+
+    for path in build(args.out, args.names):
+        print(f"{path} ({path.stat().st_size} bytes)")
+
+
+if __name__ == "__main__":
+    main()
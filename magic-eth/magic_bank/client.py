@@ -0,0 +1,465 @@
+"""
+Typed read client for BorrowWand, StabilityPool, SwapWand and Token
+
+Loans and deposits are read through the loans_of and deposits_of views, up to
+view_batch users per eth_call, and the calls are sent as JSON-RPC batches of
+up to batch_size requests. Reading the loans of a thousand users is two
+eth_calls in one round trip instead of a thousand. The HTTP transports keep a
+pool of keep-alive connections to the node, and every read has a sync and an
+asyncio form:
+
+    bank = MagicBank.connect(HttpTransport("http://127.0.0.1:8545"), wand_address)
+    loans = bank.loans(users)
+
+    bank = await AsyncMagicBank.connect(AsyncHttpTransport("http://127.0.0.1:8545"), wand_address)
+    loans = await bank.loans(users)
+
+Any other view, for instance on a SwapWand, can be read with contract_call
+and call_many. Benchmark batched reads against one loan_of call per request with:
+
+    python -m magic_bank.client --rpc http://127.0.0.1:8545 --wand <address> --users 1000
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Sequence
+
+import requests
+from requests.adapters import HTTPAdapter
+from eth_utils import keccak, to_checksum_address
+
+try:
+    from eth_abi import decode, encode
+except ImportError:
+    from eth_abi import decode_abi as decode, encode_abi as encode
+
+from magic_bank.contracts import abi_type, format_output, load_abi
+
+DEFAULT_BATCH_SIZE = 100
+# Users per loans_of and deposits_of call, the most those views accept
+MAX_VIEW_BATCH = 500
+
+
+class RpcError(Exception):
+    """
+    Raised when the node answers a request with a JSON-RPC error
+    """
+
+    def __init__(self, message, code=None, call=None):
+        super().__init__(message)
+        self.code = code
+        self.call = call
+
+
+# Results
+
+
+@dataclass(frozen=True)
+class Loan:
+    collateral_value: int
+    debt_value: int
+    active: bool
+
+
+@dataclass(frozen=True)
+class Deposit:
+    active: bool
+    stablecoin_value: int
+    compounded_stablecoin: int
+    collateral_gain: int
+
+
+@dataclass(frozen=True)
+class RoundData:
+    round_id: int
+    price: int
+    started_at: int
+    updated_at: int
+    answered_in_round: int
+
+
+# Calls
+
+
+@lru_cache(maxsize=None)
+def functions(name: str) -> Dict[str, dict]:
+    """
+    Returns the function ABI items of a contract, keyed by name
+    """
+    return {i["name"]: i for i in load_abi(name) if i["type"] == "function"}
+
+
+@dataclass(frozen=True)
+class Call:
+    """
+    One eth_call of a contract function
+    """
+
+    to: str
+    item: dict
+    args: tuple = ()
+
+    @property
+    def name(self) -> str:
+        return self.item["name"]
+
+    def data(self) -> str:
+        input_types = [abi_type(i) for i in self.item["inputs"]]
+        selector = keccak(text=f"{self.name}({','.join(input_types)})")[:4]
+        return "0x" + (selector + encode(input_types, list(self.args))).hex()
+
+    def decode(self, result: str) -> Any:
+        """
+        Decodes the return data, a function with one output returns it bare
+        """
+        outputs = self.item["outputs"]
+        values = decode([abi_type(i) for i in outputs], bytes.fromhex(result.removeprefix("0x")))
+        values = tuple(format_output(i, v) for i, v in zip(outputs, values))
+        return values[0] if len(values) == 1 else values
+
+
+def contract_call(contract: str, address: str, function: str, *args: Any) -> Call:
+    """
+    Returns a Call of a function of the named contract ABI at an address
+    """
+    return Call(to_checksum_address(address), functions(contract)[function], args)
+
+
+def batch_payloads(calls: Sequence[Call], block: str, batch_size: int) -> List[List[dict]]:
+    """
+    Returns the JSON-RPC batches of eth_call requests for calls, the request id is the call index
+    """
+    items = [
+        {"jsonrpc": "2.0", "id": i, "method": "eth_call", "params": [{"to": call.to, "data": call.data()}, block]}
+        for i, call in enumerate(calls)
+    ]
+    return [items[i : i + batch_size] for i in range(0, len(items), batch_size)]
+
+
+def decode_responses(calls: Sequence[Call], responses: Sequence[dict]) -> List[Any]:
+    """
+    Returns the decoded results in call order, nodes may answer a batch in any order
+    """
+    by_id = {response["id"]: response for response in responses}
+    results = []
+    for i, call in enumerate(calls):
+        response = by_id.get(i)
+        if response is None:
+            raise RpcError(f"No response for {call.name}", call=call)
+        if "error" in response:
+            error = response["error"]
+            raise RpcError(f"{call.name}: {error.get('message')}", error.get("code"), call)
+        results.append(call.decode(response["result"]))
+    return results
+
+
+def _as_list(response: Any) -> List[dict]:
+    # A node that rejects a whole batch answers with a single error object
+    if isinstance(response, dict):
+        error = response.get("error", {})
+        raise RpcError(f"Batch rejected: {error.get('message')}", error.get("code"))
+    return response
+
+
+# Transports
+
+
+class HttpTransport:
+    """
+    Posts JSON-RPC payloads over a pool of keep-alive connections
+    """
+
+    def __init__(self, url: str, pool_size: int = 10, timeout: float = 30):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def send(self, payload: Any) -> Any:
+        response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class AsyncHttpTransport:
+    """
+    Posts JSON-RPC payloads with aiohttp over a pool of keep-alive connections
+    """
+
+    def __init__(self, url: str, pool_size: int = 10, timeout: float = 30):
+        self.url = url
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._session = None
+
+    async def send(self, payload: Any) -> Any:
+        if self._session is None:
+            # aiohttp comes with web3, only the async client needs it
+            import aiohttp
+
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        async with self._session.post(self.url, json=payload) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+# Clients
+
+
+class RpcClient:
+    """
+    Sends Calls as JSON-RPC batches of at most batch_size requests
+    """
+
+    def __init__(self, transport: HttpTransport, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.transport = transport
+        self.batch_size = batch_size
+
+    def call_many(self, calls: Sequence[Call], block: str = "latest") -> List[Any]:
+        responses = []
+        for payload in batch_payloads(calls, block, self.batch_size):
+            responses.extend(_as_list(self.transport.send(payload)))
+        return decode_responses(calls, responses)
+
+    def call(self, call: Call, block: str = "latest") -> Any:
+        return self.call_many([call], block)[0]
+
+
+class AsyncRpcClient:
+    """
+    Sends Calls as JSON-RPC batches, with up to max_concurrency batches in flight
+    """
+
+    def __init__(self, transport: AsyncHttpTransport, batch_size: int = DEFAULT_BATCH_SIZE, max_concurrency: int = 4):
+        self.transport = transport
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+
+    async def call_many(self, calls: Sequence[Call], block: str = "latest") -> List[Any]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def send(payload):
+            async with semaphore:
+                return _as_list(await self.transport.send(payload))
+
+        batches = await asyncio.gather(*(send(p) for p in batch_payloads(calls, block, self.batch_size)))
+        return decode_responses(calls, list(itertools.chain.from_iterable(batches)))
+
+    async def call(self, call: Call, block: str = "latest") -> Any:
+        return (await self.call_many([call], block))[0]
+
+
+class _Bank:
+    """
+    Builds the Calls of the MagicBank reads, the sync and async clients send them
+    """
+
+    ADDRESS_FUNCTIONS = ("stability_pool_address", "stablecoin", "collateral", "collateral_price_feed")
+
+    def __init__(
+        self,
+        rpc,
+        wand: str,
+        stability_pool: str,
+        stablecoin: str,
+        collateral: str,
+        price_feed: str,
+        view_batch: int = MAX_VIEW_BATCH,
+    ):
+        self.rpc = rpc
+        self.wand = to_checksum_address(wand)
+        self.stability_pool = to_checksum_address(stability_pool)
+        self.stablecoin = to_checksum_address(stablecoin)
+        self.collateral = to_checksum_address(collateral)
+        self.price_feed = to_checksum_address(price_feed)
+        self.view_batch = view_batch
+
+    @classmethod
+    def address_calls(cls, wand: str) -> List[Call]:
+        return [contract_call("BorrowWand", wand, name) for name in cls.ADDRESS_FUNCTIONS]
+
+    def chunks(self, users: Sequence[str]) -> List[List[str]]:
+        users = [to_checksum_address(str(user)) for user in users]
+        return [users[i : i + self.view_batch] for i in range(0, len(users), self.view_batch)]
+
+    def loan_calls(self, users: Sequence[str]) -> List[Call]:
+        return [contract_call("BorrowWand", self.wand, "loans_of", chunk) for chunk in self.chunks(users)]
+
+    def deposit_calls(self, depositers: Sequence[str]) -> List[Call]:
+        return [contract_call("StabilityPool", self.stability_pool, "deposits_of", chunk) for chunk in self.chunks(depositers)]
+
+    def balance_calls(self, token: str, owners: Sequence[str]) -> List[Call]:
+        return [contract_call("Token", token, "balanceOf", to_checksum_address(str(owner))) for owner in owners]
+
+    def round_call(self) -> Call:
+        return contract_call("AggregatorV3Interface", self.price_feed, "latestRoundData")
+
+    @staticmethod
+    def to_loans(results: Sequence[Any]) -> List[Loan]:
+        return [Loan(*i) for i in itertools.chain.from_iterable(results)]
+
+    @staticmethod
+    def to_deposits(results: Sequence[Any]) -> List[Deposit]:
+        return [Deposit(*i) for i in itertools.chain.from_iterable(results)]
+
+
+class MagicBank(_Bank):
+    """
+    Sync reads of a BorrowWand and the contracts it uses
+    """
+
+    @classmethod
+    def connect(
+        cls, transport: HttpTransport, wand: str, batch_size: int = DEFAULT_BATCH_SIZE, view_batch: int = MAX_VIEW_BATCH
+    ) -> "MagicBank":
+        """
+        Reads the addresses the BorrowWand uses in one batch and returns a client for them
+        """
+        rpc = RpcClient(transport, batch_size)
+        return cls(rpc, wand, *rpc.call_many(cls.address_calls(wand)), view_batch=view_batch)
+
+    def call_many(self, calls: Sequence[Call], block: str = "latest") -> List[Any]:
+        return self.rpc.call_many(calls, block)
+
+    def loans(self, users: Sequence[str], block: str = "latest") -> List[Loan]:
+        return self.to_loans(self.rpc.call_many(self.loan_calls(users), block))
+
+    def deposits(self, depositers: Sequence[str], block: str = "latest") -> List[Deposit]:
+        return self.to_deposits(self.rpc.call_many(self.deposit_calls(depositers), block))
+
+    def stablecoin_balances(self, owners: Sequence[str], block: str = "latest") -> List[int]:
+        return self.rpc.call_many(self.balance_calls(self.stablecoin, owners), block)
+
+    def collateral_balances(self, owners: Sequence[str], block: str = "latest") -> List[int]:
+        return self.rpc.call_many(self.balance_calls(self.collateral, owners), block)
+
+    def latest_round(self, block: str = "latest") -> RoundData:
+        return RoundData(*self.rpc.call(self.round_call(), block))
+
+
+class AsyncMagicBank(_Bank):
+    """
+    Asyncio reads of a BorrowWand and the contracts it uses
+    """
+
+    @classmethod
+    async def connect(
+        cls,
+        transport: AsyncHttpTransport,
+        wand: str,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_concurrency: int = 4,
+        view_batch: int = MAX_VIEW_BATCH,
+    ) -> "AsyncMagicBank":
+        """
+        Reads the addresses the BorrowWand uses in one batch and returns a client for them
+        """
+        rpc = AsyncRpcClient(transport, batch_size, max_concurrency)
+        return cls(rpc, wand, *await rpc.call_many(cls.address_calls(wand)), view_batch=view_batch)
+
+    async def call_many(self, calls: Sequence[Call], block: str = "latest") -> List[Any]:
+        return await self.rpc.call_many(calls, block)
+
+    async def loans(self, users: Sequence[str], block: str = "latest") -> List[Loan]:
+        return self.to_loans(await self.rpc.call_many(self.loan_calls(users), block))
+
+    async def deposits(self, depositers: Sequence[str], block: str = "latest") -> List[Deposit]:
+        return self.to_deposits(await self.rpc.call_many(self.deposit_calls(depositers), block))
+
+    async def stablecoin_balances(self, owners: Sequence[str], block: str = "latest") -> List[int]:
+        return await self.rpc.call_many(self.balance_calls(self.stablecoin, owners), block)
+
+    async def collateral_balances(self, owners: Sequence[str], block: str = "latest") -> List[int]:
+        return await self.rpc.call_many(self.balance_calls(self.collateral, owners), block)
+
+    async def latest_round(self, block: str = "latest") -> RoundData:
+        return RoundData(*await self.rpc.call(self.round_call(), block))
+
+
+# Benchmark
+
+
+def throughput(read: Callable[[], Any], reads: int, repeat: int = 3) -> float:
+    """
+    Returns the best reads per second of repeat runs of read
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        read()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return reads / best
+
+
+def benchmark(
+    url: str, wand: str, users: Sequence[str], batch_size: int = DEFAULT_BATCH_SIZE, max_concurrency: int = 4
+) -> Dict[str, float]:
+    """
+    Returns the loans read per second on a node, with one loan_of call per request against batched
+    """
+    transport = HttpTransport(url, pool_size=max_concurrency)
+    bank = MagicBank.connect(transport, wand, batch_size)
+    calls = [contract_call("BorrowWand", wand, "loan_of", user) for user in users]
+
+    def single():
+        for call in calls:
+            bank.rpc.call(call)
+
+    results = {
+        "single": throughput(single, len(users)),
+        "batched": throughput(lambda: bank.loans(users), len(users)),
+    }
+    transport.close()
+
+    async def run_async():
+        async_transport = AsyncHttpTransport(url, pool_size=max_concurrency)
+        # Smaller views so the async client has several calls to send concurrently
+        view_batch = max(1, len(users) // max_concurrency)
+        async_bank = await AsyncMagicBank.connect(async_transport, wand, 1, max_concurrency, view_batch)
+        start = time.perf_counter()
+        await async_bank.loans(users)
+        elapsed = time.perf_counter() - start
+        await async_transport.close()
+        return len(users) / elapsed
+
+    results["async"] = max(asyncio.run(run_async()) for _ in range(3))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched MagicBank reads against a node")
+    parser.add_argument("--rpc", default="http://127.0.0.1:8545")
+    parser.add_argument("--wand", required=True, help="BorrowWand address")
+    parser.add_argument("--users", type=int, default=1000, help="Number of loans to read")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--max-concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    # Random users have empty loans, which cost the node the same to read
+    users = [to_checksum_address(os.urandom(20)) for _ in range(args.users)]
+    results = benchmark(args.rpc, args.wand, users, args.batch_size, args.max_concurrency)
+    for mode, loans_per_second in results.items():
+        print(f"{mode:>8}: {loans_per_second:10.0f} loans/s ({loans_per_second / results['single']:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+ABI loading and log decoding shared by the off-chain services
+"""
+
+import hashlib
+import json
+from functools import lru_cache
+from pathlib import Path
+
+from eth_utils import keccak, to_checksum_address
+
+try:
+    from eth_abi import decode
+except ImportError:
+    from eth_abi import decode_abi as decode
+
+from magic_bank import artifacts
+
+PROJECT_PATH = Path(__file__).resolve().parent.parent
+BUILD_PATH = PROJECT_PATH / "build"
+
+
+def is_current(artifact):
+    """
+    Returns True when an artifact was compiled from the current contract source
+    """
+    source = PROJECT_PATH / artifact.get("sourcePath", "")
+    return source.is_file() and hashlib.sha1(source.read_bytes()).hexdigest() == artifact.get("sha1")
+
+
+@lru_cache(maxsize=None)
+def load_abi(name):
+    """
+    Returns the ABI of a contract or interface, from the compact artifacts when they match the source
+    """
+    if artifacts.available(name):
+        compact = artifacts.load(name)
+        # Without the contract sources, as when installed, the compact artifacts are all there is
+        if is_current(compact) or not (PROJECT_PATH / compact["sourcePath"]).is_file():
+            return compact["abi"]
+    # Brownie artifacts are preferred, the test backend's are used when they match the source and brownie's do not
+    paths = [BUILD_PATH / folder / f"{name}.json" for folder in ("contracts", "pyevm", "interfaces")]
+    found = [json.loads(path.read_text()) for path in paths if path.exists()]
+    if not found:
+        raise FileNotFoundError(f"No build artifact for {name}, run `brownie compile` first")
+    return next((i for i in found if is_current(i)), found[0])["abi"]
+
+
+def abi_type(item):
+    if item["type"].startswith("tuple"):
+        inner = ",".join(abi_type(i) for i in item["components"])
+        return f"({inner}){item['type'][5:]}"
+    return item["type"]
+
+
+def to_hex(value):
+    if isinstance(value, str):
+        return value.lower() if value.startswith("0x") else "0x" + value.lower()
+    return "0x" + bytes(value).hex()
+
+
+def event_topic(item):
+    """
+    Returns the topic of an event ABI item as a hex string
+    """
+    signature = f"{item['name']}({','.join(abi_type(i) for i in item['inputs'])})"
+    return "0x" + keccak(text=signature).hex().removeprefix("0x")
+
+
+def event_topics(abi):
+    """
+    Returns the event ABI items of a contract, keyed by topic
+    """
+    return {event_topic(i): i for i in abi if i["type"] == "event"}
+
+
+def format_output(item, value, struct=lambda values, names: tuple(values), number=int):
+    """
+    Formats a decoded ABI value, with checksum addresses and 0x hex bytes
+
+    Arrays and structs are formatted member by member, struct and number build
+    the struct and integer values, so callers can return their own types.
+    """
+    abi_type = item["type"]
+    if abi_type.endswith("]"):
+        inner = dict(item, type=abi_type[: abi_type.rindex("[")])
+        return [format_output(inner, i, struct, number) for i in value]
+    if abi_type == "tuple":
+        components = item["components"]
+        values = [format_output(i, v, struct, number) for i, v in zip(components, value)]
+        return struct(values, [i["name"] for i in components])
+    if abi_type.startswith(("uint", "int")):
+        return number(value)
+    if abi_type == "address":
+        return to_checksum_address(value)
+    if isinstance(value, bytes):
+        return "0x" + value.hex()
+    return value
+
+
+def decode_log(item, log, struct=lambda values, names: tuple(values), number=int):
+    """
+    Decodes a raw log into a dict of event arguments, formatted as by format_output
+    """
+    indexed = [i for i in item["inputs"] if i["indexed"]]
+    plain = [i for i in item["inputs"] if not i["indexed"]]
+    data = bytes.fromhex(to_hex(log["data"])[2:])
+    values = dict(zip([i["name"] for i in plain], decode([abi_type(i) for i in plain], data)))
+    for i, topic in zip(indexed, log["topics"][1:]):
+        values[i["name"]] = decode([abi_type(i)], bytes.fromhex(to_hex(topic)[2:]))[0]
+    return {i["name"]: format_output(i, values[i["name"]], struct, number) for i in item["inputs"]}
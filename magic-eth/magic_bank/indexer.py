@@ -0,0 +1,417 @@
+"""
+Event indexer for Token, BorrowWand and StabilityPool
+
+The indexer streams eth_getLogs over adaptive block ranges and writes loan,
+deposit and transfer history to an append-only SQLite store, along with the
+current open loans and a checkpoint so a restart resumes where it stopped.
+Each chunk is written in one SQLite transaction together with its checkpoint.
+
+The indexer stays `confirmations` blocks behind the head. Every checkpoint
+keeps the hash of its block, when a stored hash is no longer on the chain the
+store is rewound to the newest checkpoint that still is and indexed again.
+
+Token amounts are stored as exact decimal text, the risk queries cast them to
+REAL, which is plenty for dashboards.
+
+Run it against a node with:
+
+    python -m magic_bank.indexer --rpc http://127.0.0.1:8545 --wand <address> --db magic_bank.sqlite
+"""
+
+import argparse
+import logging
+import sqlite3
+import time
+
+from web3 import Web3
+
+from magic_bank.contracts import decode_log, event_topics, load_abi, to_hex
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    block INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS loan_events (
+    block INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    tx_hash TEXT NOT NULL,
+    event TEXT NOT NULL,
+    user TEXT NOT NULL,
+    value TEXT,
+    collateral_value TEXT NOT NULL,
+    debt_value TEXT NOT NULL,
+    liquidator TEXT,
+    collateral_price TEXT,
+    PRIMARY KEY (block, log_index)
+);
+CREATE TABLE IF NOT EXISTS deposit_events (
+    block INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    tx_hash TEXT NOT NULL,
+    event TEXT NOT NULL,
+    depositer TEXT,
+    stablecoin_value TEXT,
+    collateral_value TEXT,
+    debt_value TEXT,
+    total_stablecoin TEXT NOT NULL,
+    product TEXT,
+    epoch INTEGER,
+    scale INTEGER,
+    PRIMARY KEY (block, log_index)
+);
+CREATE TABLE IF NOT EXISTS transfers (
+    block INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    tx_hash TEXT NOT NULL,
+    token TEXT NOT NULL,
+    sender TEXT NOT NULL,
+    receiver TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (block, log_index)
+);
+CREATE TABLE IF NOT EXISTS loans (
+    user TEXT PRIMARY KEY,
+    collateral_value TEXT NOT NULL,
+    debt_value TEXT NOT NULL,
+    block INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pool_history (
+    block INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    total_stablecoin TEXT NOT NULL,
+    total_debt TEXT NOT NULL,
+    PRIMARY KEY (block, log_index)
+);
+CREATE INDEX IF NOT EXISTS loan_events_user ON loan_events (user);
+CREATE INDEX IF NOT EXISTS deposit_events_depositer ON deposit_events (depositer);
+"""
+
+# Events that end a loan, every other loan event carries the loan values after the call
+CLOSING_EVENTS = ("LoanClosed", "Liquidated")
+
+# Checkpoints kept to find where a reorg forked, a deeper reorg indexes from the start block again
+CHECKPOINT_HISTORY = 128
+
+# Tables holding one row per log
+EVENT_TABLES = ("loan_events", "deposit_events", "transfers", "pool_history")
+
+
+class Indexer:
+    """
+    Streams the events of one BorrowWand system into a SQLite store
+    """
+
+    def __init__(
+        self,
+        web3,
+        wand_address,
+        path,
+        start_block=0,
+        chunk_size=1000,
+        max_chunk_size=100000,
+        target_logs=2000,
+        confirmations=0,
+    ):
+        self.web3 = web3
+        self.start_block = start_block
+        self.confirmations = confirmations
+        self.chunk_size = chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.target_logs = target_logs
+
+        wand_abi = load_abi("BorrowWand")
+        wand = web3.eth.contract(address=wand_address, abi=wand_abi)
+        self.addresses = {
+            "BorrowWand": wand.address,
+            "StabilityPool": wand.functions.stability_pool().call(),
+            "stablecoin": wand.functions.stablecoin().call(),
+            "collateral": wand.functions.collateral().call(),
+        }
+        self.tokens = {self.addresses["stablecoin"]: "stablecoin", self.addresses["collateral"]: "collateral"}
+        self.events = {
+            "BorrowWand": event_topics(wand_abi),
+            "StabilityPool": event_topics(load_abi("StabilityPool")),
+            "Token": event_topics(load_abi("Token")),
+        }
+        # Token Approvals Are Not Indexed
+        self.topics = [
+            topic for name, items in self.events.items() for topic, item in items.items()
+            if name != "Token" or item["name"] == "Transfer"
+        ]
+
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+        with self.db:
+            self.migrate_checkpoint()
+        checkpoint = self.db.execute("SELECT MAX(block) FROM checkpoints").fetchone()[0]
+        self.next_block = checkpoint + 1 if checkpoint is not None else start_block
+        self.load_totals()
+
+    def migrate_checkpoint(self):
+        # Stores Written Before Block Hashes Were Kept Trust Their Checkpoint Once
+        if self.db.execute("SELECT 1 FROM sqlite_master WHERE name = 'checkpoint'").fetchone():
+            for (block,) in self.db.execute("SELECT block FROM checkpoint").fetchall():
+                self.db.execute("INSERT INTO checkpoints VALUES (?, ?)", (block, self.block_hash(block)))
+            self.db.execute("DROP TABLE checkpoint")
+
+    def load_totals(self):
+        # Running Totals Are Rebuilt From The Store On Restart
+        self.total_debt = sum(int(d) for (d,) in self.db.execute("SELECT debt_value FROM loans"))
+        row = self.db.execute("SELECT total_stablecoin FROM pool_history ORDER BY block DESC, log_index DESC LIMIT 1").fetchone()
+        self.total_stablecoin = int(row[0]) if row else 0
+
+    def close(self):
+        self.db.close()
+
+    # Streaming
+
+    def get_logs(self, from_block, to_block):
+        return self.web3.eth.get_logs(
+            {"fromBlock": from_block, "toBlock": to_block, "address": list(self.addresses.values()), "topics": [self.topics]}
+        )
+
+    def stream_logs(self, to_block):
+        """
+        Yields (from_block, to_block, logs) chunks up to a block
+
+        A failed request halves the range and is retried, the range then grows
+        or shrinks so each request returns around target_logs logs, without
+        growing back to a range that failed.
+        """
+        while self.next_block <= to_block:
+            end = min(self.next_block + self.chunk_size - 1, to_block)
+            try:
+                logs = self.get_logs(self.next_block, end)
+            except Exception as exc:
+                if self.chunk_size == 1:
+                    raise
+                # Never Grow Back To A Range The Node Rejected
+                self.max_chunk_size = self.chunk_size - 1
+                self.chunk_size = max(self.chunk_size // 2, 1)
+                log.info("eth_getLogs failed (%s), retrying with %s blocks", exc, self.chunk_size)
+                continue
+            yield self.next_block, end, logs
+            self.next_block = end + 1
+            if len(logs) > self.target_logs:
+                self.chunk_size = max(self.chunk_size // 2, 1)
+            elif len(logs) < self.target_logs // 4:
+                self.chunk_size = min(self.chunk_size * 2, self.max_chunk_size)
+
+    def sync(self, to_block=None):
+        """
+        Indexes every block up to to_block, or the latest confirmed block, returns the number of logs written
+        """
+        head = self.web3.eth.block_number
+        self.check_reorg(head)
+        if to_block is None:
+            to_block = head - self.confirmations
+        written = 0
+        for _, end, logs in self.stream_logs(to_block):
+            with self.db:
+                for entry in sorted(logs, key=lambda e: (e["blockNumber"], e["logIndex"])):
+                    self.write_log(entry)
+                self.write_checkpoint(end)
+            written += len(logs)
+        return written
+
+    # Reorgs
+
+    def block_hash(self, block):
+        return to_hex(self.web3.eth.get_block(block)["hash"])
+
+    def write_checkpoint(self, block):
+        self.db.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?)", (block, self.block_hash(block)))
+        self.db.execute(
+            "DELETE FROM checkpoints WHERE block NOT IN (SELECT block FROM checkpoints ORDER BY block DESC LIMIT ?)",
+            (CHECKPOINT_HISTORY,),
+        )
+
+    def check_reorg(self, head):
+        """
+        Rewinds the store to the newest checkpoint still on the chain, returns the block it rewound to or None
+        """
+        fork = self.start_block - 1
+        for block, block_hash in self.db.execute("SELECT block, hash FROM checkpoints ORDER BY block DESC").fetchall():
+            # A Chain Shorter Than The Checkpoint Has Dropped It
+            if block <= head and self.block_hash(block) == block_hash:
+                fork = block
+                break
+        if fork == self.next_block - 1:
+            return None
+        log.warning("reorg below block %s, rewinding to block %s", self.next_block - 1, fork)
+        with self.db:
+            self.rewind(fork)
+        return fork
+
+    def rewind(self, block):
+        """
+        Deletes everything indexed after a block and rebuilds the open loans from the remaining events
+        """
+        for table in EVENT_TABLES:
+            self.db.execute(f"DELETE FROM {table} WHERE block > ?", (block,))
+        self.db.execute("DELETE FROM checkpoints WHERE block > ?", (block,))
+        # The Last Event Of Each User Holds Its Loan Values
+        self.db.execute("DELETE FROM loans")
+        self.db.execute(
+            f"""
+            INSERT INTO loans
+            SELECT user, collateral_value, debt_value, block FROM loan_events AS e
+            WHERE (block, log_index) = (
+                SELECT block, log_index FROM loan_events WHERE user = e.user ORDER BY block DESC, log_index DESC LIMIT 1
+            )
+            AND event NOT IN ({", ".join("?" for _ in CLOSING_EVENTS)})
+            """,
+            CLOSING_EVENTS,
+        )
+        self.next_block = block + 1
+        self.load_totals()
+
+    def run(self, poll_interval=2.0):
+        while True:
+            written = self.sync()
+            if written:
+                log.info("indexed %s logs up to block %s", written, self.next_block - 1)
+            time.sleep(poll_interval)
+
+    # Decoding
+
+    def write_log(self, entry):
+        address = entry["address"]
+        topic = to_hex(entry["topics"][0])
+        position = (entry["blockNumber"], entry["logIndex"], to_hex(entry["transactionHash"]))
+        if address in self.tokens:
+            item = self.events["Token"][topic]
+            self.write_transfer(position, self.tokens[address], decode_log(item, entry))
+        elif address == self.addresses["BorrowWand"]:
+            item = self.events["BorrowWand"][topic]
+            self.write_loan_event(position, item["name"], decode_log(item, entry))
+        elif address == self.addresses["StabilityPool"]:
+            item = self.events["StabilityPool"][topic]
+            self.write_deposit_event(position, item["name"], decode_log(item, entry))
+
+    def write_transfer(self, position, token, event):
+        self.db.execute(
+            "INSERT INTO transfers VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (*position, token, event["sender"], event["receiver"], str(event["value"])),
+        )
+
+    def write_loan_event(self, position, name, event):
+        user = event["user"]
+        self.db.execute(
+            "INSERT INTO loan_events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                *position,
+                name,
+                user,
+                str(event["value"]) if "value" in event else None,
+                str(event["collateral_value"]),
+                str(event["debt_value"]),
+                event.get("liquidator"),
+                str(event["collateral_price"]) if "collateral_price" in event else None,
+            ),
+        )
+        # Update Open Loans And Total Debt
+        row = self.db.execute("SELECT debt_value FROM loans WHERE user = ?", (user,)).fetchone()
+        self.total_debt -= int(row[0]) if row else 0
+        if name in CLOSING_EVENTS:
+            self.db.execute("DELETE FROM loans WHERE user = ?", (user,))
+        else:
+            self.db.execute(
+                "INSERT OR REPLACE INTO loans VALUES (?, ?, ?, ?)",
+                (user, str(event["collateral_value"]), str(event["debt_value"]), position[0]),
+            )
+            self.total_debt += event["debt_value"]
+        self.write_pool_history(position)
+
+    def write_deposit_event(self, position, name, event):
+        self.db.execute(
+            "INSERT INTO deposit_events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                *position,
+                name,
+                event.get("depositer"),
+                str(event["stablecoin_value"]) if "stablecoin_value" in event else None,
+                str(event["collateral_value"]) if "collateral_value" in event else None,
+                str(event["debt_value"]) if "debt_value" in event else None,
+                str(event["total_stablecoin"]),
+                str(event["product"]) if "product" in event else None,
+                event.get("epoch"),
+                event.get("scale"),
+            ),
+        )
+        self.total_stablecoin = event["total_stablecoin"]
+        self.write_pool_history(position)
+
+    def write_pool_history(self, position):
+        self.db.execute(
+            "INSERT INTO pool_history VALUES (?, ?, ?, ?)",
+            (position[0], position[1], str(self.total_stablecoin), str(self.total_debt)),
+        )
+
+
+# Risk Queries
+
+
+def debt_by_ratio_bucket(db, collateral_price, bucket_width=0.1):
+    """
+    Returns (lowest ratio, total debt, loans) per collateral ratio bucket of open loans
+
+    The ratio is the USD value of the collateral at collateral_price over the debt.
+    """
+    rows = db.execute(
+        """
+        SELECT CAST(CAST(collateral_value AS REAL) * ? / 1e18 / CAST(debt_value AS REAL) / ? AS INTEGER) AS bucket,
+               SUM(CAST(debt_value AS REAL)), COUNT(*)
+        FROM loans
+        GROUP BY bucket
+        ORDER BY bucket
+        """,
+        (float(collateral_price), bucket_width),
+    )
+    return [(bucket * bucket_width, debt, count) for bucket, debt, count in rows]
+
+
+def pool_utilisation(db):
+    """
+    Returns (block, total stablecoin, total debt, utilisation) at the end of every indexed block
+
+    Utilisation is the outstanding debt over the stablecoins in the stability
+    pool, above 1 the pool can no longer absorb every loan.
+    """
+    rows = db.execute(
+        """
+        SELECT block, CAST(total_stablecoin AS REAL), CAST(total_debt AS REAL)
+        FROM pool_history
+        WHERE (block, log_index) IN (SELECT block, MAX(log_index) FROM pool_history GROUP BY block)
+        ORDER BY block
+        """
+    )
+    return [(block, pool, debt, debt / pool if pool else None) for block, pool, debt in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index BorrowWand and StabilityPool events into SQLite")
+    parser.add_argument("--rpc", default="http://127.0.0.1:8545")
+    parser.add_argument("--wand", required=True, help="BorrowWand address")
+    parser.add_argument("--db", default="magic_bank.sqlite")
+    parser.add_argument("--start-block", type=int, default=0)
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    parser.add_argument("--confirmations", type=int, default=12, help="blocks to stay behind the head")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    indexer = Indexer(
+        Web3(Web3.HTTPProvider(args.rpc)),
+        args.wand,
+        args.db,
+        start_block=args.start_block,
+        confirmations=args.confirmations,
+    )
+    indexer.run(args.poll_interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""
+Liquidation keeper for BorrowWand
+
+The keeper keeps an in-memory book of open loans built from BorrowWand events,
+recomputes loan health with the same integer math as BorrowWand each time it
+polls the oracle, and submits liquidate transactions through an
+asyncio pipeline with bounded concurrency and local nonce management.
+
+Run it against a node with:
+
+    python -m magic_bank.keeper --rpc http://127.0.0.1:8545 --wand <address> --account <address>
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+
+from eth_utils import to_checksum_address
+from web3 import Web3
+
+from magic_bank.contracts import decode_log, event_topics, load_abi, to_hex
+
+log = logging.getLogger(__name__)
+
+# Events that end a loan, every other loan event carries the loan values after the call
+CLOSING_EVENTS = ("LoanClosed", "Liquidated")
+
+
+def get_lq_price(collateral_value, debt_value, collateral_price):
+    """
+    Mirrors BorrowWand.get_lq_price, returns None where the contract would revert
+    """
+    if debt_value == 0:
+        return None
+    # Compute USD Value of Collateral
+    collateral_usd_value = collateral_value * collateral_price // 10 ** 18
+    # Compute Collaterization ratio
+    collat_ratio = 10 ** 18 * collateral_usd_value // debt_value
+    if collat_ratio == 0:
+        return 2 ** 256 - 1
+    # Return Liquidate Price
+    return 10 ** 18 * collateral_price // collat_ratio * 11 // 10
+
+
+def is_liquidatable(collateral_value, debt_value, collateral_price):
+    """
+    Returns True when BorrowWand.liquidate would accept the loan at this price
+    """
+    lq_price = get_lq_price(collateral_value, debt_value, collateral_price)
+    return lq_price is not None and lq_price >= collateral_price
+
+
+class LoanBook:
+    """
+    Open loans by borrower, as (collateral_value, debt_value)
+    """
+
+    def __init__(self):
+        self.loans = {}
+
+    def __len__(self):
+        return len(self.loans)
+
+    def __contains__(self, user):
+        return user in self.loans
+
+    def update(self, user, collateral_value, debt_value):
+        if collateral_value == 0 and debt_value == 0:
+            self.loans.pop(user, None)
+        else:
+            self.loans[user] = (collateral_value, debt_value)
+
+    def liquidatable(self, collateral_price):
+        """
+        Returns the borrowers that can be liquidated, riskiest first
+        """
+        risky = [(c * 10 ** 18 // d, user) for user, (c, d) in self.loans.items() if is_liquidatable(c, d, collateral_price)]
+        return [user for _, user in sorted(risky)]
+
+
+class NonceManager:
+    """
+    Sends transactions from one account with consecutive nonces
+
+    Signing and sending happen under a lock so nonces reach the node in order,
+    waiting for receipts is left to the callers and can overlap.
+    """
+
+    def __init__(self, web3, account):
+        self.web3 = web3
+        self.account = account
+        self._lock = asyncio.Lock()
+        self._nonce = None
+
+    async def send(self, send_transaction):
+        """
+        Calls send_transaction(nonce) in a worker thread and returns its result
+        """
+        async with self._lock:
+            if self._nonce is None:
+                self._nonce = await asyncio.to_thread(self.web3.eth.get_transaction_count, self.account, "pending")
+            try:
+                result = await asyncio.to_thread(send_transaction, self._nonce)
+            except Exception:
+                # Resync From The Node After A Failed Submission
+                self._nonce = None
+                raise
+            self._nonce += 1
+            return result
+
+
+class Keeper:
+    """
+    Watches BorrowWand loans and liquidates the risky ones
+    """
+
+    def __init__(
+        self,
+        web3,
+        wand_address,
+        account,
+        private_key=None,
+        max_concurrency=4,
+        poll_interval=1.0,
+        block_range=2000,
+        start_block=0,
+        receipt_timeout=120,
+    ):
+        self.web3 = web3
+        self.account = to_checksum_address(account)
+        self.private_key = private_key
+        self.max_concurrency = max_concurrency
+        self.poll_interval = poll_interval
+        self.block_range = block_range
+        self.next_block = start_block
+        self.receipt_timeout = receipt_timeout
+
+        wand_abi = load_abi("BorrowWand")
+        self.wand = web3.eth.contract(address=wand_address, abi=wand_abi)
+        self.oracle = web3.eth.contract(
+            address=self.wand.functions.collateral_price_feed().call(), abi=load_abi("AggregatorV3Interface")
+        )
+        self.events = event_topics(wand_abi)
+
+        self.book = LoanBook()
+        self.collateral_price = None
+        self.nonces = NonceManager(web3, self.account)
+        self.pending = set()
+        self.liquidated = []
+        self._semaphore = None
+        self._tasks = set()
+
+    # Ingestion
+
+    def get_loan_events(self, from_block, to_block):
+        """
+        Returns the decoded BorrowWand events in a block range, in chain order
+        """
+        logs = self.web3.eth.get_logs(
+            {"fromBlock": from_block, "toBlock": to_block, "address": self.wand.address, "topics": [list(self.events)]}
+        )
+        events = []
+        for entry in logs:
+            item = self.events[to_hex(entry["topics"][0])]
+            events.append((item["name"], decode_log(item, entry)))
+        return events
+
+    def apply_event(self, name, event):
+        if name in CLOSING_EVENTS:
+            self.book.update(event["user"], 0, 0)
+        else:
+            self.book.update(event["user"], event["collateral_value"], event["debt_value"])
+
+    async def refresh(self, user):
+        """
+        Reloads one loan from the chain into the book
+        """
+        collateral_value, debt_value, active = await asyncio.to_thread(self.wand.functions.loan_of(user).call)
+        self.book.update(user, collateral_value if active else 0, debt_value if active else 0)
+
+    async def try_refresh(self, user):
+        """
+        Reloads one loan, logging a failed call instead of raising it, returns whether it was reloaded
+        """
+        try:
+            await self.refresh(user)
+        except Exception as exc:
+            log.warning("loan of %s not refreshed: %s", user, exc)
+            return False
+        return True
+
+    async def ingest(self):
+        """
+        Brings the loan book up to the latest block
+        """
+        latest = await asyncio.to_thread(lambda: self.web3.eth.block_number)
+        while self.next_block <= latest:
+            to_block = min(self.next_block + self.block_range - 1, latest)
+            for name, event in await asyncio.to_thread(self.get_loan_events, self.next_block, to_block):
+                self.apply_event(name, event)
+            self.next_block = to_block + 1
+
+    async def update_price(self):
+        """
+        Reads the current collateral price from the oracle
+        """
+        round_data = await asyncio.to_thread(self.oracle.functions.latestRoundData().call)
+        self.collateral_price = round_data[1]
+
+    # Submission
+
+    def _send_liquidation(self, user, nonce):
+        function = self.wand.functions.liquidate(user)
+        build = getattr(function, "build_transaction", None) or function.buildTransaction
+        tx = build({"from": self.account, "nonce": nonce})
+        if self.private_key is None:
+            return self.web3.eth.send_transaction(tx)
+        signed = self.web3.eth.account.sign_transaction(tx, self.private_key)
+        raw = getattr(signed, "raw_transaction", None) or signed.rawTransaction
+        return self.web3.eth.send_raw_transaction(raw)
+
+    async def liquidate(self, user):
+        """
+        Rechecks a loan and submits its liquidation
+        """
+        try:
+            async with self._semaphore:
+                # Recheck Against The Chain, The Book Can Lag Behind Other Keepers
+                if not await self.try_refresh(user):
+                    return
+                loan = self.book.loans.get(user)
+                if loan is None or not is_liquidatable(*loan, self.collateral_price):
+                    return
+                try:
+                    tx_hash = await self.nonces.send(lambda nonce: self._send_liquidation(user, nonce))
+                except Exception as exc:
+                    log.warning("liquidation of %s not submitted: %s", user, exc)
+                    return
+                try:
+                    receipt = await asyncio.to_thread(
+                        self.web3.eth.wait_for_transaction_receipt, tx_hash, self.receipt_timeout
+                    )
+                except Exception as exc:
+                    # The Transaction May Still Be Mined, Ingestion Then Drops The Loan From The Book
+                    log.warning("no receipt for liquidation of %s: %s", user, exc)
+                    return
+                if receipt["status"] == 1:
+                    self.liquidated.append(user)
+                    log.info("liquidated %s in block %s", user, receipt["blockNumber"])
+                else:
+                    log.warning("liquidation of %s reverted", user)
+                await self.try_refresh(user)
+        finally:
+            self.pending.discard(user)
+
+    def submit_liquidations(self):
+        """
+        Schedules a liquidation for every risky loan not already in flight
+        """
+        for user in self.book.liquidatable(self.collateral_price):
+            if user in self.pending:
+                continue
+            self.pending.add(user)
+            task = asyncio.ensure_future(self.liquidate(user))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def step(self):
+        """
+        Runs one ingestion and submission round
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        await self.ingest()
+        await self.update_price()
+        # Risky Loans Whose Submission Failed Are Retried Every Round
+        self.submit_liquidations()
+
+    async def drain(self):
+        """
+        Waits for every submitted liquidation to settle
+        """
+        while self._tasks:
+            # One Failed Task Must Not Stop The Others From Being Awaited
+            for result in await asyncio.gather(*list(self._tasks), return_exceptions=True):
+                if isinstance(result, Exception):
+                    log.error("liquidation task failed: %r", result)
+
+    async def run(self, steps=None):
+        """
+        Runs the keeper, forever or for a number of rounds
+        """
+        count = 0
+        try:
+            while steps is None or count < steps:
+                await self.step()
+                count += 1
+                await asyncio.sleep(self.poll_interval)
+        finally:
+            await self.drain()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Liquidate risky BorrowWand loans")
+    parser.add_argument("--rpc", default="http://127.0.0.1:8545")
+    parser.add_argument("--wand", required=True, help="BorrowWand address")
+    parser.add_argument("--account", required=True, help="address paying for liquidations")
+    parser.add_argument("--private-key-env", help="environment variable holding the account key, else the node signs")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--start-block", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    keeper = Keeper(
+        Web3(Web3.HTTPProvider(args.rpc)),
+        args.wand,
+        args.account,
+        private_key=os.environ[args.private_key_env] if args.private_key_env else None,
+        max_concurrency=args.concurrency,
+        poll_interval=args.poll_interval,
+        start_block=args.start_block,
+    )
+    asyncio.run(keeper.run())
+
+
+if __name__ == "__main__":
+    main()
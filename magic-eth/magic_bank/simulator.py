@@ -0,0 +1,288 @@
+"""
+Vectorized stress simulator for BorrowWand and StabilityPool
+
+The simulator reproduces the contracts' math with NumPy arrays, so parameter
+changes can be tried on millions of loans over thousands of price paths:
+
+- BorrowWand.get_lq_price and the checks of BorrowWand.open_loan
+- the liquidation split, 199/200 of the collateral to the pool and the rest to the caller
+- StabilityPool.update_values, which absorbs each liquidation into every deposit pro-rata
+
+Values are floats in the contracts' 18 decimal units, so results agree with
+the contracts to within rounding, not to the wei.
+
+get_lq_price only depends on the collateral to debt ratio, the price cancels
+out, so while borrowers do not act every loan has a fixed liquidation price.
+Loans are sorted by it once, riskiest first as in BorrowWand's sorted list.
+The loans liquidatable at any price are then a prefix of that order, and each
+step of every path is resolved with prefix sums and searchsorted, the way
+liquidate_lowest walks the list and skips loans the pool cannot cover.
+
+Run a stress test with:
+
+    python -m magic_bank.simulator --loans 1000000 --paths 2000 --steps 250
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+# Share of liquidated collateral sent to the stability pool, the rest pays the liquidator
+POOL_SHARE = 199 / 200
+
+
+class Params:
+    """
+    BorrowWand parameters, in the contract's units
+    """
+
+    def __init__(self, max_ltv_ratio=9000, borrow_fee=50, lq_reserve_fee=2e20, min_debt_value=2e21):
+        self.max_ltv_ratio = max_ltv_ratio
+        self.borrow_fee = borrow_fee
+        self.lq_reserve_fee = lq_reserve_fee
+        self.min_debt_value = min_debt_value
+
+
+def get_lq_price(collateral_value, debt_value, collateral_price):
+    """
+    Mirrors BorrowWand.get_lq_price over arrays, inf where the collateral ratio is zero and nan where the contract would revert
+    """
+    collateral_value = np.asarray(collateral_value, dtype=float)
+    debt_value = np.asarray(debt_value, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Compute USD Value of Collateral
+        collateral_usd_value = collateral_value * collateral_price / 1e18
+        # Compute Collaterization ratio
+        collat_ratio = 1e18 * collateral_usd_value / debt_value
+        # Return Liquidate Price
+        lq_price = 1e18 * collateral_price / collat_ratio * 11 / 10
+    return np.where(debt_value > 0, np.where(collat_ratio > 0, lq_price, np.inf), np.nan)
+
+
+def liquidation_split(collateral_value):
+    """
+    Mirrors BorrowWand.liquidate, returns the collateral sent to the pool and to the liquidator
+    """
+    pool_collateral_value = np.asarray(collateral_value, dtype=float) * POOL_SHARE
+    return pool_collateral_value, collateral_value - pool_collateral_value
+
+
+def open_loans(collateral_value, debt_value, collateral_price, params):
+    """
+    Mirrors BorrowWand.open_loan, returns the stored collateral and debt of the loans it accepts
+    """
+    collateral_value = np.asarray(collateral_value, dtype=float)
+    debt_value = np.asarray(debt_value, dtype=float)
+    loan_debt_value = debt_value + debt_value * params.borrow_fee / 10000 + params.lq_reserve_fee
+    with np.errstate(invalid="ignore"):
+        accepted = (debt_value >= params.min_debt_value) & (
+            collateral_price > get_lq_price(collateral_value, loan_debt_value, collateral_price)
+        )
+    return collateral_value[accepted], loan_debt_value[accepted]
+
+
+def sample_loans(count, collateral_price, params, rng, min_ltv=0.2):
+    """
+    Draws loans with lognormal collateral around 10 tokens and loan to value ratios
+    up to max_ltv_ratio, keeping the ones open_loan accepts
+    """
+    collateral_value = rng.lognormal(np.log(1e19), 1.0, count)
+    ltv = rng.uniform(min_ltv, params.max_ltv_ratio / 10000, count)
+    debt_value = collateral_value * collateral_price / 1e18 * ltv
+    return open_loans(collateral_value, debt_value, collateral_price, params)
+
+
+def price_paths(collateral_price, paths, steps, volatility, rng, drift=0.0):
+    """
+    Geometric Brownian motion price paths, one row per path, with volatility and drift per step
+    """
+    shocks = rng.normal(drift - volatility ** 2 / 2, volatility, (paths, steps))
+    return collateral_price * np.exp(np.cumsum(shocks, axis=1))
+
+
+def absorb(deposits, debt_value, collateral_value):
+    """
+    Mirrors StabilityPool.update_values over an array of deposits, returns the
+    compounded deposits and their collateral gains
+    """
+    deposits = np.asarray(deposits, dtype=float)
+    total_stablecoin = deposits.sum()
+    if debt_value > total_stablecoin:
+        raise ValueError("debt_value exceeds the pool's stablecoins")
+    return deposits * (1 - debt_value / total_stablecoin), deposits * collateral_value / total_stablecoin
+
+
+class SimulationResult:
+    """
+    Outcome of every price path, each attribute is an array with one value per path
+    """
+
+    def __init__(self, paths, pool_value):
+        self.pool_start = pool_value
+        self.pool_value = np.full(paths, float(pool_value))
+        self.liquidations = np.zeros(paths, dtype=np.int64)
+        self.liquidated_debt = np.zeros(paths)
+        self.pool_collateral = np.zeros(paths)
+        self.liquidator_collateral = np.zeros(paths)
+        # Debt burned from the pool beyond the value of the collateral it received
+        self.pool_loss = np.zeros(paths)
+        # Liquidatable loans the pool could not cover, left open
+        self.uncovered_loans = np.zeros(paths, dtype=np.int64)
+        self.uncovered_debt = np.zeros(paths)
+        # Debt of uncovered loans beyond the value of their collateral at the last price
+        self.uncovered_bad_debt = np.zeros(paths)
+        # First step at which the pool could not cover any further loan, -1 if never
+        self.depleted_step = np.full(paths, -1, dtype=np.int64)
+
+    @property
+    def bad_debt(self):
+        return self.pool_loss + self.uncovered_bad_debt
+
+    def deposit_outcomes(self, deposits):
+        """
+        Returns the compounded value and collateral gain of each deposit on each path,
+        as update_values shares every liquidation pro-rata
+        """
+        deposits = np.asarray(deposits, dtype=float)
+        return (
+            np.outer(self.pool_value / self.pool_start, deposits),
+            np.outer(self.pool_collateral / self.pool_start, deposits),
+        )
+
+    def summary(self, percentiles=(50, 95, 99)):
+        """
+        Returns the mean and percentiles of each outcome across paths
+        """
+        outcomes = {
+            "liquidations": self.liquidations,
+            "uncovered_loans": self.uncovered_loans,
+            "pool_depletion": 1 - self.pool_value / self.pool_start,
+            "pool_loss": self.pool_loss,
+            "uncovered_bad_debt": self.uncovered_bad_debt,
+            "bad_debt": self.bad_debt,
+        }
+        summary = {name: dict(mean=float(values.mean()), **{f"p{p}": float(np.percentile(values, p)) for p in percentiles}) for name, values in outcomes.items()}
+        summary["depleted_paths"] = float((self.depleted_step >= 0).mean())
+        return summary
+
+
+def simulate(collateral_value, debt_value, prices, pool_value):
+    """
+    Liquidates loans along each price path as liquidate_lowest would, riskiest first,
+    skipping loans the pool cannot cover, and absorbs them into the pool
+
+    @param collateral_value The collateral of each loan
+    @param debt_value The debt of each loan, fees included
+    @param prices The collateral price at each step, one row per path
+    @param pool_value The stablecoins in the pool at the start of every path
+    """
+    prices = np.atleast_2d(np.asarray(prices, dtype=float))
+    paths, steps = prices.shape
+    result = SimulationResult(paths, pool_value)
+    # Sort Loans By Liquidation Price, Riskiest First
+    lq_price = get_lq_price(collateral_value, debt_value, 1e18)
+    order = np.argsort(-lq_price, kind="stable")
+    neg_lq_price = -lq_price[order]
+    collateral = np.asarray(collateral_value, dtype=float)[order]
+    debt = np.asarray(debt_value, dtype=float)[order]
+    # Prefix Sums With A Leading Zero, And The Smallest Debt From Each Loan On
+    debt_sum = np.concatenate(([0.0], np.cumsum(debt)))
+    collateral_sum = np.concatenate(([0.0], np.cumsum(collateral)))
+    min_debt_from = np.concatenate((np.minimum.accumulate(debt[::-1])[::-1], [np.inf]))
+    # Per Path State
+    cursor = np.zeros(paths, dtype=np.int64)
+    reached = np.zeros(paths, dtype=np.int64)
+    exhausted_from = np.full(paths, -1, dtype=np.int64)
+    skipped_paths, skipped_loans = [], []
+    for step in range(steps):
+        price = prices[:, step]
+        # Loans With A Liquidation Price At Or Above The Price
+        eligible = np.searchsorted(neg_lq_price, -price, side="right")
+        # Loans The Pool Loses On, Where Its Share Of Collateral Is Worth Less Than The Debt
+        underwater = np.searchsorted(neg_lq_price, -price * 11 / 10 * POOL_SHARE, side="left")
+        reached = np.maximum(reached, eligible)
+        while True:
+            active = np.nonzero(cursor < eligible)[0]
+            if len(active) == 0:
+                break
+            start = cursor[active]
+            pool = result.pool_value[active]
+            limit = eligible[active]
+            # If Pool Cannot Cover Any Further Loan, Then Every Loan Left Is Uncovered
+            exhausted = pool < min_debt_from[start]
+            exhausted_paths = active[exhausted]
+            exhausted_from[exhausted_paths] = np.where(exhausted_from[exhausted_paths] < 0, start[exhausted], exhausted_from[exhausted_paths])
+            result.depleted_step[exhausted_paths] = np.where(result.depleted_step[exhausted_paths] < 0, step, result.depleted_step[exhausted_paths])
+            cursor[exhausted_paths] = limit[exhausted]
+            active, start, pool, limit = active[~exhausted], start[~exhausted], pool[~exhausted], limit[~exhausted]
+            # Liquidate Every Loan That Fits In The Pool, In Order
+            end = np.minimum(np.searchsorted(debt_sum, debt_sum[start] + pool, side="right") - 1, limit)
+            liquidated_debt = debt_sum[end] - debt_sum[start]
+            pool_collateral, liquidator_collateral = liquidation_split(collateral_sum[end] - collateral_sum[start])
+            loss_end = np.clip(underwater[active], start, end)
+            loss = (debt_sum[loss_end] - debt_sum[start]) - (collateral_sum[loss_end] - collateral_sum[start]) * POOL_SHARE * price[active] / 1e18
+            result.liquidations[active] += end - start
+            result.liquidated_debt[active] += liquidated_debt
+            result.pool_value[active] -= liquidated_debt
+            result.pool_collateral[active] += pool_collateral
+            result.liquidator_collateral[active] += liquidator_collateral
+            result.pool_loss[active] += np.maximum(loss, 0)
+            # Skip The Loan That Did Not Fit, Smaller Loans After It May Still Fit
+            blocked = end < limit
+            skipped_paths.append(active[blocked])
+            skipped_loans.append(end[blocked])
+            cursor[active] = end + blocked
+    # Uncovered Loans, Valued At The Last Price
+    last_price = prices[:, -1]
+    underwater = np.searchsorted(neg_lq_price, -last_price * 11 / 10, side="left")
+    tail = exhausted_from >= 0
+    start = np.where(tail, exhausted_from, 0)
+    end = np.where(tail, reached, 0)
+    loss_end = np.clip(underwater, start, end)
+    result.uncovered_loans += end - start
+    result.uncovered_debt += debt_sum[end] - debt_sum[start]
+    result.uncovered_bad_debt += np.maximum((debt_sum[loss_end] - debt_sum[start]) - (collateral_sum[loss_end] - collateral_sum[start]) * last_price / 1e18, 0)
+    if skipped_paths:
+        skipped_paths = np.concatenate(skipped_paths)
+        skipped_loans = np.concatenate(skipped_loans)
+        np.add.at(result.uncovered_loans, skipped_paths, 1)
+        np.add.at(result.uncovered_debt, skipped_paths, debt[skipped_loans])
+        np.add.at(result.uncovered_bad_debt, skipped_paths, np.maximum(debt[skipped_loans] - collateral[skipped_loans] * last_price[skipped_paths] / 1e18, 0))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress BorrowWand parameters over simulated price paths")
+    parser.add_argument("--loans", type=int, default=100000)
+    parser.add_argument("--paths", type=int, default=1000)
+    parser.add_argument("--steps", type=int, default=250)
+    parser.add_argument("--price", type=float, default=1e21, help="starting collateral price, 18 decimals")
+    parser.add_argument("--volatility", type=float, default=0.03, help="price volatility per step")
+    parser.add_argument("--drift", type=float, default=0.0, help="price drift per step")
+    parser.add_argument("--pool-ratio", type=float, default=0.1, help="stability pool size as a share of total debt")
+    parser.add_argument("--max-ltv-ratio", type=int, default=9000, help="bps")
+    parser.add_argument("--borrow-fee", type=int, default=50, help="bps")
+    parser.add_argument("--lq-reserve-fee", type=float, default=2e20)
+    parser.add_argument("--min-debt-value", type=float, default=2e21)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    rng = np.random.default_rng(args.seed)
+    params = Params(args.max_ltv_ratio, args.borrow_fee, args.lq_reserve_fee, args.min_debt_value)
+    collateral_value, debt_value = sample_loans(args.loans, args.price, params, rng)
+    prices = price_paths(args.price, args.paths, args.steps, args.volatility, rng, args.drift)
+    result = simulate(collateral_value, debt_value, prices, debt_value.sum() * args.pool_ratio)
+
+    print(f"{len(debt_value)} loans opened of {args.loans}, {args.paths} paths of {args.steps} steps, in {time.perf_counter() - started:.2f}s")
+    print(f"{'outcome':<24}{'mean':>16}{'p50':>16}{'p95':>16}{'p99':>16}")
+    summary = result.summary()
+    depleted_paths = summary.pop("depleted_paths")
+    for name, values in summary.items():
+        print(f"{name:<24}" + "".join(f"{values[key]:>16.4g}" for key in ("mean", "p50", "p95", "p99")))
+    print(f"{'depleted_paths':<24}{depleted_paths:>16.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,103 @@
 #!/usr/bin/python3
 
+import json
+import os
+import sys
+from pathlib import Path
+
 import pytest
+from eth_keys import keys
+from eth_utils import keccak
+from hexbytes import HexBytes
+
+try:
+    from eth_abi import encode
+except ImportError:
+    from eth_abi import encode_abi as encode
+
+# Make The Off-Chain Services Importable From Tests
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+# Test Backend
+
+# Set MAGIC_BANK_BACKEND=pyevm to run on the in-process EVM in tests/evm_backend.py with `python -m pytest -p no:pytest-brownie`,
+# it is used automatically when brownie is not installed
+try:
+    import brownie
+    BACKEND = os.environ.get("MAGIC_BANK_BACKEND", "brownie")
+except ImportError:
+    BACKEND = "pyevm"
+
+if BACKEND == "pyevm":
+    import evm_backend
+
+    # Test Modules Import This In Place Of Brownie
+    sys.modules["brownie"] = _brownie = evm_backend.brownie_module()
+
+    @pytest.fixture(scope="session")
+    def accounts():
+        return _brownie.accounts
+
+    @pytest.fixture(scope="session")
+    def chain():
+        return _brownie.chain
+
+    @pytest.fixture(scope="session")
+    def web3():
+        return _brownie.web3
+
+    @pytest.fixture
+    def fn_isolation():
+        _brownie.chain.snapshot()
+        yield
+        _brownie.chain.pop()
+
+    @pytest.fixture(scope="module")
+    def module_isolation():
+        _brownie.chain.snapshot()
+        yield
+        _brownie.chain.pop()
+
+    @pytest.fixture(scope="session")
+    def MockPriceOracle():
+        return _brownie.MockPriceOracle
+
+    @pytest.fixture(scope="session")
+    def Token():
+        return _brownie.Token
+
+    @pytest.fixture(scope="session")
+    def SwapWand():
+        return _brownie.SwapWand
+
+    @pytest.fixture(scope="session")
+    def StabilityPool():
+        return _brownie.StabilityPool
+
+    @pytest.fixture(scope="session")
+    def BorrowWand():
+        return _brownie.BorrowWand
+
+    @pytest.fixture(scope="session")
+    def SameBlockCaller():
+        return _brownie.SameBlockCaller
 
 # . This runs before ALL tests
 
+# Contracts are deployed once per module, and every test runs on a chain snapshot that is reverted afterwards
+# Modules can run in parallel with `brownie test -n auto --dist loadscope`, each worker runs its own chain
+
+
+@pytest.fixture(autouse=True)
+def isolation(fn_isolation):
+    pass
+
+
 # Temp ETH Price Oracle Deployer
 
 
-@pytest.fixture
-def eth_oracle(MockPriceOracle, accounts):
+@pytest.fixture(scope="module")
+def eth_oracle(MockPriceOracle, accounts, module_isolation):
     eth_oracle = MockPriceOracle.deploy({"from": accounts[0]})
     price = 1e21
     eth_oracle.setCurrentPrice(price, {"from": eth_oracle.deployer()})
@@ -18,12 +107,12 @@ def eth_oracle(MockPriceOracle, accounts):
 # ETH Wand Deployer
 
 
-@pytest.fixture
-def token(Token, accounts):
+@pytest.fixture(scope="module")
+def token(Token, accounts, module_isolation):
     return Token.deploy("Test ETH", "tETH", 18, 1e21, {"from": accounts[0]})
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def wand(token, SwapWand, accounts):
     wand = SwapWand.deploy(token, {"from": accounts[0]})
     token.set_wand(wand, {"from": token.deployer()})
@@ -33,20 +122,164 @@ def wand(token, SwapWand, accounts):
 # USD Wand Deployer
 
 
-@pytest.fixture
-def usd_token(Token, accounts):
+@pytest.fixture(scope="module")
+def usd_token(Token, accounts, module_isolation):
     return Token.deploy("Test USD", "tUSD", 18, 1e24, {'from': accounts[0]})
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def usd_stability_pool(StabilityPool, usd_token, token, accounts):
     return StabilityPool.deploy(usd_token, token, 2e21, {'from': accounts[0]})
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def usd_wand(BorrowWand, usd_token, token, usd_stability_pool, eth_oracle, accounts):
     usd_wand = BorrowWand.deploy(usd_token, token, usd_stability_pool, eth_oracle, 9000, 50, 2e20, 2e21, {"from": accounts[0]})
     usd_wand.set_rewards(usd_wand, {"from": usd_wand.deployer()})
     usd_token.set_wand(usd_wand, {"from": usd_token.deployer()})
     usd_stability_pool.set_wand(usd_wand, {"from": usd_stability_pool.deployer()})
     return usd_wand
+
+
+# EIP-2612 Permits
+
+PERMIT_TYPEHASH = keccak(text="Permit(address owner,address spender,uint256 value,uint256 nonce,uint256 deadline)")
+
+
+@pytest.fixture(scope="session")
+def sign_permit(chain):
+    # Signs a permit for an account with a private key, as a wallet would
+    def sign_permit(token, owner, spender, value, deadline=None):
+        if deadline is None:
+            deadline = chain.time() + 3600
+        struct_hash = keccak(encode(
+            ["bytes32", "address", "address", "uint256", "uint256", "uint256"],
+            [PERMIT_TYPEHASH, str(owner), str(spender), int(value), token.nonces(owner), deadline],
+        ))
+        digest = keccak(b"\x19\x01" + bytes(HexBytes(token.DOMAIN_SEPARATOR())) + struct_hash)
+        signature = keys.PrivateKey(HexBytes(owner.private_key)).sign_msg_hash(digest)
+        return deadline, signature.v + 27, signature.r.to_bytes(32, "big"), signature.s.to_bytes(32, "big")
+
+    return sign_permit
+
+
+# Gas Report
+
+
+GAS_REPORT_PATH = Path(__file__).parent.parent / "reports" / "gas.json"
+# Gas depends on the EVM rules of the backend, py-evm runs Istanbul and brownie's chain runs London,
+# so each backend has its own baseline, a backend without one only reports
+GAS_BASELINE_PATH = Path(__file__).parent / f"gas_baseline.{BACKEND}.json"
+
+# Set GAS_BASELINE=record to write this run's gas into the baseline instead of checking it
+GAS_RECORD = os.environ.get("GAS_BASELINE") == "record"
+# Allowed gas increase over the baseline, in percent
+GAS_THRESHOLD = float(os.environ.get("GAS_THRESHOLD", "1"))
+
+
+class GasReport(dict):
+    """
+    Gas used per function, checked against the baseline as it is recorded
+    """
+
+    def __init__(self, baseline):
+        super().__init__()
+        self.baseline = baseline
+
+    def __setitem__(self, name, gas_used):
+        super().__setitem__(name, gas_used)
+        baseline = self.baseline.get(name)
+        if GAS_RECORD or baseline is None:
+            return
+        assert gas_used <= baseline * (1 + GAS_THRESHOLD / 100), (
+            f"{name} used {gas_used} gas, {gas_used - baseline:+} over the baseline of {baseline}"
+        )
+
+
+_gas_used = GasReport(json.loads(GAS_BASELINE_PATH.read_text()) if GAS_BASELINE_PATH.exists() else {})
+
+
+@pytest.fixture(scope="session")
+def gas_report():
+    return _gas_used
+
+
+# Gas Distribution
+
+
+GAS_DISTRIBUTION_PATH = Path(__file__).parent.parent / "reports" / "gas_distribution.json"
+
+# Gas used by every call of an operation, with the open loans and deposits after the call
+_gas_distribution = {}
+
+
+@pytest.fixture(scope="session")
+def gas_distribution():
+    return _gas_distribution
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def pytest_sessionfinish(session):
+    # Hand This Worker's Gas To The Controller When Running In Parallel
+    if hasattr(session.config, "workeroutput"):
+        session.config.workeroutput["gas_used"] = json.dumps(_gas_used)
+        session.config.workeroutput["gas_distribution"] = json.dumps(_gas_distribution)
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node, error):
+    # Collect A Worker's Gas, It Was Already Checked Against The Baseline There
+    dict.update(_gas_used, json.loads(node.workeroutput.get("gas_used", "{}")))
+    for name, samples in json.loads(node.workeroutput.get("gas_distribution", "{}")).items():
+        _gas_distribution.setdefault(name, []).extend(tuple(i) for i in samples)
+
+
+def pytest_terminal_summary(terminalreporter):
+    terminal_gas_report(terminalreporter)
+    terminal_gas_distribution(terminalreporter)
+
+
+def terminal_gas_report(terminalreporter):
+    # Compare Gas Used Against The Baseline And The Previous Run, Then Save This Run
+    if not _gas_used or hasattr(terminalreporter.config, "workerinput"):
+        return
+    previous = json.loads(GAS_REPORT_PATH.read_text()) if GAS_REPORT_PATH.exists() else {}
+    terminalreporter.write_sep("=", "gas report")
+    terminalreporter.write_line(f"{'function':<48}{'baseline':>12}{'before':>12}{'after':>12}{'change':>12}")
+    for name, gas_used in sorted(_gas_used.items()):
+        baseline = _gas_used.baseline.get(name)
+        before = previous.get(name)
+        change = f"{gas_used - baseline:+}" if baseline is not None else ""
+        terminalreporter.write_line(
+            f"{name:<48}{baseline if baseline is not None else '':>12}{before if before is not None else '':>12}{gas_used:>12}{change:>12}"
+        )
+    GAS_REPORT_PATH.parent.mkdir(exist_ok=True)
+    GAS_REPORT_PATH.write_text(json.dumps(dict(previous, **_gas_used), indent=4, sort_keys=True))
+    if GAS_RECORD:
+        GAS_BASELINE_PATH.write_text(json.dumps(dict(_gas_used.baseline, **_gas_used), indent=4, sort_keys=True) + "\n")
+        terminalreporter.write_line(f"gas baseline written to {GAS_BASELINE_PATH}")
+
+
+def terminal_gas_distribution(terminalreporter):
+    # Summarise Gas Per Operation, Then Save Every Sample To Study How Cost Grows With The System
+    if not _gas_distribution or hasattr(terminalreporter.config, "workerinput"):
+        return
+    terminalreporter.write_sep("=", "gas distribution")
+    terminalreporter.write_line(
+        f"{'operation':<36}{'calls':>8}{'min':>10}{'median':>10}{'p90':>10}{'max':>10}{'max loans':>11}{'max deposits':>14}"
+    )
+    for name, samples in sorted(_gas_distribution.items()):
+        gas = [i[0] for i in samples]
+        terminalreporter.write_line(
+            f"{name:<36}{len(gas):>8}{min(gas):>10}{percentile(gas, 0.5):>10}{percentile(gas, 0.9):>10}{max(gas):>10}"
+            f"{max(i[1] for i in samples):>11}{max(i[2] for i in samples):>14}"
+        )
+    GAS_DISTRIBUTION_PATH.parent.mkdir(exist_ok=True)
+    GAS_DISTRIBUTION_PATH.write_text(json.dumps(
+        {name: [{"gas_used": g, "loans": l, "deposits": d} for g, l, d in samples] for name, samples in sorted(_gas_distribution.items())},
+        indent=4,
+    ))
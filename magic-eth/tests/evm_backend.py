@@ -0,0 +1,568 @@
+#!/usr/bin/python3
+
+"""
+In-process py-evm backend for the test suite
+
+Provides the subset of the brownie API the tests rely on (accounts, contract
+containers, transactions, reverts and chain snapshots) on top of eth-tester,
+so the suite runs without an external ganache process. Contracts are compiled
+once with the installed vyper and cached in build/pyevm by source hash.
+"""
+
+import hashlib
+import json
+import subprocess
+import sys
+import types
+from decimal import Decimal
+from pathlib import Path
+
+from eth.vm.forks import IstanbulVM
+from eth_tester import EthereumTester, PyEVMBackend
+from eth_tester.exceptions import TransactionFailed
+from eth_utils import keccak, to_canonical_address, to_checksum_address
+
+try:
+    from eth_abi import decode, encode
+except ImportError:
+    from eth_abi import decode_abi as decode, encode_abi as encode
+
+from magic_bank.contracts import abi_type, decode_log, event_topics, format_output, to_hex
+
+
+PROJECT_PATH = Path(__file__).resolve().parent.parent
+CACHE_PATH = PROJECT_PATH / "build" / "pyevm"
+
+# Matches the evm_version of the brownie build artifacts
+EVM_VERSION = "istanbul"
+
+UNITS = {"wei": 1, "kwei": 10 ** 3, "mwei": 10 ** 6, "gwei": 10 ** 9, "szabo": 10 ** 12, "finney": 10 ** 15, "ether": 10 ** 18}
+
+
+class VirtualMachineError(Exception):
+    def __init__(self, message, revert_msg=None):
+        super().__init__(message)
+        self.revert_msg = revert_msg
+
+
+# Values
+
+
+def to_wei(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        value = Decimal(repr(value))
+    elif isinstance(value, str):
+        amount, _, unit = value.strip().partition(" ")
+        value = Decimal(amount) * UNITS[unit.strip() or "wei"]
+    elif isinstance(value, Decimal):
+        pass
+    else:
+        raise TypeError(f"Cannot convert {value!r} to wei")
+    if value != value.to_integral_value():
+        raise ValueError(f"{value} is not an integer amount of wei")
+    return int(value)
+
+
+class Wei(int):
+    """
+    Integer return value that compares against floats and unit strings the way brownie does
+    """
+
+    def __new__(cls, value):
+        return super().__new__(cls, to_wei(value))
+
+    def _other(self, other):
+        try:
+            return to_wei(other)
+        except (TypeError, ValueError):
+            return other
+
+    def __eq__(self, other):
+        return int(self) == self._other(other)
+
+    def __ne__(self, other):
+        return int(self) != self._other(other)
+
+    def __lt__(self, other):
+        return int(self) < self._other(other)
+
+    def __le__(self, other):
+        return int(self) <= self._other(other)
+
+    def __gt__(self, other):
+        return int(self) > self._other(other)
+
+    def __ge__(self, other):
+        return int(self) >= self._other(other)
+
+    __hash__ = int.__hash__
+
+
+def _format_input(abi_type, value):
+    if abi_type.endswith("]"):
+        return [_format_input(abi_type[:abi_type.rindex("[")], i) for i in value]
+    if abi_type.startswith("(") and abi_type.endswith(")"):
+        return tuple(value)
+    if abi_type.startswith(("uint", "int")):
+        return to_wei(value)
+    if abi_type == "address":
+        return to_checksum_address(str(value))
+    return value
+
+
+class ReturnValue(tuple):
+    """
+    Tuple return value whose members can also be accessed by name
+    """
+
+    def __new__(cls, values, names):
+        value = super().__new__(cls, values)
+        value._names = names
+        return value
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, self._names.index(key))
+        return tuple.__getitem__(self, key)
+
+    def dict(self):
+        return dict(zip(self._names, self))
+
+
+def _format_output(item, value):
+    return format_output(item, value, ReturnValue, Wei)
+
+
+# Compilation
+
+
+def compile_source(path):
+    """
+    Compiles a Vyper source file, caching the ABI and bytecode by source hash
+    """
+    source = path.read_bytes()
+    source_hash = hashlib.sha1(source).hexdigest()
+    cache_file = CACHE_PATH / f"{path.stem}.json"
+    if cache_file.exists():
+        cached = json.loads(cache_file.read_text())
+        if cached["sha1"] == source_hash:
+            return cached
+    output = subprocess.run(
+        [sys.executable, "-m", "vyper", "-f", "abi,bytecode", "--evm-version", EVM_VERSION, "-p", str(PROJECT_PATH), str(path)],
+        cwd=PROJECT_PATH, check=True, capture_output=True, text=True
+    ).stdout.splitlines()
+    artifact = {
+        "contractName": path.stem,
+        "sourcePath": path.relative_to(PROJECT_PATH).as_posix(),
+        "sha1": source_hash,
+        "abi": json.loads(output[0]),
+        "bytecode": output[1],
+    }
+    CACHE_PATH.mkdir(parents=True, exist_ok=True)
+    cache_file.write_text(json.dumps(artifact))
+    return artifact
+
+
+def compile_project():
+    return {path.stem: compile_source(path) for path in sorted((PROJECT_PATH / "contracts").glob("**/*.vy"))}
+
+
+# Chain
+
+
+class Chain:
+    def __init__(self):
+        self.backend = PyEVMBackend(vm_configuration=((0, IstanbulVM),))
+        self.tester = EthereumTester(self.backend)
+        self.gas_limit = self.tester.get_block_by_number("pending")["gas_limit"]
+        self._snapshots = []
+        self._events = {}
+
+    @property
+    def height(self):
+        return self.tester.get_block_by_number("latest")["number"]
+
+    def time(self):
+        return self.tester.get_block_by_number("latest")["timestamp"]
+
+    def mine(self, blocks=1):
+        self.tester.mine_blocks(blocks)
+
+    def sleep(self, seconds):
+        self.tester.time_travel(self.tester.get_block_by_number("pending")["timestamp"] + seconds)
+
+    def snapshot(self):
+        self._snapshots.append(self.tester.take_snapshot())
+
+    def revert(self):
+        self.tester.revert_to_snapshot(self._snapshots[-1])
+
+    def pop(self):
+        self.tester.revert_to_snapshot(self._snapshots.pop())
+
+    def web3(self):
+        """
+        Returns a web3 connection to this chain, for the off-chain services
+        """
+        from web3 import Web3
+        from web3.providers.eth_tester import EthereumTesterProvider
+
+        class LegacyGasProvider(EthereumTesterProvider):
+            # The Istanbul VM only accepts legacy transactions, so calls get a zero gas price like _send
+            def make_request(self, method, params):
+                if method in ("eth_call", "eth_estimateGas", "eth_sendTransaction") and params:
+                    tx = dict(params[0])
+                    if "gas_price" not in tx and "max_fee_per_gas" not in tx:
+                        tx["gas_price"] = 0
+                    # eth-tester needs a sender for calls, which nodes do not
+                    if method == "eth_call" and "from" not in tx:
+                        tx["from"] = self.ethereum_tester.get_accounts()[0]
+                    params = [tx, *params[1:]]
+                return super().make_request(method, params)
+
+        web3 = Web3(LegacyGasProvider(self.tester))
+        web3.eth.set_gas_price_strategy(lambda web3, tx: 0)
+        return web3
+
+    def register_events(self, abi):
+        self._events.update(event_topics(abi))
+
+    def decode_logs(self, logs):
+        events = EventDict()
+        for log in logs:
+            item = self._events.get(to_hex(log["topics"][0]))
+            if item is None:
+                continue
+            events.add(item["name"], decode_log(item, log, ReturnValue, Wei))
+        return events
+
+
+class EventDict:
+    def __init__(self):
+        self._events = {}
+
+    def add(self, name, event):
+        self._events.setdefault(name, EventItem(name)).append(event)
+
+    def __contains__(self, name):
+        return name in self._events
+
+    def __getitem__(self, name):
+        return self._events[name]
+
+    def __len__(self):
+        return sum(len(i) for i in self._events.values())
+
+    def keys(self):
+        return self._events.keys()
+
+
+class EventItem(list):
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return list.__getitem__(self, 0)[key]
+        return list.__getitem__(self, key)
+
+    def values(self):
+        return list(list.__getitem__(self, 0).values())
+
+
+# Accounts
+
+
+class Account(str):
+    def __new__(cls, address, chain):
+        account = super().__new__(cls, to_checksum_address(address))
+        account.chain = chain
+        return account
+
+    @property
+    def address(self):
+        return str(self)
+
+    def balance(self):
+        return Wei(self.chain.tester.get_balance(self))
+
+    def transfer(self, to, amount):
+        return _send(self.chain, {"from": self, "to": to, "value": amount})
+
+
+class Accounts(list):
+    def __init__(self, chain):
+        super().__init__(Account(i, chain) for i in chain.tester.get_accounts())
+        self.chain = chain
+        self._keys = 0
+
+    def add(self):
+        self._keys += 1
+        private_key = "0x" + keccak(text=f"magic-bank-test-account-{self._keys}").hex().removeprefix("0x")
+        account = Account(self.chain.tester.add_account(private_key), self.chain)
+        # Like Brownie's LocalAccount, So Tests Can Sign Messages
+        account.private_key = private_key
+        self.append(account)
+        return account
+
+
+# Transactions
+
+
+class TransactionReceipt:
+    def __init__(self, chain, tx_hash, return_value=None):
+        receipt = chain.tester.get_transaction_receipt(tx_hash)
+        self.txid = tx_hash
+        self.status = receipt["status"]
+        self.gas_used = receipt["gas_used"]
+        self.block_number = receipt["block_number"]
+        self.contract_address = receipt["contract_address"]
+        self.return_value = return_value
+        self.events = chain.decode_logs(receipt["logs"])
+
+    def __repr__(self):
+        return f"<Transaction {self.txid}>"
+
+
+class _ImpersonatedTransaction:
+    """
+    Signed transaction executed with another sender, so tests can send from contract addresses
+    """
+
+    def __init__(self, transaction, sender):
+        self._transaction = transaction
+        self.sender = sender
+
+    def __getattr__(self, name):
+        return getattr(self._transaction, name)
+
+    def get_sender(self):
+        return self.sender
+
+    def validate(self):
+        pass
+
+    def check_signature_validity(self):
+        pass
+
+
+def _impersonate(chain, params):
+    sender = to_canonical_address(params["from"])
+    signer = chain.tester.get_accounts()[0]
+    params = dict(params, nonce=chain.tester.get_nonce(params["from"]))
+    params = {k: to_canonical_address(v) if k in ("from", "to") else v for k, v in params.items()}
+    params["from"] = to_canonical_address(signer)
+    params["data"] = bytes.fromhex(params["data"][2:])
+    # Private eth-tester API, written against eth-tester 0.14.0b1 with py-evm 0.12.1b1, eth-tester has no public
+    # way to send from an address without its key, check this call when upgrading either package
+    transaction = chain.backend._get_normalized_and_signed_evm_transaction(params)
+    chain.backend.chain.apply_transaction(_ImpersonatedTransaction(transaction, sender))
+    chain.tester.mine_blocks()
+    return "0x" + transaction.hash.hex().removeprefix("0x")
+
+
+def _send(chain, tx, data=b""):
+    params = {
+        "from": to_checksum_address(str(tx["from"])),
+        "gas": tx.get("gas_limit", tx.get("gas", chain.gas_limit)),
+        "gas_price": 0,
+        "value": to_wei(tx.get("value", 0)),
+        "data": "0x" + data.hex(),
+    }
+    if tx.get("to") is not None:
+        params["to"] = to_checksum_address(str(tx["to"]))
+    try:
+        if params["from"] in chain.tester.get_accounts():
+            tx_hash = chain.tester.send_transaction(params)
+        else:
+            tx_hash = _impersonate(chain, params)
+    except TransactionFailed as exc:
+        raise VirtualMachineError(f"revert: {exc}", exc.args[0] if exc.args else None) from None
+    receipt = TransactionReceipt(chain, tx_hash)
+    if receipt.status == 0:
+        raise VirtualMachineError("revert")
+    return receipt
+
+
+def _split_tx(args):
+    if args and isinstance(args[-1], dict):
+        return args[:-1], args[-1]
+    return args, None
+
+
+class ContractMethod:
+    def __init__(self, contract, abi):
+        self.contract = contract
+        self.abi = abi
+        self.input_types = [abi_type(i) for i in abi["inputs"]]
+        self.output_types = [abi_type(i) for i in abi["outputs"]]
+        signature = f"{abi['name']}({','.join(self.input_types)})"
+        self.signature = keccak(text=signature)[:4]
+
+    def encode_input(self, *args):
+        if len(args) != len(self.input_types):
+            raise ValueError(f"{self.abi['name']} expects {len(self.input_types)} arguments, got {len(args)}")
+        values = [_format_input(t, v) for t, v in zip(self.input_types, args)]
+        return self.signature + encode(self.input_types, values)
+
+    def decode_output(self, data):
+        values = [_format_output(i, v) for i, v in zip(self.abi["outputs"], decode(self.output_types, data))]
+        if len(values) == 1:
+            return values[0]
+        return tuple(values)
+
+    def call(self, *args, block_identifier="latest"):
+        args, tx = _split_tx(args)
+        sender = (tx or {}).get("from", self.contract.chain.tester.get_accounts()[0])
+        params = {"from": to_checksum_address(str(sender)), "to": self.contract.address, "data": "0x" + self.encode_input(*args).hex(), "gas": self.contract.chain.gas_limit, "gas_price": 0}
+        if tx and tx.get("value"):
+            params["value"] = to_wei(tx["value"])
+        try:
+            data = self.contract.chain.tester.call(params, block_identifier)
+        except TransactionFailed as exc:
+            raise VirtualMachineError(f"revert: {exc}", exc.args[0] if exc.args else None) from None
+        return self.decode_output(data if isinstance(data, bytes) else bytes.fromhex(data.removeprefix("0x")))
+
+    def transact(self, *args):
+        args, tx = _split_tx(args)
+        if tx is None:
+            raise ValueError(f"{self.abi['name']} is not a view function, pass a transaction dict as the final argument")
+        data = self.encode_input(*args)
+        return_value = self.call(*args, tx) if self.output_types else None
+        receipt = _send(self.contract.chain, dict(tx, to=self.contract.address), data)
+        receipt.return_value = return_value
+        return receipt
+
+    def __call__(self, *args):
+        if self.abi["stateMutability"] in ("view", "pure"):
+            return self.call(*args)
+        return self.transact(*args)
+
+
+class OverloadedMethod:
+    """
+    Contract method with several ABI entries, such as a Vyper function with default arguments
+    """
+
+    def __init__(self, methods):
+        self.methods = {len(i.input_types): i for i in methods}
+        self.abi = methods[0].abi
+
+    def _select(self, args):
+        args, _ = _split_tx(args)
+        try:
+            return self.methods[len(args)]
+        except KeyError:
+            raise ValueError(f"{self.abi['name']} has no overload taking {len(args)} arguments") from None
+
+    def call(self, *args, **kwargs):
+        return self._select(args).call(*args, **kwargs)
+
+    def transact(self, *args):
+        return self._select(args).transact(*args)
+
+    def encode_input(self, *args):
+        return self._select(args).encode_input(*args)
+
+    def __call__(self, *args):
+        return self._select(args)(*args)
+
+
+class Contract(str):
+    def __new__(cls, address, abi, chain):
+        contract = super().__new__(cls, to_checksum_address(address))
+        contract.abi = abi
+        contract.chain = chain
+        methods = {}
+        for item in abi:
+            if item["type"] == "function":
+                methods.setdefault(item["name"], []).append(ContractMethod(contract, item))
+        contract._methods = {k: v[0] if len(v) == 1 else OverloadedMethod(v) for k, v in methods.items()}
+        return contract
+
+    @property
+    def address(self):
+        return str(self)
+
+    def balance(self):
+        return Wei(self.chain.tester.get_balance(self))
+
+    def __getattr__(self, name):
+        try:
+            return self._methods[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __dir__(self):
+        return list(super().__dir__()) + list(self._methods)
+
+
+class ContractContainer(list):
+    def __init__(self, artifact, chain):
+        super().__init__()
+        self._name = artifact["contractName"]
+        self.abi = artifact["abi"]
+        self.bytecode = bytes.fromhex(artifact["bytecode"].removeprefix("0x"))
+        self.chain = chain
+        chain.register_events(self.abi)
+        constructor = next((i for i in self.abi if i["type"] == "constructor"), {"inputs": []})
+        self._constructor_types = [abi_type(i) for i in constructor["inputs"]]
+
+    def deploy(self, *args):
+        args, tx = _split_tx(args)
+        values = [_format_input(t, v) for t, v in zip(self._constructor_types, args)]
+        receipt = _send(self.chain, tx, self.bytecode + encode(self._constructor_types, values))
+        contract = Contract(receipt.contract_address, self.abi, self.chain)
+        contract.tx = receipt
+        self.append(contract)
+        return contract
+
+    def at(self, address):
+        return Contract(address, self.abi, self.chain)
+
+
+# Reverts
+
+
+class reverts:
+    def __init__(self, revert_msg=None):
+        self.revert_msg = revert_msg
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            raise AssertionError("Transaction did not revert")
+        if exc_type is not VirtualMachineError:
+            return False
+        if self.revert_msg is not None and self.revert_msg not in str(exc_value):
+            raise AssertionError(f"Unexpected revert string: {exc_value}") from None
+        return True
+
+
+# Brownie Module
+
+
+def brownie_module():
+    """
+    Builds a stand-in for the brownie module on a fresh chain with every project contract
+    """
+    chain = Chain()
+    containers = {name: ContractContainer(artifact, chain) for name, artifact in compile_project().items()}
+    module = types.ModuleType("brownie")
+    module.accounts = Accounts(chain)
+    module.chain = chain
+    module.web3 = chain.web3()
+    module.reverts = reverts
+    module.Wei = Wei
+    module.exceptions = types.SimpleNamespace(VirtualMachineError=VirtualMachineError)
+    for name, container in containers.items():
+        setattr(module, name, container)
+    module.__all__ = ["accounts", "chain", "web3", "reverts", "Wei", *containers]
+    return module
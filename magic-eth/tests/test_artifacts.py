@@ -0,0 +1,70 @@
+import json
+
+import pytest
+from eth_utils import keccak
+
+import brownie
+from brownie import *
+
+from magic_bank import artifacts
+from magic_bank.contracts import is_current
+from magic_bank.artifacts.build import build
+
+
+@pytest.fixture(scope="module")
+def bundle_path(tmp_path_factory):
+    # Compiling is slow, so the bundle is built once for the module
+    path = tmp_path_factory.mktemp("artifacts")
+    build(path, ["Token", "BorrowWand", "AggregatorV3Interface"])
+    return path
+
+
+def test_artifact_keeps_only_what_services_need(bundle_path):
+    artifact = json.loads((bundle_path / "Token.json").read_text())
+    assert set(artifact) == {
+        "version", "contractName", "sourcePath", "sha1", "compiler", "abi", "bytecode", "deployedBytecodeHash", "selectors"
+    }
+    assert artifact["version"] == artifacts.FORMAT_VERSION
+    assert artifact["selectors"]["transfer(address,uint256)"] == "0xa9059cbb"
+
+
+def test_artifact_matches_deployed_contract(bundle_path, usd_token, usd_wand, web3):
+    for name, contract in (("Token", usd_token), ("BorrowWand", usd_wand)):
+        artifact = json.loads((bundle_path / f"{name}.json").read_text())
+        code = bytes(web3.eth.get_code(contract.address))
+        assert artifact["deployedBytecodeHash"] == "0x" + keccak(code).hex().removeprefix("0x")
+        assert artifact["abi"] == contract.abi
+
+
+def test_loader_reads_each_artifact_once(bundle_path, monkeypatch):
+    monkeypatch.setattr(artifacts, "ARTIFACTS_PATH", bundle_path)
+    artifacts.load.cache_clear()
+    try:
+        assert artifacts.available("AggregatorV3Interface")
+        assert not artifacts.available("StabilityPool")
+        assert artifacts.abi("AggregatorV3Interface") is artifacts.abi("AggregatorV3Interface")
+        assert "latestRoundData()" in artifacts.selectors("AggregatorV3Interface")
+        with pytest.raises(FileNotFoundError):
+            artifacts.load("StabilityPool")
+    finally:
+        artifacts.load.cache_clear()
+
+
+def test_loader_treats_other_format_as_missing(bundle_path, monkeypatch):
+    artifact = json.loads((bundle_path / "Token.json").read_text())
+    (bundle_path / "Old.json").write_text(json.dumps(dict(artifact, version=artifacts.FORMAT_VERSION - 1)))
+    monkeypatch.setattr(artifacts, "ARTIFACTS_PATH", bundle_path)
+    artifacts.load.cache_clear()
+    try:
+        assert not artifacts.available("Old")
+        with pytest.raises(FileNotFoundError):
+            artifacts.load("Old")
+    finally:
+        artifacts.load.cache_clear()
+
+
+def test_committed_bundle_matches_sources():
+    # Rebuild with `python -m magic_bank.artifacts.build` after changing a contract
+    for name in artifacts.SOURCES:
+        assert artifacts.available(name)
+        assert is_current(artifacts.load(name)), f"{name}.json is stale"
@@ -0,0 +1,161 @@
+import asyncio
+
+import pytest
+
+import brownie
+from brownie import *
+
+from magic_bank.client import (
+    AsyncMagicBank,
+    Deposit,
+    HttpTransport,
+    Loan,
+    MagicBank,
+    RoundData,
+    RpcError,
+    contract_call,
+    throughput,
+)
+
+
+class ProviderTransport:
+    # Answers JSON-RPC batches one request at a time through the web3 provider, and counts the batches
+    def __init__(self, web3):
+        self.provider = web3.provider
+        self.batches = []
+
+    def send(self, payload):
+        self.batches.append(len(payload))
+        responses = []
+        for request in payload:
+            response = dict(self.provider.make_request(request["method"], request["params"]))
+            response["id"] = request["id"]
+            responses.append(response)
+        # Nodes may answer a batch in any order
+        return responses[::-1]
+
+
+class AsyncProviderTransport(ProviderTransport):
+    async def send(self, payload):
+        return super().send(payload)
+
+
+def open_client_loans(token, usd_wand, accounts):
+    for i in range(3):
+        amount = 1e20 + 5e19 * i
+        if i > 0:
+            token.transfer(accounts[i], amount, {"from": accounts[0]})
+        token.approve(usd_wand, amount, {"from": accounts[i]})
+        usd_wand.open_loan(amount, 2e21, {"from": accounts[i]})
+
+
+def test_connect_reads_wand_addresses(token, usd_token, usd_wand, usd_stability_pool, eth_oracle):
+    bank = MagicBank.connect(ProviderTransport(web3), usd_wand.address)
+    assert bank.stability_pool == usd_stability_pool.address
+    assert bank.stablecoin == usd_token.address
+    assert bank.collateral == token.address
+    assert bank.price_feed == eth_oracle.address
+    assert bank.rpc.transport.batches == [4]
+
+
+def test_loans_match_loan_of(token, usd_wand, accounts):
+    open_client_loans(token, usd_wand, accounts)
+
+    bank = MagicBank.connect(ProviderTransport(web3), usd_wand.address)
+    loans = bank.loans(accounts[:4])
+    assert loans[3] == Loan(0, 0, False)
+    for i in range(3):
+        loan = usd_wand.loan_of(accounts[i])
+        assert loans[i] == Loan(loan["collateral_value"], loan["debt_value"], True)
+
+
+def test_deposits_match_stability_pool(token, usd_token, usd_wand, usd_stability_pool, accounts):
+    amount = 10 ** 18 * 2000
+    usd_token.transfer(accounts[1], amount, {"from": accounts[0]})
+    usd_token.approve(usd_stability_pool, amount, {"from": accounts[1]})
+    usd_stability_pool.open_deposit(amount, {"from": accounts[1]})
+    usd_stability_pool.update_values(amount / 2, 1e19, {"from": usd_wand})
+
+    bank = MagicBank.connect(ProviderTransport(web3), usd_wand.address)
+    deposits = bank.deposits([accounts[1], accounts[2]])
+    assert deposits[0] == Deposit(
+        True,
+        amount,
+        usd_stability_pool.get_compounded_stablecoin(accounts[1]),
+        usd_stability_pool.get_collateral_gain(accounts[1]),
+    )
+    assert deposits[1] == Deposit(False, 0, 0, 0)
+    assert bank.rpc.transport.batches == [4, 1]
+
+
+def test_balances_and_latest_round(token, usd_token, usd_wand, eth_oracle, accounts):
+    bank = MagicBank.connect(ProviderTransport(web3), usd_wand.address)
+    assert bank.stablecoin_balances(accounts[:2]) == [usd_token.balanceOf(accounts[0]), usd_token.balanceOf(accounts[1])]
+    assert bank.collateral_balances(accounts[:2]) == [token.balanceOf(accounts[0]), token.balanceOf(accounts[1])]
+    assert bank.latest_round() == RoundData(*eth_oracle.latestRoundData())
+
+
+def test_loans_are_read_in_one_view_call(token, usd_wand, accounts):
+    open_client_loans(token, usd_wand, accounts)
+
+    bank = MagicBank.connect(ProviderTransport(web3), usd_wand.address)
+    assert bank.loans(accounts[:10]) == [Loan(*i) for i in usd_wand.loans_of(accounts[:10])]
+    assert bank.rpc.transport.batches == [4, 1]
+
+
+def test_calls_are_split_into_views_and_batches(usd_wand, accounts):
+    # 10 users in views of 3 make 4 loans_of calls, sent in batches of 2
+    bank = MagicBank.connect(ProviderTransport(web3), usd_wand.address, batch_size=2, view_batch=3)
+    loans = bank.loans(accounts[:10])
+    assert loans == [Loan(0, 0, False)] * 10
+    assert bank.rpc.transport.batches == [2, 2, 2, 2]
+
+
+def test_call_many_reads_other_contracts(wand, usd_wand, accounts):
+    bank = MagicBank.connect(ProviderTransport(web3), usd_wand.address)
+    calls = [contract_call("SwapWand", wand.address, "stablecoin"), contract_call("BorrowWand", usd_wand.address, "max_price_age")]
+    assert bank.call_many(calls) == [wand.stablecoin(), usd_wand.max_price_age()]
+
+
+class RevertingTransport(ProviderTransport):
+    # Answers every request with the JSON-RPC error a node returns for a revert
+    def send(self, payload):
+        return [{"jsonrpc": "2.0", "id": i["id"], "error": {"code": 3, "message": "execution reverted"}} for i in payload]
+
+
+def test_error_response_raises_rpc_error(usd_wand):
+    bank = MagicBank.connect(ProviderTransport(web3), usd_wand.address)
+    bank.rpc.transport = RevertingTransport(web3)
+    with pytest.raises(RpcError, match="loans_of: execution reverted"):
+        bank.loans([usd_wand.address])
+
+
+def test_async_client_matches_sync(token, usd_wand, accounts):
+    open_client_loans(token, usd_wand, accounts)
+    sync_bank = MagicBank.connect(ProviderTransport(web3), usd_wand.address)
+
+    async def read():
+        bank = await AsyncMagicBank.connect(AsyncProviderTransport(web3), usd_wand.address, batch_size=2, view_batch=2)
+        return await bank.loans(accounts[:5]), await bank.latest_round(), bank.rpc.transport.batches
+
+    loans, round_data, batches = asyncio.run(read())
+    assert loans == sync_bank.loans(accounts[:5])
+    assert round_data == sync_bank.latest_round()
+    assert batches == [2, 2, 2, 1, 1]
+
+
+def test_batched_throughput_over_http(usd_wand, accounts):
+    # Only the brownie backend runs a node over HTTP
+    url = getattr(web3.provider, "endpoint_uri", None)
+    if not url or not str(url).startswith("http"):
+        pytest.skip("The test backend has no HTTP node")
+
+    transport = HttpTransport(str(url))
+    bank = MagicBank.connect(transport, usd_wand.address)
+    users = [accounts[i % len(accounts)] for i in range(200)]
+    calls = [contract_call("BorrowWand", usd_wand.address, "loan_of", user.address) for user in users]
+    single = throughput(lambda: [bank.rpc.call(call) for call in calls], len(users))
+    batched = throughput(lambda: bank.loans(users), len(users))
+    transport.close()
+    print(f"\nLoans over HTTP: {single:.0f} loans/s single, {batched:.0f} loans/s batched")
+    assert batched > single
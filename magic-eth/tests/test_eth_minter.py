@@ -39,6 +39,46 @@ def test_token_mint_with_0_value(wand, accounts):
         wand.mint({"from": accounts[0], "value": "0 ether"})
 
 
+# mint_to_many Function
+
+
+def test_token_balances_update_on_mint_to_many_with_no_mint_fee(token, wand, accounts):
+    init_bals = [token.balanceOf(accounts[1]), token.balanceOf(accounts[2])]
+
+    wand.mint_to_many([accounts[1], accounts[2]], [1e18, 2e18], {"from": accounts[0], "value": "3 ether"})
+    assert token.balanceOf(accounts[1]) == init_bals[0] + 1e18
+    assert token.balanceOf(accounts[2]) == init_bals[1] + 2e18
+
+
+def test_token_balances_update_on_mint_to_many_with_mint_fee(token, wand, accounts):
+    init_bals = [token.balanceOf(accounts[1]), token.balanceOf(accounts[2]), token.balanceOf(accounts[3])]
+
+    wand.set_rewards(accounts[3], {"from": token.deployer()})
+    wand.mint_to_many([accounts[1], accounts[2]], [1e18, 2e18], {"from": accounts[0], "value": "3 ether"})
+    assert token.balanceOf(accounts[1]) == init_bals[0] + 1e18 * 199 / 200
+    assert token.balanceOf(accounts[2]) == init_bals[1] + 2e18 * 199 / 200
+    assert token.balanceOf(accounts[3]) == init_bals[2] + 3e18 / 200
+
+
+def test_token_total_supply_updates_on_mint_to_many(token, wand, accounts):
+    init_supply = token.totalSupply()
+
+    wand.set_rewards(accounts[3], {"from": token.deployer()})
+    wand.mint_to_many([accounts[1], accounts[2]], [1e18, 2e18], {"from": accounts[0], "value": "3 ether"})
+    assert token.totalSupply() == init_supply + 3e18
+    assert wand.collateral_value() == 3e18
+
+
+def test_token_mint_to_many_with_value_mismatch(wand, accounts):
+    with brownie.reverts("Value mismatch"):
+        wand.mint_to_many([accounts[1], accounts[2]], [1e18, 2e18], {"from": accounts[0], "value": "2 ether"})
+
+
+def test_token_mint_to_many_with_length_mismatch(wand, accounts):
+    with brownie.reverts("Length mismatch"):
+        wand.mint_to_many([accounts[1], accounts[2]], [1e18], {"from": accounts[0], "value": "1 ether"})
+
+
 # redeem Function
 
 
@@ -74,6 +114,27 @@ def test_token_redeem_with_insufficient_balance(wand, accounts):
         wand.redeem(amount * 2, {"from": accounts[0]})
 
 
+# redeem_to Function
+
+
+def test_token_and_eth_balances_update_on_redeem_to(token, wand, accounts):
+    init_bal = token.balanceOf(accounts[0])
+
+    wand.mint({"from": accounts[0], "value": "1 ether"})
+    init_eth_bal = accounts[1].balance()
+    wand.redeem_to(accounts[1], 1e18, {"from": accounts[0]})
+    assert token.balanceOf(accounts[0]) == init_bal
+    assert accounts[1].balance() == init_eth_bal + 1e18
+    assert wand.collateral_value() == 0
+
+
+def test_token_redeem_to_with_insufficient_balance(wand, accounts):
+    # Account 2 holds no stablecoins
+    wand.mint({"from": accounts[1], "value": "1 ether"})
+    with brownie.reverts():
+        wand.redeem_to(accounts[2], 1e18, {"from": accounts[2]})
+
+
 # set_wand Function
 
 
@@ -0,0 +1,177 @@
+import brownie
+from brownie import *
+
+# Records gas used per function in reports/gas.json, and checks it against tests/gas_baseline.<backend>.json
+
+
+# BorrowWand Functions
+
+
+def test_open_loan_gas(token, usd_wand, accounts, gas_report):
+    token.approve(usd_wand, 1e20, {"from": accounts[0]})
+    tx = usd_wand.open_loan(1e20, 2e21, {"from": accounts[0]})
+    gas_report["BorrowWand.open_loan"] = tx.gas_used
+
+
+def test_open_loan_with_permit_gas(token, usd_wand, accounts, sign_permit, gas_report):
+    user = accounts.add()
+    token.transfer(user, 1e20, {"from": accounts[0]})
+    deadline, v, r, s = sign_permit(token, user, usd_wand, 1e20)
+    tx = usd_wand.open_loan_with_permit(1e20, 2e21, deadline, v, r, s, {"from": user})
+    gas_report["BorrowWand.open_loan_with_permit"] = tx.gas_used
+
+
+def test_approve_and_open_loan_gas(token, usd_wand, accounts, gas_report):
+    # What opening a loan cost a new user before open_loan_with_permit
+    user = accounts.add()
+    token.transfer(user, 1e20, {"from": accounts[0]})
+    approve_tx = token.approve(usd_wand, 1e20, {"from": user})
+    open_tx = usd_wand.open_loan(1e20, 2e21, {"from": user})
+    gas_report["BorrowWand.approve_and_open_loan"] = approve_tx.gas_used + open_tx.gas_used
+
+
+def test_close_loan_gas(token, usd_wand, accounts, gas_report):
+    token.approve(usd_wand, 1e20, {"from": accounts[0]})
+    usd_wand.set_rewards(accounts[0], {"from": usd_wand.deployer()})
+    usd_wand.open_loan(1e20, 2e21, {"from": accounts[0]})
+    tx = usd_wand.close_loan({"from": accounts[0]})
+    gas_report["BorrowWand.close_loan"] = tx.gas_used
+
+
+def test_deposit_collateral_gas(token, usd_wand, accounts, gas_report):
+    token.approve(usd_wand, 1e20 + 1e18, {"from": accounts[0]})
+    usd_wand.open_loan(1e20, 2e21, {"from": accounts[0]})
+    tx = usd_wand.deposit_collateral(1e18, {"from": accounts[0]})
+    gas_report["BorrowWand.deposit_collateral"] = tx.gas_used
+
+
+def test_withdraw_collateral_gas(token, usd_wand, accounts, gas_report):
+    token.approve(usd_wand, 1e21, {"from": accounts[0]})
+    usd_wand.open_loan(1e21, 2e21, {"from": accounts[0]})
+    tx = usd_wand.withdraw_collateral(1e18, {"from": accounts[0]})
+    gas_report["BorrowWand.withdraw_collateral"] = tx.gas_used
+
+
+def test_borrow_stablecoin_gas(token, usd_wand, accounts, gas_report):
+    token.approve(usd_wand, 1e21, {"from": accounts[0]})
+    usd_wand.open_loan(1e21, 2e21, {"from": accounts[0]})
+    tx = usd_wand.borrow_stablecoin(1e21, {"from": accounts[0]})
+    gas_report["BorrowWand.borrow_stablecoin"] = tx.gas_used
+
+
+def test_repay_stablecoin_gas(token, usd_wand, accounts, gas_report):
+    token.approve(usd_wand, 1e21, {"from": accounts[0]})
+    usd_wand.open_loan(1e21, 5e21, {"from": accounts[0]})
+    tx = usd_wand.repay_stablecoin(1e21, {"from": accounts[0]})
+    gas_report["BorrowWand.repay_stablecoin"] = tx.gas_used
+
+
+def test_liquidate_gas(token, usd_token, usd_wand, usd_stability_pool, eth_oracle, accounts, gas_report):
+    token.approve(usd_wand, 1e21, {"from": accounts[0]})
+    usd_wand.open_loan(1e21, 5e21, {"from": accounts[0]})
+
+    usd_token.mintTo(accounts[1], 1e24, {"from": usd_wand})
+    usd_token.approve(usd_stability_pool, 1e24, {"from": accounts[1]})
+    usd_stability_pool.open_deposit(1e24, {"from": accounts[1]})
+
+    eth_oracle.setCurrentPrice(1e18, {"from": eth_oracle.deployer()})
+    tx = usd_wand.liquidate(accounts[0], {"from": accounts[2]})
+    gas_report["BorrowWand.liquidate"] = tx.gas_used
+
+
+def test_refresh_collateral_price_gas(usd_wand, accounts, gas_report):
+    tx = usd_wand.refresh_collateral_price({"from": accounts[0]})
+    gas_report["BorrowWand.refresh_collateral_price"] = tx.gas_used
+
+
+def test_cached_collateral_price_gas(usd_wand, SameBlockCaller, accounts, gas_report):
+    # The first read in a block calls the oracle and fills the cache, the second only reads the cache
+    caller = SameBlockCaller.deploy({"from": accounts[0]})
+    tx = caller.refresh_twice(usd_wand, {"from": accounts[0]})
+    gas_report["BorrowWand.refresh_collateral_price[oracle]"] = tx.events["PriceReads"]["first_gas"]
+    gas_report["BorrowWand.refresh_collateral_price[cached]"] = tx.events["PriceReads"]["second_gas"]
+
+
+# StabilityPool Functions
+
+
+def open_deposit_with_gain(token, usd_token, usd_wand, usd_stability_pool, accounts):
+    # A deposit that absorbed half of a liquidation, so settling it pays out collateral
+    amount = 10 ** 18 * 8000
+    usd_token.approve(usd_stability_pool, amount * 3, {"from": accounts[0]})
+    usd_stability_pool.open_deposit(amount, {"from": accounts[0]})
+    usd_stability_pool.update_values(amount / 2, 1e18, {"from": usd_wand})
+    token.mintTo(usd_stability_pool, 1e18, {"from": token.wand()})
+    return amount
+
+
+def test_open_deposit_gas(usd_token, usd_stability_pool, accounts, gas_report):
+    usd_token.approve(usd_stability_pool, 10 ** 18 * 8000, {"from": accounts[0]})
+    tx = usd_stability_pool.open_deposit(10 ** 18 * 8000, {"from": accounts[0]})
+    gas_report["StabilityPool.open_deposit"] = tx.gas_used
+
+
+def test_add_to_deposit_gas(token, usd_token, usd_wand, usd_stability_pool, accounts, gas_report):
+    amount = open_deposit_with_gain(token, usd_token, usd_wand, usd_stability_pool, accounts)
+    tx = usd_stability_pool.add_to_deposit(amount, {"from": accounts[0]})
+    gas_report["StabilityPool.add_to_deposit"] = tx.gas_used
+
+
+def test_withdraw_from_deposit_gas(token, usd_token, usd_wand, usd_stability_pool, accounts, gas_report):
+    open_deposit_with_gain(token, usd_token, usd_wand, usd_stability_pool, accounts)
+    tx = usd_stability_pool.withdraw_from_deposit(1e18, {"from": accounts[0]})
+    gas_report["StabilityPool.withdraw_from_deposit"] = tx.gas_used
+
+
+def test_claim_collateral_gas(token, usd_token, usd_wand, usd_stability_pool, accounts, gas_report):
+    open_deposit_with_gain(token, usd_token, usd_wand, usd_stability_pool, accounts)
+    tx = usd_stability_pool.claim_collateral({"from": accounts[0]})
+    gas_report["StabilityPool.claim_collateral"] = tx.gas_used
+
+
+def test_close_and_reopen_deposit_gas(token, usd_token, usd_wand, usd_stability_pool, accounts, gas_report):
+    # What topping up a deposit cost before add_to_deposit
+    amount = open_deposit_with_gain(token, usd_token, usd_wand, usd_stability_pool, accounts)
+    close_tx = usd_stability_pool.close_deposit({"from": accounts[0]})
+    open_tx = usd_stability_pool.open_deposit(amount * 3 / 2, {"from": accounts[0]})
+    gas_report["StabilityPool.close_and_reopen_deposit"] = close_tx.gas_used + open_tx.gas_used
+
+
+# Token Functions
+
+
+def test_transfer_gas(token, accounts, gas_report):
+    tx = token.transfer(accounts[1], 1e18, {"from": accounts[0]})
+    gas_report["Token.transfer"] = tx.gas_used
+
+
+def test_transfer_from_gas(token, accounts, gas_report):
+    token.approve(accounts[1], 1e18, {"from": accounts[0]})
+    tx = token.transferFrom(accounts[0], accounts[2], 1e18, {"from": accounts[1]})
+    gas_report["Token.transferFrom"] = tx.gas_used
+
+
+# SwapWand Functions
+
+
+def test_mint_gas(wand, accounts, gas_report):
+    tx = wand.mint({"from": accounts[0], "value": 1e18})
+    gas_report["SwapWand.mint"] = tx.gas_used
+
+
+def test_mint_with_fee_gas(wand, accounts, gas_report):
+    wand.set_rewards(accounts[1], {"from": wand.deployer()})
+    tx = wand.mint({"from": accounts[0], "value": 1e18})
+    gas_report["SwapWand.mint_with_fee"] = tx.gas_used
+
+
+def test_mint_to_many_gas(wand, accounts, gas_report):
+    wand.set_rewards(accounts[1], {"from": wand.deployer()})
+    tx = wand.mint_to_many(accounts[2:7], [2e17] * 5, {"from": accounts[0], "value": 1e18})
+    gas_report["SwapWand.mint_to_many[5]"] = tx.gas_used
+
+
+def test_redeem_gas(wand, accounts, gas_report):
+    wand.mint({"from": accounts[0], "value": 1e18})
+    tx = wand.redeem(1e17, {"from": accounts[0]})
+    gas_report["SwapWand.redeem"] = tx.gas_used
@@ -0,0 +1,96 @@
+import os
+
+import brownie
+import pytest
+from brownie import *
+
+# Gas scaling with the number of borrowers and depositors, recorded as "<Contract>.<function>[<count>]"
+# and as "StabilityPool.update_values[<partial or full absorption>,<count>]"
+# Set GAS_BENCH_SIZES=1,10,100,1000 to include the slow 1,000 user scenarios
+
+SIZES = [int(size) for size in os.environ.get("GAS_BENCH_SIZES", "1,10,100").split(",")]
+
+ZERO_ADDRESS = "0x" + "0" * 40
+
+# Debt of a loan opened with 2e21, including borrow fee and liquidation reserve
+LOAN_DEBT = 2 * 10 ** 21 * 201 // 200 + 2 * 10 ** 20
+
+
+def make_users(accounts, count):
+    # Use the default accounts first, then generate more, the development network has a zero gas price
+    users = list(accounts[1:10])[:count]
+    while len(users) < count:
+        users.append(accounts.add())
+    return users
+
+
+def open_positions(token, usd_token, usd_wand, usd_stability_pool, accounts, count):
+    # Every user opens a loan with a slightly higher ratio than the last, then deposits the stablecoins
+    users = make_users(accounts, count + 1)
+    for i, user in enumerate(users[:count]):
+        collateral = 10 ** 19 + i * 10 ** 16
+        token.mintTo(user, collateral, {"from": accounts[0]})
+        token.approve(usd_wand, collateral, {"from": user})
+        usd_wand.open_loan(collateral, 2e21, usd_wand.highest_loan(), ZERO_ADDRESS, {"from": user})
+        usd_token.approve(usd_stability_pool, 2e21, {"from": user})
+        usd_stability_pool.open_deposit(2e21, {"from": user})
+    # Account 0 backs every liquidation
+    usd_token.approve(usd_stability_pool, 1e23, {"from": accounts[0]})
+    usd_stability_pool.open_deposit(1e23, {"from": accounts[0]})
+    # The last user is left without positions
+    return users
+
+
+@pytest.mark.parametrize("count", SIZES)
+def test_loan_gas_scaling(count, token, usd_token, usd_wand, usd_stability_pool, eth_oracle, accounts, gas_report):
+    users = open_positions(token, usd_token, usd_wand, usd_stability_pool, accounts, count)
+    user = users[-1]
+
+    # Open A Loan In The Middle Of The Sorted List
+    collateral = 10 ** 19 + count // 2 * 10 ** 16 + 5 * 10 ** 15
+    token.mintTo(user, collateral + 10 ** 15, {"from": accounts[0]})
+    token.approve(usd_wand, collateral + 10 ** 15, {"from": user})
+    hints = usd_wand.find_insert_position(collateral, LOAN_DEBT, ZERO_ADDRESS, ZERO_ADDRESS)
+    tx = usd_wand.open_loan(collateral, 2e21, *hints, {"from": user})
+    gas_report[f"BorrowWand.open_loan[{count}]"] = tx.gas_used
+
+    # Small Updates Keep The Loan Between Its Neighbours
+    hints = (usd_wand.prev_loan(user), usd_wand.next_loan(user))
+    tx = usd_wand.deposit_collateral(10 ** 15, *hints, {"from": user})
+    gas_report[f"BorrowWand.deposit_collateral[{count}]"] = tx.gas_used
+    tx = usd_wand.withdraw_collateral(10 ** 15, *hints, {"from": user})
+    gas_report[f"BorrowWand.withdraw_collateral[{count}]"] = tx.gas_used
+    tx = usd_wand.borrow_stablecoin(1e18, *hints, {"from": user})
+    gas_report[f"BorrowWand.borrow_stablecoin[{count}]"] = tx.gas_used
+    tx = usd_wand.repay_stablecoin(1e18, *hints, {"from": user})
+    gas_report[f"BorrowWand.repay_stablecoin[{count}]"] = tx.gas_used
+
+    # At 2.4e20 The Lowest 13 Loans Can Be Liquidated
+    eth_oracle.setCurrentPrice(2.4e20, {"from": eth_oracle.deployer()})
+    tx = usd_wand.liquidate(usd_wand.lowest_loan(), {"from": accounts[0]})
+    gas_report[f"BorrowWand.liquidate[{count}]"] = tx.gas_used
+    tx = usd_wand.liquidate_lowest(10, {"from": accounts[0]})
+    gas_report[f"BorrowWand.liquidate_lowest[{count}]"] = tx.gas_used
+
+
+@pytest.mark.parametrize("count", SIZES)
+def test_pool_gas_scaling(count, token, usd_token, usd_wand, usd_stability_pool, accounts, gas_report):
+    users = open_positions(token, usd_token, usd_wand, usd_stability_pool, accounts, count)
+    user = users[-1]
+
+    usd_token.transfer(user, 2e21, {"from": accounts[0]})
+    usd_token.approve(usd_stability_pool, 2e21, {"from": user})
+    tx = usd_stability_pool.open_deposit(2e21, {"from": user})
+    gas_report[f"StabilityPool.open_deposit[{count}]"] = tx.gas_used
+
+    # Partial Absorption Leaves Every Deposit Half Used
+    token.mintTo(usd_stability_pool, 1e18, {"from": accounts[0]})
+    tx = usd_stability_pool.update_values(usd_stability_pool.total_stablecoin() // 2, 1e18, {"from": usd_wand})
+    gas_report[f"StabilityPool.update_values[partial,{count}]"] = tx.gas_used
+
+    tx = usd_stability_pool.close_deposit({"from": user})
+    gas_report[f"StabilityPool.close_deposit[{count}]"] = tx.gas_used
+
+    # Full Absorption Empties The Pool And Starts A New Epoch
+    tx = usd_stability_pool.update_values(usd_stability_pool.total_stablecoin(), 0, {"from": usd_wand})
+    gas_report[f"StabilityPool.update_values[full,{count}]"] = tx.gas_used
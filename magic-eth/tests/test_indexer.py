@@ -0,0 +1,196 @@
+import brownie
+from brownie import *
+
+from magic_bank.indexer import Indexer, debt_by_ratio_bucket, pool_utilisation
+
+
+def seed_system(token, usd_token, usd_wand, usd_stability_pool, accounts):
+    # Accounts 0, 1 and 2 open Loans with the same debt and increasing collateral, account 4 funds the pool
+    for i in range(3):
+        if i > 0:
+            token.transfer(accounts[i], 1e20 * (i + 1), {"from": accounts[0]})
+        token.approve(usd_wand, 1e20 * (i + 1), {"from": accounts[i]})
+        usd_wand.open_loan(1e20 * (i + 1), 2e21, {"from": accounts[i]})
+
+    usd_token.mintTo(accounts[4], 1e24, {"from": usd_wand})
+    usd_token.approve(usd_stability_pool, 1e24, {"from": accounts[4]})
+    usd_stability_pool.open_deposit(1e24, {"from": accounts[4]})
+
+
+class FlakyWeb3:
+    # Rejects eth_getLogs over more than max_range blocks, like a rate limited node
+    def __init__(self, web3, max_range):
+        self.eth = self
+        self._web3 = web3
+        self.max_range = max_range
+        self.failures = 0
+
+    def __getattr__(self, name):
+        return getattr(self._web3.eth, name)
+
+    def get_logs(self, params):
+        if params["toBlock"] - params["fromBlock"] + 1 > self.max_range:
+            self.failures += 1
+            raise ValueError("query returned more than 10000 results")
+        return self._web3.eth.get_logs(params)
+
+
+def test_indexer_writes_loan_deposit_and_transfer_history(token, usd_token, usd_wand, usd_stability_pool, eth_oracle, accounts, tmp_path):
+    seed_system(token, usd_token, usd_wand, usd_stability_pool, accounts)
+    eth_oracle.setCurrentPrice(1e19, {"from": eth_oracle.deployer()})
+    usd_wand.liquidate(accounts[0], {"from": accounts[3]})
+
+    indexer = Indexer(web3, usd_wand.address, tmp_path / "index.sqlite")
+    assert indexer.sync() > 0
+    db = indexer.db
+
+    assert db.execute("SELECT event, user FROM loan_events ORDER BY block, log_index").fetchall() == [
+        ("LoanOpened", accounts[0]),
+        ("LoanOpened", accounts[1]),
+        ("LoanOpened", accounts[2]),
+        ("Liquidated", accounts[0]),
+    ]
+    assert [e for (e,) in db.execute("SELECT event FROM deposit_events ORDER BY block, log_index")] == ["DepositOpened", "PoolAbsorbed"]
+    assert db.execute("SELECT COUNT(*) FROM transfers").fetchone()[0] > 0
+
+    # Open Loans Match The Contract
+    loans = {user: (int(c), int(d)) for user, c, d in db.execute("SELECT user, collateral_value, debt_value FROM loans")}
+    assert set(loans) == {accounts[1], accounts[2]}
+    for user, loan in loans.items():
+        assert loan == tuple(usd_wand.loan_of(user)[:2])
+    assert indexer.total_debt == usd_wand.total_debt()
+    assert indexer.total_stablecoin == usd_stability_pool.total_stablecoin()
+
+
+def test_indexer_resumes_from_checkpoint(token, usd_token, usd_wand, usd_stability_pool, accounts, tmp_path):
+    seed_system(token, usd_token, usd_wand, usd_stability_pool, accounts)
+
+    indexer = Indexer(web3, usd_wand.address, tmp_path / "index.sqlite")
+    indexer.sync()
+    indexer.close()
+
+    usd_token.transfer(accounts[2], 1e21, {"from": accounts[0]})
+    usd_token.approve(usd_wand, 1e22, {"from": accounts[2]})
+    usd_wand.close_loan({"from": accounts[2]})
+
+    indexer = Indexer(web3, usd_wand.address, tmp_path / "index.sqlite")
+    indexer.sync()
+    db = indexer.db
+    assert db.execute("SELECT COUNT(*) FROM loan_events").fetchone()[0] == 4
+    assert db.execute("SELECT COUNT(*) FROM loan_events WHERE event = 'LoanClosed'").fetchone()[0] == 1
+    assert {user for (user,) in db.execute("SELECT user FROM loans")} == {accounts[0], accounts[1]}
+    assert indexer.total_debt == usd_wand.total_debt()
+
+
+def test_indexer_shrinks_rejected_block_ranges(token, usd_token, usd_wand, usd_stability_pool, accounts, tmp_path):
+    seed_system(token, usd_token, usd_wand, usd_stability_pool, accounts)
+
+    flaky = FlakyWeb3(web3, 4)
+    indexer = Indexer(flaky, usd_wand.address, tmp_path / "flaky.sqlite", chunk_size=64)
+    indexer.sync()
+    assert flaky.failures > 0
+    assert indexer.chunk_size <= 4
+
+    reference = Indexer(web3, usd_wand.address, tmp_path / "reference.sqlite")
+    reference.sync()
+    for table in ("loan_events", "deposit_events", "transfers"):
+        query = f"SELECT * FROM {table} ORDER BY block, log_index"
+        assert indexer.db.execute(query).fetchall() == reference.db.execute(query).fetchall()
+
+
+def test_indexer_risk_queries(token, usd_token, usd_wand, usd_stability_pool, accounts, tmp_path):
+    seed_system(token, usd_token, usd_wand, usd_stability_pool, accounts)
+
+    indexer = Indexer(web3, usd_wand.address, tmp_path / "index.sqlite")
+    indexer.sync()
+
+    # At 1e19 the Loans are worth 1e21, 2e21 and 3e21 against 2.21e21 of debt each
+    buckets = debt_by_ratio_bucket(indexer.db, 1e19, bucket_width=0.5)
+    assert [(bucket, count) for bucket, _, count in buckets] == [(0.0, 1), (0.5, 1), (1.0, 1)]
+    assert sum(debt for _, debt, _ in buckets) == float(usd_wand.total_debt())
+
+    history = pool_utilisation(indexer.db)
+    block, pool, debt, utilisation = history[-1]
+    assert pool == 1e24
+    assert debt == float(usd_wand.total_debt())
+    assert utilisation == debt / pool
+
+
+class ForkedWeb3:
+    # Shows the blocks after fork on an orphaned branch without logs until orphaned is cleared
+    def __init__(self, web3, fork):
+        self.eth = self
+        self._web3 = web3
+        self.fork = fork
+        self.orphaned = True
+
+    def __getattr__(self, name):
+        return getattr(self._web3.eth, name)
+
+    def get_block(self, block):
+        if self.orphaned and block > self.fork:
+            return {"number": block, "hash": bytes(31) + bytes([block % 256])}
+        return self._web3.eth.get_block(block)
+
+    def get_logs(self, params):
+        logs = self._web3.eth.get_logs(params)
+        return [entry for entry in logs if not self.orphaned or entry["blockNumber"] <= self.fork]
+
+
+def test_indexer_stays_confirmations_behind_head(token, usd_token, usd_wand, usd_stability_pool, accounts, tmp_path):
+    seed_system(token, usd_token, usd_wand, usd_stability_pool, accounts)
+
+    # The deposit is the last block, so it is not confirmed yet
+    indexer = Indexer(web3, usd_wand.address, tmp_path / "index.sqlite", confirmations=1)
+    indexer.sync()
+    assert indexer.next_block == web3.eth.block_number
+    assert indexer.db.execute("SELECT COUNT(*) FROM loan_events").fetchone()[0] == 3
+    assert indexer.db.execute("SELECT COUNT(*) FROM deposit_events").fetchone()[0] == 0
+
+    chain.mine()
+    indexer.sync()
+    assert indexer.db.execute("SELECT COUNT(*) FROM deposit_events").fetchone()[0] == 1
+    assert indexer.total_stablecoin == usd_stability_pool.total_stablecoin()
+
+
+def test_indexer_rewinds_to_last_checkpoint_on_chain(token, usd_token, usd_wand, usd_stability_pool, accounts, tmp_path):
+    seed_system(token, usd_token, usd_wand, usd_stability_pool, accounts)
+    fork = web3.eth.block_number
+    usd_token.transfer(accounts[2], 1e21, {"from": accounts[0]})
+    usd_token.approve(usd_wand, 1e22, {"from": accounts[2]})
+    usd_wand.close_loan({"from": accounts[2]})
+
+    # Index the seed, then the orphaned branch where the loan was never closed
+    forked = ForkedWeb3(web3, fork)
+    indexer = Indexer(forked, usd_wand.address, tmp_path / "index.sqlite")
+    indexer.sync(fork)
+    indexer.sync()
+    assert {user for (user,) in indexer.db.execute("SELECT user FROM loans")} == {accounts[0], accounts[1], accounts[2]}
+
+    # The branch is replaced, the store rewinds to the fork and indexes the closed loan
+    forked.orphaned = False
+    indexer.sync()
+    db = indexer.db
+    assert [block for (block,) in db.execute("SELECT block FROM checkpoints ORDER BY block")] == [fork, web3.eth.block_number]
+    assert db.execute("SELECT COUNT(*) FROM loan_events WHERE event = 'LoanClosed'").fetchone()[0] == 1
+    assert {user for (user,) in db.execute("SELECT user FROM loans")} == {accounts[0], accounts[1]}
+    assert indexer.total_debt == usd_wand.total_debt()
+
+    reference = Indexer(web3, usd_wand.address, tmp_path / "reference.sqlite")
+    reference.sync()
+    for table in ("loan_events", "deposit_events", "transfers", "loans", "pool_history"):
+        query = f"SELECT * FROM {table} ORDER BY 1, 2"
+        assert db.execute(query).fetchall() == reference.db.execute(query).fetchall()
+
+
+def test_indexer_reindexes_reorgs_below_every_checkpoint(token, usd_token, usd_wand, usd_stability_pool, accounts, tmp_path):
+    seed_system(token, usd_token, usd_wand, usd_stability_pool, accounts)
+
+    forked = ForkedWeb3(web3, 0)
+    indexer = Indexer(forked, usd_wand.address, tmp_path / "index.sqlite")
+    assert indexer.sync() == 0
+
+    forked.orphaned = False
+    assert indexer.sync() > 0
+    assert indexer.db.execute("SELECT COUNT(*) FROM loan_events").fetchone()[0] == 3
+    assert indexer.total_debt == usd_wand.total_debt()
@@ -0,0 +1,151 @@
+import asyncio
+
+import brownie
+from brownie import *
+
+from magic_bank.keeper import Keeper, is_liquidatable
+
+
+def open_keeper_loans(token, usd_token, usd_wand, usd_stability_pool, accounts):
+    # Accounts 0 to 4 open Loans with the same debt and increasing collateral
+    for i in range(5):
+        amount = 1e20 + 5e19 * i
+        if i > 0:
+            token.transfer(accounts[i], amount, {"from": accounts[0]})
+        token.approve(usd_wand, amount, {"from": accounts[i]})
+        usd_wand.open_loan(amount, 2e21, {"from": accounts[i]})
+
+    usd_token.mintTo(accounts[6], 1e24, {"from": usd_wand})
+    usd_token.approve(usd_stability_pool, 1e24, {"from": accounts[6]})
+    usd_stability_pool.open_deposit(1e24, {"from": accounts[6]})
+
+
+class TimeoutWeb3:
+    # Never returns a receipt, like a node that is slow to mine
+    def __init__(self, web3):
+        self.eth = self
+        self._web3 = web3
+
+    def __getattr__(self, name):
+        return getattr(self._web3.eth, name)
+
+    def wait_for_transaction_receipt(self, tx_hash, timeout):
+        raise TimeoutError(f"transaction {tx_hash} not mined after {timeout} seconds")
+
+
+def run_keeper(keeper, steps):
+    asyncio.run(keeper.run(steps=steps))
+
+
+def test_keeper_mirrors_lq_price():
+    # 1e20 Collateral at 1e19 is worth 1e21 against 2.21e21 Debt
+    assert is_liquidatable(1e20, 2.21e21, 1e19) == True
+    assert is_liquidatable(3e20, 2.21e21, 1e19) == False
+    assert is_liquidatable(1e20, 2.21e21, 1e21) == False
+    assert is_liquidatable(1e20, 0, 1e21) == False
+    # At 1 wei the collateral ratio rounds to zero
+    assert is_liquidatable(1e20, 2.21e21, 1) == True
+
+
+def test_keeper_books_open_loans(token, usd_token, usd_wand, usd_stability_pool, accounts):
+    open_keeper_loans(token, usd_token, usd_wand, usd_stability_pool, accounts)
+
+    keeper = Keeper(web3, usd_wand.address, accounts[5].address, poll_interval=0)
+    run_keeper(keeper, 1)
+    assert len(keeper.book) == 5
+    for i in range(5):
+        loan = usd_wand.loan_of(accounts[i])
+        assert keeper.book.loans[accounts[i]] == (loan["collateral_value"], loan["debt_value"])
+    assert keeper.liquidated == []
+
+
+def test_keeper_drops_closed_loans(token, usd_token, usd_wand, usd_stability_pool, accounts):
+    open_keeper_loans(token, usd_token, usd_wand, usd_stability_pool, accounts)
+
+    keeper = Keeper(web3, usd_wand.address, accounts[5].address, poll_interval=0)
+    run_keeper(keeper, 1)
+    usd_token.transfer(accounts[4], 1e21, {"from": accounts[0]})
+    usd_token.approve(usd_wand, 1e22, {"from": accounts[4]})
+    usd_wand.close_loan({"from": accounts[4]})
+    run_keeper(keeper, 1)
+    assert accounts[4] not in keeper.book
+    assert len(keeper.book) == 4
+
+
+def test_keeper_liquidates_underwater_loans_after_price_crash(token, usd_token, usd_wand, usd_stability_pool, eth_oracle, accounts, chain):
+    open_keeper_loans(token, usd_token, usd_wand, usd_stability_pool, accounts)
+
+    keeper = Keeper(web3, usd_wand.address, accounts[5].address, poll_interval=0)
+    run_keeper(keeper, 1)
+
+    eth_oracle.setCurrentPrice(1e19, {"from": eth_oracle.deployer()})
+    start = chain.height
+    run_keeper(keeper, 3)
+
+    # Only the Loans of accounts 0, 1 and 2 are under water at 1e19, one block each
+    assert sorted(keeper.liquidated) == sorted([accounts[0], accounts[1], accounts[2]])
+    for i in range(5):
+        assert usd_wand.loan_of(accounts[i])["active"] == (i > 2)
+    assert chain.height - start <= 3
+    assert len(keeper.book) == 2
+
+
+def test_keeper_survives_receipt_timeouts(token, usd_token, usd_wand, usd_stability_pool, eth_oracle, accounts):
+    open_keeper_loans(token, usd_token, usd_wand, usd_stability_pool, accounts)
+
+    keeper = Keeper(TimeoutWeb3(web3), usd_wand.address, accounts[5].address, poll_interval=0)
+    run_keeper(keeper, 1)
+
+    eth_oracle.setCurrentPrice(1e19, {"from": eth_oracle.deployer()})
+    run_keeper(keeper, 1)
+    assert keeper.liquidated == []
+    assert keeper.pending == set()
+
+    # The liquidations were mined, the next round drops them from the book
+    run_keeper(keeper, 1)
+    for i in range(3):
+        assert usd_wand.loan_of(accounts[i])["active"] == False
+    assert len(keeper.book) == 2
+
+
+def test_keeper_survives_failed_refresh(token, usd_token, usd_wand, usd_stability_pool, eth_oracle, accounts):
+    open_keeper_loans(token, usd_token, usd_wand, usd_stability_pool, accounts)
+
+    keeper = Keeper(web3, usd_wand.address, accounts[5].address, poll_interval=0)
+    run_keeper(keeper, 1)
+
+    async def refresh(user):
+        raise ConnectionError("node unreachable")
+
+    eth_oracle.setCurrentPrice(1e19, {"from": eth_oracle.deployer()})
+    keeper.refresh = refresh
+    run_keeper(keeper, 1)
+    assert keeper.liquidated == []
+    assert keeper.pending == set()
+
+    # Risky Loans are retried once the node answers again
+    del keeper.refresh
+    run_keeper(keeper, 3)
+    assert sorted(keeper.liquidated) == sorted([accounts[0], accounts[1], accounts[2]])
+
+
+def test_keeper_drain_awaits_every_task(accounts, usd_wand):
+    keeper = Keeper(web3, usd_wand.address, accounts[5].address, poll_interval=0)
+    finished = []
+
+    async def fails():
+        raise RuntimeError("task failed")
+
+    async def finishes():
+        await asyncio.sleep(0.01)
+        finished.append(True)
+
+    async def drain():
+        for coroutine in (fails(), finishes()):
+            task = asyncio.ensure_future(coroutine)
+            keeper._tasks.add(task)
+            task.add_done_callback(keeper._tasks.discard)
+        await keeper.drain()
+
+    asyncio.run(drain())
+    assert finished == [True]
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+import brownie
+from brownie import *
+
+from magic_bank.simulator import Params, absorb, get_lq_price, open_loans, price_paths, sample_loans, simulate
+
+# Deployment parameters of the usd_wand fixture
+PARAMS = Params(max_ltv_ratio=9000, borrow_fee=50, lq_reserve_fee=2e20, min_debt_value=2e21)
+
+
+def open_simulator_loans(token, usd_wand, accounts):
+    # Accounts 0 to 4 open Loans with the same debt and increasing collateral
+    collateral_values = [1e20 + 5e19 * i for i in range(5)]
+    for i, amount in enumerate(collateral_values):
+        if i > 0:
+            token.transfer(accounts[i], amount, {"from": accounts[0]})
+        token.approve(usd_wand, amount, {"from": accounts[i]})
+        usd_wand.open_loan(amount, 2e21, {"from": accounts[i]})
+    return collateral_values
+
+
+# Contract Math
+
+
+def test_open_loans_matches_open_loan(token, usd_wand, eth_oracle, accounts):
+    collateral_values = open_simulator_loans(token, usd_wand, accounts)
+
+    price = eth_oracle.latestRoundData()[1]
+    collateral, debt = open_loans(collateral_values, [2e21] * 5, price, PARAMS)
+    loans = usd_wand.loans_of(accounts[:5])
+    assert list(collateral) == [loan[0] for loan in loans]
+    assert list(debt) == pytest.approx([loan[1] for loan in loans], rel=1e-12)
+
+
+def test_open_loans_rejects_what_open_loan_rejects():
+    # Below the minimum debt, and above the liquidation price
+    collateral, debt = open_loans([1e20, 1e18, 1e20], [1e21, 2e21, 2e21], 1e21, PARAMS)
+    assert list(collateral) == [1e20]
+
+
+def test_get_lq_price_matches_system_snapshot(token, usd_wand, accounts):
+    open_simulator_loans(token, usd_wand, accounts)
+
+    snapshot = usd_wand.system_snapshot()
+    lq_price = get_lq_price(snapshot["total_collateral"], snapshot["total_debt"], snapshot["collateral_price"])
+    assert lq_price == pytest.approx(snapshot["lq_price"], rel=1e-12)
+
+
+def test_absorb_matches_update_values(usd_token, usd_wand, usd_stability_pool, accounts):
+    amount = 10 ** 18 * 2000
+
+    usd_token.transfer(accounts[1], amount * 3, {"from": accounts[0]})
+    usd_token.approve(usd_stability_pool, amount, {"from": accounts[0]})
+    usd_token.approve(usd_stability_pool, amount * 3, {"from": accounts[1]})
+    usd_stability_pool.open_deposit(amount, {"from": accounts[0]})
+    usd_stability_pool.open_deposit(amount * 3, {"from": accounts[1]})
+    usd_stability_pool.update_values(amount * 3, 1e19, {"from": usd_wand})
+
+    compounded, gains = absorb([amount, amount * 3], amount * 3, 1e19)
+    for i in range(2):
+        assert usd_stability_pool.get_compounded_stablecoin(accounts[i]) == pytest.approx(compounded[i], rel=1e-9)
+        assert usd_stability_pool.get_collateral_gain(accounts[i]) == pytest.approx(gains[i], rel=1e-9)
+
+
+def test_simulate_matches_liquidate_lowest(token, usd_token, usd_wand, usd_stability_pool, eth_oracle, accounts):
+    open_simulator_loans(token, usd_wand, accounts)
+    # The pool covers two of the three loans that become liquidatable
+    usd_token.mintTo(accounts[6], 5e21, {"from": usd_wand})
+    usd_token.approve(usd_stability_pool, 5e21, {"from": accounts[6]})
+    usd_stability_pool.open_deposit(5e21, {"from": accounts[6]})
+    loans = usd_wand.loans_of(accounts[:5])
+
+    eth_oracle.setCurrentPrice(1e19, {"from": eth_oracle.deployer()})
+    usd_wand.liquidate_lowest(5, {"from": accounts[5]})
+
+    result = simulate([loan[0] for loan in loans], [loan[1] for loan in loans], [[1e19]], 5e21)
+    remaining = usd_wand.loans_of(accounts[:5])
+    assert result.liquidations[0] == sum(1 for loan in remaining if not loan[2])
+    assert result.uncovered_loans[0] == 1
+    assert result.pool_value[0] == pytest.approx(usd_stability_pool.total_stablecoin(), rel=1e-9)
+    assert result.pool_collateral[0] == pytest.approx(token.balanceOf(usd_stability_pool), rel=1e-9)
+    assert result.liquidator_collateral[0] == pytest.approx(token.balanceOf(accounts[5]), rel=1e-9)
+
+
+# Stress Runs
+
+
+def test_simulate_larger_pool_leaves_less_uncovered():
+    rng = np.random.default_rng(0)
+    collateral, debt = sample_loans(10000, 1e21, PARAMS, rng)
+    prices = price_paths(1e21, 200, 50, 0.05, rng)
+
+    small = simulate(collateral, debt, prices, debt.sum() * 0.01)
+    large = simulate(collateral, debt, prices, debt.sum() * 0.5)
+    assert (small.liquidations <= large.liquidations).all()
+    assert (small.uncovered_debt >= large.uncovered_debt).all()
+    assert (small.bad_debt >= 0).all() and (large.bad_debt >= 0).all()
+    assert (small.liquidated_debt <= debt.sum() * 0.01).all()
@@ -23,6 +23,22 @@ def test__open_deposit_below_min(usd_token, usd_stability_pool, accounts):
         usd_stability_pool.open_deposit(amount, {"from": accounts[0]})
 
 
+def test_open_deposit_without_approval(usd_token, usd_stability_pool, accounts):
+    amount = 10 ** 18 * 2000
+
+    usd_token.approve(usd_stability_pool, amount, {"from": accounts[0]})
+    with brownie.reverts("Insufficient allowance"):
+        usd_stability_pool.open_deposit(amount * 2, {"from": accounts[0]})
+
+
+def test_open_deposit_with_insufficient_balance(usd_token, usd_stability_pool, accounts):
+    amount = usd_token.balanceOf(accounts[0]) + 10 ** 18 * 2000
+
+    usd_token.approve(usd_stability_pool, amount, {"from": accounts[0]})
+    with brownie.reverts("Insufficient balance"):
+        usd_stability_pool.open_deposit(amount, {"from": accounts[0]})
+
+
 def test_pool_deposit_and_withdraw_no_rewards(usd_token, usd_stability_pool, accounts):
     amount = 10 ** 18 * 2000
     init_bal = usd_token.balanceOf(accounts[0])
@@ -64,6 +80,67 @@ def test_pool_deposit_and_withdraw_with_rewards(token, usd_token, usd_wand, usd_
 
 
 
+def test_pool_liquidation_is_shared_pro_rata(usd_token, usd_wand, usd_stability_pool, accounts):
+    amount = 10 ** 18 * 2000
+
+    usd_token.transfer(accounts[1], amount * 3, {"from": accounts[0]})
+    usd_token.approve(usd_stability_pool, amount, {"from": accounts[0]})
+    usd_token.approve(usd_stability_pool, amount * 3, {"from": accounts[1]})
+    usd_stability_pool.open_deposit(amount, {"from": accounts[0]})
+    usd_stability_pool.open_deposit(amount * 3, {"from": accounts[1]})
+    usd_stability_pool.update_values(amount * 2, amount * 2, {"from": usd_wand})
+    assert usd_stability_pool.get_compounded_stablecoin(accounts[0]) == amount / 2
+    assert usd_stability_pool.get_compounded_stablecoin(accounts[1]) == amount * 3 / 2
+    assert usd_stability_pool.get_collateral_gain(accounts[0]) == amount / 2
+    assert usd_stability_pool.get_collateral_gain(accounts[1]) == amount * 3 / 2
+    assert usd_stability_pool.total_stablecoin() == amount * 2
+
+
+def test_pool_deposit_opened_after_liquidation_has_no_loss(usd_token, usd_wand, usd_stability_pool, accounts):
+    amount = 10 ** 18 * 2000
+
+    usd_token.transfer(accounts[1], amount, {"from": accounts[0]})
+    usd_token.approve(usd_stability_pool, amount, {"from": accounts[0]})
+    usd_token.approve(usd_stability_pool, amount, {"from": accounts[1]})
+    usd_stability_pool.open_deposit(amount, {"from": accounts[0]})
+    usd_stability_pool.update_values(amount, amount, {"from": usd_wand})
+    usd_stability_pool.open_deposit(amount, {"from": accounts[1]})
+    assert usd_stability_pool.get_compounded_stablecoin(accounts[0]) == 0
+    assert usd_stability_pool.get_compounded_stablecoin(accounts[1]) == amount
+    assert usd_stability_pool.get_collateral_gain(accounts[1]) == 0
+
+
+def test_deposit_events_carry_pool_values(token, usd_token, usd_wand, usd_stability_pool, accounts):
+    amount = 10 ** 18 * 2000
+
+    token.transfer(usd_stability_pool, 1e20, {"from": accounts[0]})
+    usd_token.approve(usd_stability_pool, amount * 2, {"from": accounts[0]})
+    tx = usd_stability_pool.open_deposit(amount * 2, {"from": accounts[0]})
+    assert tx.events["DepositOpened"].values() == [accounts[0], amount * 2, amount * 2]
+
+    tx = usd_stability_pool.update_values(amount, 1e20, {"from": usd_wand})
+    assert tx.events["PoolAbsorbed"].values() == [amount, 1e20, amount, 10 ** 18 / 2, 0, 0]
+
+    tx = usd_stability_pool.close_deposit({"from": accounts[0]})
+    assert tx.events["DepositClosed"].values() == [accounts[0], amount, 1e20, 0]
+
+
+def test_deposits_of_returns_settled_deposits(usd_token, usd_wand, usd_stability_pool, accounts):
+    amount = 10 ** 18 * 2000
+
+    usd_token.transfer(accounts[1], amount * 3, {"from": accounts[0]})
+    usd_token.approve(usd_stability_pool, amount, {"from": accounts[0]})
+    usd_token.approve(usd_stability_pool, amount * 3, {"from": accounts[1]})
+    usd_stability_pool.open_deposit(amount, {"from": accounts[0]})
+    usd_stability_pool.open_deposit(amount * 3, {"from": accounts[1]})
+    usd_stability_pool.update_values(amount * 2, amount * 2, {"from": usd_wand})
+    assert usd_stability_pool.deposits_of([accounts[1], accounts[2], accounts[0]]) == [
+        (True, amount * 3, amount * 3 / 2, amount * 3 / 2),
+        (False, 0, 0, 0),
+        (True, amount, amount / 2, amount / 2),
+    ]
+
+
 def test_cannot_open_two_deposits(usd_token, usd_stability_pool, accounts):
     amount = 10 ** 18 * 2000
     
@@ -84,6 +161,120 @@ def test_open_deposit_after_close_deposit(usd_token, usd_stability_pool, account
     assert usd_token.balanceOf(accounts[0]) == init_bal - amount
 
 
+def test_close_deposit_moves_last_deposit_into_its_slot(usd_token, usd_stability_pool, accounts):
+    amount = 10 ** 18 * 2000
+
+    for i in range(3):
+        if i > 0:
+            usd_token.transfer(accounts[i], amount, {"from": accounts[0]})
+        usd_token.approve(usd_stability_pool, amount, {"from": accounts[i]})
+        usd_stability_pool.open_deposit(amount, {"from": accounts[i]})
+    assert usd_stability_pool.deposit_count() == 3
+
+    usd_stability_pool.close_deposit({"from": accounts[0]})
+    assert usd_stability_pool.deposit_count() == 2
+    assert usd_stability_pool.deposit_list(0) == accounts[2]
+    assert usd_stability_pool.deposits(accounts[2])["index"] == 0
+    assert usd_stability_pool.deposits(accounts[0])["active"] == False
+
+    # Closing The Last Deposit Only Pops It
+    usd_stability_pool.close_deposit({"from": accounts[1]})
+    assert usd_stability_pool.deposit_count() == 1
+    assert usd_stability_pool.deposit_list(0) == accounts[2]
+
+
+def test_deposit_list_does_not_grow_with_churn(usd_token, usd_stability_pool, accounts):
+    amount = 10 ** 18 * 2000
+
+    usd_token.approve(usd_stability_pool, amount * 5, {"from": accounts[0]})
+    for i in range(5):
+        usd_stability_pool.open_deposit(amount, {"from": accounts[0]})
+        usd_stability_pool.close_deposit({"from": accounts[0]})
+    assert usd_stability_pool.deposit_count() == 0
+
+
+def test_open_deposit_with_permit(usd_token, usd_stability_pool, accounts, sign_permit):
+    amount = 10 ** 18 * 2000
+    user = accounts.add()
+    usd_token.transfer(user, amount * 2, {"from": accounts[0]})
+
+    deadline, v, r, s = sign_permit(usd_token, user, usd_stability_pool, amount)
+    usd_stability_pool.open_deposit_with_permit(amount, deadline, v, r, s, {"from": user})
+    assert usd_stability_pool.get_compounded_stablecoin(user) == amount
+
+    deadline, v, r, s = sign_permit(usd_token, user, usd_stability_pool, amount)
+    usd_stability_pool.add_to_deposit_with_permit(amount, deadline, v, r, s, {"from": user})
+    assert usd_stability_pool.get_compounded_stablecoin(user) == amount * 2
+    assert usd_token.balanceOf(user) == 0
+
+
+# Update Deposits In Place
+
+
+def test_add_to_deposit_pays_gain_and_compounds(token, usd_token, usd_wand, usd_stability_pool, accounts):
+    amount = 10 ** 18 * 2000
+    init_bal = token.balanceOf(accounts[0])
+
+    usd_token.approve(usd_stability_pool, amount * 2, {"from": accounts[0]})
+    usd_stability_pool.open_deposit(amount, {"from": accounts[0]})
+    usd_stability_pool.update_values(amount / 2, amount / 2, {"from": usd_wand})
+    token.mintTo(usd_stability_pool, amount / 2, {"from": token.wand()})
+    tx = usd_stability_pool.add_to_deposit(amount, {"from": accounts[0]})
+    assert tx.events["DepositUpdated"].values() == [accounts[0], amount * 3 / 2, amount / 2, amount * 3 / 2]
+    assert token.balanceOf(accounts[0]) == init_bal + amount / 2
+    assert usd_stability_pool.deposits_of([accounts[0]]) == [(True, amount * 3 / 2, amount * 3 / 2, 0)]
+    assert usd_stability_pool.deposit_count() == 1
+
+
+def test_withdraw_from_deposit(usd_token, usd_stability_pool, accounts):
+    amount = 10 ** 18 * 2000
+    init_bal = usd_token.balanceOf(accounts[0])
+
+    usd_token.approve(usd_stability_pool, amount * 2, {"from": accounts[0]})
+    usd_stability_pool.open_deposit(amount * 2, {"from": accounts[0]})
+    usd_stability_pool.withdraw_from_deposit(amount / 2, {"from": accounts[0]})
+    assert usd_token.balanceOf(accounts[0]) == init_bal - amount * 3 / 2
+    assert usd_stability_pool.total_stablecoin() == amount * 3 / 2
+    assert usd_stability_pool.get_compounded_stablecoin(accounts[0]) == amount * 3 / 2
+
+
+def test_cannot_withdraw_deposit_below_min(usd_token, usd_stability_pool, accounts):
+    amount = 10 ** 18 * 2000
+
+    usd_token.approve(usd_stability_pool, amount * 2, {"from": accounts[0]})
+    usd_stability_pool.open_deposit(amount * 2, {"from": accounts[0]})
+    with brownie.reverts():
+        usd_stability_pool.withdraw_from_deposit(amount + 1, {"from": accounts[0]})
+
+
+def test_claim_collateral_keeps_deposit(token, usd_token, usd_wand, usd_stability_pool, accounts):
+    amount = 10 ** 18 * 2000
+    init_bal = token.balanceOf(accounts[0])
+
+    usd_token.approve(usd_stability_pool, amount, {"from": accounts[0]})
+    usd_stability_pool.open_deposit(amount, {"from": accounts[0]})
+    usd_stability_pool.update_values(amount / 2, amount / 2, {"from": usd_wand})
+    token.mintTo(usd_stability_pool, amount / 2, {"from": token.wand()})
+    usd_stability_pool.claim_collateral({"from": accounts[0]})
+    assert token.balanceOf(accounts[0]) == init_bal + amount / 2
+    assert usd_stability_pool.get_collateral_gain(accounts[0]) == 0
+
+    # Later Liquidations Apply To What Is Left
+    usd_stability_pool.update_values(amount / 4, amount / 4, {"from": usd_wand})
+    assert usd_stability_pool.get_compounded_stablecoin(accounts[0]) == amount / 4
+    assert usd_stability_pool.get_collateral_gain(accounts[0]) == amount / 4
+
+
+def test_cannot_update_closed_deposit(usd_token, usd_stability_pool, accounts):
+    amount = 10 ** 18 * 2000
+
+    usd_token.approve(usd_stability_pool, amount, {"from": accounts[0]})
+    with brownie.reverts():
+        usd_stability_pool.add_to_deposit(amount, {"from": accounts[0]})
+    with brownie.reverts():
+        usd_stability_pool.claim_collateral({"from": accounts[0]})
+
+
 # set_wand Function
 
 
@@ -122,4 +313,60 @@ def test_nonwand_cannot_update_values(usd_wand, usd_stability_pool, accounts):
     assert hacker != usd_stability_pool.wand()
 
     with brownie.reverts():
-        usd_stability_pool.update_values(amount, amount, {"from": hacker})
\ No newline at end of file
+        usd_stability_pool.update_values(amount, amount, {"from": hacker})
+
+
+def test_cannot_update_values_above_pool_total(usd_token, usd_wand, usd_stability_pool, accounts):
+    amount = 10 ** 18 * 2000
+
+    usd_token.approve(usd_stability_pool, amount, {"from": accounts[0]})
+    usd_stability_pool.open_deposit(amount, {"from": accounts[0]})
+    with brownie.reverts():
+        usd_stability_pool.update_values(amount * 2, amount, {"from": usd_wand})
+
+
+def absorb_near_total_losses(usd_token, usd_wand, usd_stability_pool, accounts):
+    # Two losses leave 1e-9, then 1e-18 of the pool, rescaling the product twice
+    usd_token.mintTo(accounts[1], 10 ** 37, {"from": usd_wand})
+    usd_token.approve(usd_stability_pool, 10 ** 37, {"from": accounts[1]})
+    usd_stability_pool.open_deposit(10 ** 37, {"from": accounts[1]})
+    usd_stability_pool.update_values(10 ** 37 - 10 ** 28, 0, {"from": usd_wand})
+    usd_stability_pool.update_values(10 ** 28 - 10 ** 10, 0, {"from": usd_wand})
+    assert usd_stability_pool.product() > 0
+
+
+def assert_new_deposit_compounds(usd_token, usd_wand, usd_stability_pool, accounts):
+    amount = 10 ** 18 * 2000
+    total = usd_stability_pool.total_stablecoin()
+    usd_token.approve(usd_stability_pool, amount, {"from": accounts[0]})
+    usd_stability_pool.open_deposit(amount, {"from": accounts[0]})
+    usd_stability_pool.update_values(total + amount / 2, 1e19, {"from": usd_wand})
+    assert usd_stability_pool.get_compounded_stablecoin(accounts[0]) == amount / 2
+    # Collateral per unit rounds down, in the pool's favour
+    assert 1e19 - 10 ** 4 < usd_stability_pool.get_collateral_gain(accounts[0]) <= 1e19
+
+
+def test_emptying_pool_after_near_total_losses_starts_a_new_epoch(usd_token, usd_wand, usd_stability_pool, accounts):
+    absorb_near_total_losses(usd_token, usd_wand, usd_stability_pool, accounts)
+    usd_stability_pool.update_values(10 ** 10, 0, {"from": usd_wand})
+
+    assert usd_stability_pool.current_epoch() == 1
+    assert usd_stability_pool.product() == 10 ** 18
+    assert usd_stability_pool.total_stablecoin() == 0
+    assert usd_stability_pool.get_compounded_stablecoin(accounts[1]) == 0
+
+    # A deposit opened after the losses still compounds and gains collateral
+    assert_new_deposit_compounds(usd_token, usd_wand, usd_stability_pool, accounts)
+
+
+def test_partial_loss_rounding_product_to_zero_keeps_the_epoch(usd_token, usd_wand, usd_stability_pool, accounts):
+    # The last loss leaves 1e-10 of the pool, which rounds the product to zero
+    absorb_near_total_losses(usd_token, usd_wand, usd_stability_pool, accounts)
+    usd_stability_pool.update_values(10 ** 10 - 1, 0, {"from": usd_wand})
+
+    # The stablecoin left still belongs to the pool's deposits
+    assert usd_stability_pool.current_epoch() == 0
+    assert usd_stability_pool.product() == 1
+    assert usd_stability_pool.total_stablecoin() == 1
+
+    assert_new_deposit_compounds(usd_token, usd_wand, usd_stability_pool, accounts)
@@ -0,0 +1,315 @@
+import os
+
+import brownie
+import pytest
+from brownie import *
+from hypothesis import settings, strategies as st
+from hypothesis.stateful import RuleBasedStateMachine, initialize, invariant, precondition, rule, run_state_machine_as_test
+
+from magic_bank.keeper import get_lq_price
+
+# Random sequences of loan, pool and price operations, checked against a model of every loan after each step
+# Set FUZZ_USERS, FUZZ_EXAMPLES and FUZZ_STEPS to grow the system and the search, the defaults run in a few minutes
+
+USERS = int(os.environ.get("FUZZ_USERS", "20"))
+EXAMPLES = int(os.environ.get("FUZZ_EXAMPLES", "10"))
+STEPS = int(os.environ.get("FUZZ_STEPS", "40"))
+
+BORROW_FEE = 50
+LQ_RESERVE_FEE = 2 * 10 ** 20
+MIN_DEBT_VALUE = 2 * 10 ** 21
+MIN_DEPOSIT_VALUE = 2 * 10 ** 21
+ZERO_ADDRESS = "0x" + "0" * 40
+
+users = st.integers(min_value=0, max_value=USERS - 1)
+
+
+@pytest.fixture(scope="module")
+def fuzz_users(token, usd_token, usd_wand, accounts):
+    # Every user holds collateral and stablecoins, accounts[0] is still the collateral wand here
+    funded = list(accounts[1:10])[:USERS]
+    while len(funded) < USERS:
+        funded.append(accounts.add())
+    for user in funded:
+        token.mintTo(user, 10 ** 21, {"from": accounts[0]})
+        usd_token.transfer(user, 10 ** 22, {"from": accounts[0]})
+        token.approve(usd_wand, 2 ** 256 - 1, {"from": user})
+    return funded
+
+
+def is_healthy(collateral_value, debt_value, collateral_price):
+    lq_price = get_lq_price(collateral_value, debt_value, collateral_price)
+    return lq_price is not None and collateral_price > lq_price
+
+
+def is_liquidatable(collateral_value, debt_value, collateral_price):
+    lq_price = get_lq_price(collateral_value, debt_value, collateral_price)
+    return lq_price is not None and lq_price >= collateral_price
+
+
+class LendingMachine(RuleBasedStateMachine):
+    """
+    Drives BorrowWand, StabilityPool and the price oracle, mirroring every loan in a model
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.loans = {}
+        self.depositers = set()
+        self.pool_rounding = 0
+        self.collateral_price = self.eth_oracle.latestRoundData()[1]
+
+    def teardown(self):
+        try:
+            self.check_token_conservation()
+        finally:
+            self.chain.revert()
+
+    def record(self, name, tx):
+        self.gas_distribution.setdefault(name, []).append((tx.gas_used, len(self.loans), len(self.depositers)))
+
+    def absorbed(self, total_stablecoin):
+        # A liquidation can strand a part per billion of the pool in rounding, plus a wei per deposit
+        self.pool_rounding += total_stablecoin // 10 ** 9 + len(self.depositers) + 1
+
+    def borrower(self, index):
+        return sorted(self.loans)[index % len(self.loans)]
+
+    def depositer(self, index):
+        return sorted(self.depositers)[index % len(self.depositers)]
+
+    def debt_with_fees(self, value):
+        return value + value * BORROW_FEE // 10000
+
+    @initialize(value=st.integers(MIN_DEPOSIT_VALUE, 10 ** 23))
+    def fund_pool(self, value):
+        # The liquidator also backs the pool, so liquidations are not all blocked by an empty pool
+        self.usd_token.approve(self.usd_stability_pool, value, {"from": self.liquidator})
+        self.usd_stability_pool.open_deposit(value, {"from": self.liquidator})
+        self.depositers.add(self.liquidator)
+
+    # Loans
+
+    @rule(user=users, collateral_value=st.integers(10 ** 18, 10 ** 20), debt_value=st.integers(MIN_DEBT_VALUE, 5 * 10 ** 22))
+    def open_loan(self, user, collateral_value, debt_value):
+        account = self.users[user]
+        loan = [collateral_value, self.debt_with_fees(debt_value) + LQ_RESERVE_FEE]
+        if account in self.loans or self.token.balanceOf(account) < collateral_value:
+            return
+        if not is_healthy(*loan, self.collateral_price):
+            with brownie.reverts():
+                self.usd_wand.open_loan(collateral_value, debt_value, {"from": account})
+            return
+        hints = self.usd_wand.find_insert_position(*loan, self.usd_wand.lowest_loan(), ZERO_ADDRESS)
+        tx = self.usd_wand.open_loan(collateral_value, debt_value, *hints, {"from": account})
+        self.loans[account] = loan
+        self.record("BorrowWand.open_loan", tx)
+
+    @precondition(lambda self: self.loans)
+    @rule(user=users, value=st.integers(1, 10 ** 20))
+    def deposit_collateral(self, user, value):
+        account = self.borrower(user)
+        if self.token.balanceOf(account) < value:
+            return
+        tx = self.usd_wand.deposit_collateral(value, {"from": account})
+        self.loans[account][0] += value
+        self.record("BorrowWand.deposit_collateral", tx)
+
+    @precondition(lambda self: self.loans)
+    @rule(user=users, value=st.integers(1, 10 ** 20))
+    def withdraw_collateral(self, user, value):
+        account = self.borrower(user)
+        if value > self.loans[account][0]:
+            return
+        collateral_value, debt_value = self.loans[account]
+        if not is_healthy(collateral_value - value, debt_value, self.collateral_price):
+            with brownie.reverts():
+                self.usd_wand.withdraw_collateral(value, {"from": account})
+            return
+        tx = self.usd_wand.withdraw_collateral(value, {"from": account})
+        self.loans[account][0] -= value
+        self.record("BorrowWand.withdraw_collateral", tx)
+
+    @precondition(lambda self: self.loans)
+    @rule(user=users, value=st.integers(1, 5 * 10 ** 22))
+    def borrow_stablecoin(self, user, value):
+        account = self.borrower(user)
+        collateral_value, debt_value = self.loans[account]
+        if not is_healthy(collateral_value, debt_value + self.debt_with_fees(value), self.collateral_price):
+            with brownie.reverts():
+                self.usd_wand.borrow_stablecoin(value, {"from": account})
+            return
+        tx = self.usd_wand.borrow_stablecoin(value, {"from": account})
+        self.loans[account][1] += self.debt_with_fees(value)
+        self.record("BorrowWand.borrow_stablecoin", tx)
+
+    @precondition(lambda self: self.loans)
+    @rule(user=users, value=st.integers(1, 5 * 10 ** 22))
+    def repay_stablecoin(self, user, value):
+        account = self.borrower(user)
+        if self.usd_token.balanceOf(account) < value:
+            return
+        if self.loans[account][1] - value < MIN_DEBT_VALUE + LQ_RESERVE_FEE:
+            with brownie.reverts():
+                self.usd_wand.repay_stablecoin(value, {"from": account})
+            return
+        tx = self.usd_wand.repay_stablecoin(value, {"from": account})
+        self.loans[account][1] -= value
+        self.record("BorrowWand.repay_stablecoin", tx)
+
+    @precondition(lambda self: self.loans)
+    @rule(user=users)
+    def close_loan(self, user):
+        account = self.borrower(user)
+        if self.usd_token.balanceOf(account) < self.loans[account][1] - LQ_RESERVE_FEE:
+            return
+        tx = self.usd_wand.close_loan({"from": account})
+        del self.loans[account]
+        self.record("BorrowWand.close_loan", tx)
+
+    # Price
+
+    @rule(collateral_price=st.integers(10 ** 20, 2 * 10 ** 21))
+    def set_price(self, collateral_price):
+        self.eth_oracle.setCurrentPrice(collateral_price, {"from": self.eth_oracle.deployer()})
+        self.collateral_price = collateral_price
+
+    # Liquidations
+
+    @precondition(lambda self: self.loans)
+    @rule(user=users)
+    def liquidate(self, user):
+        account = self.borrower(user)
+        pool_balance = self.usd_token.balanceOf(self.usd_stability_pool)
+        if not is_liquidatable(*self.loans[account], self.collateral_price) or pool_balance < self.loans[account][1]:
+            with brownie.reverts():
+                self.usd_wand.liquidate(account, {"from": self.liquidator})
+            return
+        tx = self.usd_wand.liquidate(account, {"from": self.liquidator})
+        del self.loans[account]
+        self.absorbed(pool_balance)
+        self.record("BorrowWand.liquidate", tx)
+
+    @precondition(lambda self: self.loans)
+    @rule(count=st.integers(1, 10))
+    def liquidate_lowest(self, count):
+        pool_balance = self.usd_token.balanceOf(self.usd_stability_pool)
+        tx = self.usd_wand.liquidate_lowest(count, {"from": self.liquidator})
+        liquidated = [event["user"] for event in tx.events["Liquidated"]] if "Liquidated" in tx.events else []
+        assert tx.return_value == len(liquidated) <= count
+        for account in liquidated:
+            assert is_liquidatable(*self.loans.pop(account), self.collateral_price)
+        if liquidated:
+            self.absorbed(pool_balance)
+        self.record("BorrowWand.liquidate_lowest", tx)
+
+    # Stability Pool
+
+    @rule(user=users, value=st.integers(MIN_DEPOSIT_VALUE, 10 ** 22))
+    def open_deposit(self, user, value):
+        account = self.users[user]
+        if account in self.depositers or self.usd_token.balanceOf(account) < value:
+            return
+        self.usd_token.approve(self.usd_stability_pool, value, {"from": account})
+        tx = self.usd_stability_pool.open_deposit(value, {"from": account})
+        self.depositers.add(account)
+        self.record("StabilityPool.open_deposit", tx)
+
+    @precondition(lambda self: self.depositers)
+    @rule(user=users)
+    def close_deposit(self, user):
+        account = self.depositer(user)
+        tx = self.usd_stability_pool.close_deposit({"from": account})
+        self.depositers.remove(account)
+        self.record("StabilityPool.close_deposit", tx)
+
+    @precondition(lambda self: self.depositers)
+    @rule(user=users, value=st.integers(1, 10 ** 22))
+    def add_to_deposit(self, user, value):
+        account = self.depositer(user)
+        if self.usd_token.balanceOf(account) < value:
+            return
+        self.usd_token.approve(self.usd_stability_pool, value, {"from": account})
+        tx = self.usd_stability_pool.add_to_deposit(value, {"from": account})
+        self.record("StabilityPool.add_to_deposit", tx)
+
+    @precondition(lambda self: self.depositers)
+    @rule(user=users, value=st.integers(1, 10 ** 22))
+    def withdraw_from_deposit(self, user, value):
+        account = self.depositer(user)
+        if self.usd_stability_pool.get_compounded_stablecoin(account) < value + MIN_DEPOSIT_VALUE:
+            with brownie.reverts():
+                self.usd_stability_pool.withdraw_from_deposit(value, {"from": account})
+            return
+        tx = self.usd_stability_pool.withdraw_from_deposit(value, {"from": account})
+        self.record("StabilityPool.withdraw_from_deposit", tx)
+
+    @precondition(lambda self: self.depositers)
+    @rule(user=users)
+    def claim_collateral(self, user):
+        account = self.depositer(user)
+        tx = self.usd_stability_pool.claim_collateral({"from": account})
+        assert self.usd_stability_pool.get_collateral_gain(account) == 0
+        self.record("StabilityPool.claim_collateral", tx)
+
+    # Invariants
+
+    @invariant()
+    def loans_match_model(self):
+        loans = self.usd_wand.loans_of(self.users)
+        for account, loan in zip(self.users, loans):
+            if account in self.loans:
+                assert (loan[0], loan[1], loan[2]) == (*self.loans[account], True)
+            else:
+                assert loan[2] == False
+
+    @invariant()
+    def totals_equal_sum_of_loans(self):
+        assert self.usd_wand.total_collateral() == sum(c for c, _ in self.loans.values())
+        assert self.usd_wand.total_debt() == sum(d for _, d in self.loans.values())
+        assert self.token.balanceOf(self.usd_wand) == self.usd_wand.total_collateral()
+
+    @invariant()
+    def sorted_loans_cover_every_loan(self):
+        lowest = self.usd_wand.lowest_ratio_loans(100)
+        assert len(lowest) == min(len(self.loans), 100)
+        ratios = [self.loans[account][0] * 10 ** 18 // self.loans[account][1] for account in lowest]
+        assert ratios == sorted(ratios)
+
+    @invariant()
+    def total_stablecoin_equals_sum_of_deposits(self):
+        total_stablecoin = self.usd_stability_pool.total_stablecoin()
+        depositers = [self.liquidator, *self.users]
+        deposits = self.usd_stability_pool.deposits_of(depositers)
+        compounded = sum(deposit[2] for deposit in deposits)
+        assert {account for account, deposit in zip(depositers, deposits) if deposit[0]} == self.depositers
+        assert self.usd_stability_pool.deposit_count() == len(self.depositers)
+        assert self.usd_token.balanceOf(self.usd_stability_pool) == total_stablecoin
+        # Losses are rounded up, so deposits never add up to more than the pool and only lose dust
+        assert compounded <= total_stablecoin <= compounded + self.pool_rounding
+        # The pool holds the collateral it owes
+        assert sum(deposit[3] for deposit in deposits) <= self.token.balanceOf(self.usd_stability_pool)
+
+    def check_token_conservation(self):
+        holders = {*self.users, self.liquidator, self.usd_wand, self.usd_stability_pool}
+        assert sum(self.token.balanceOf(holder) for holder in holders) == self.token.totalSupply()
+        assert sum(self.usd_token.balanceOf(holder) for holder in holders) == self.usd_token.totalSupply()
+
+
+def test_lending_system_invariants(
+    token, usd_token, usd_wand, usd_stability_pool, eth_oracle, accounts, chain, fuzz_users, gas_distribution
+):
+    # The chain is reverted to the funded state after every example
+    LendingMachine.token = token
+    LendingMachine.usd_token = usd_token
+    LendingMachine.usd_wand = usd_wand
+    LendingMachine.usd_stability_pool = usd_stability_pool
+    LendingMachine.eth_oracle = eth_oracle
+    LendingMachine.accounts = accounts
+    LendingMachine.chain = chain
+    LendingMachine.users = fuzz_users
+    LendingMachine.liquidator = accounts[0]
+    LendingMachine.gas_distribution = gas_distribution
+    run_state_machine_as_test(
+        LendingMachine, settings=settings(max_examples=EXAMPLES, stateful_step_count=STEPS, deadline=None)
+    )
@@ -2,6 +2,15 @@
 
 import pytest
 import brownie
+from eth_utils import keccak
+from hexbytes import HexBytes
+
+try:
+    from eth_abi import encode
+except ImportError:
+    from eth_abi import encode_abi as encode
+
+ZERO_ADDRESS = "0x" + "0" * 40
 
 
 # approve Function
@@ -302,4 +311,109 @@ def test_transferFrom_event_fires(accounts, token):
     tx = token.transferFrom(accounts[0], accounts[2], amount, {"from": accounts[1]})
 
     assert len(tx.events) == 1
-    assert tx.events["Transfer"].values() == [accounts[0], accounts[2], amount]
\ No newline at end of file
+    assert tx.events["Transfer"].values() == [accounts[0], accounts[2], amount]
+
+
+# permit Function
+
+
+def test_permit_sets_allowance(accounts, token, sign_permit):
+    owner = accounts.add()
+    amount = 10 ** 18
+
+    deadline, v, r, s = sign_permit(token, owner, accounts[1], amount)
+    tx = token.permit(owner, accounts[1], amount, deadline, v, r, s, {"from": accounts[2]})
+
+    assert token.allowance(owner, accounts[1]) == amount
+    assert token.nonces(owner) == 1
+    assert tx.events["Approval"].values() == [owner, accounts[1], amount]
+
+
+def test_permit_cannot_be_replayed(accounts, token, sign_permit):
+    owner = accounts.add()
+
+    deadline, v, r, s = sign_permit(token, owner, accounts[1], 10 ** 18)
+    token.permit(owner, accounts[1], 10 ** 18, deadline, v, r, s, {"from": accounts[2]})
+    token.approve(accounts[1], 0, {"from": owner})
+    with brownie.reverts():
+        token.permit(owner, accounts[1], 10 ** 18, deadline, v, r, s, {"from": accounts[2]})
+
+
+def test_permit_with_other_value(accounts, token, sign_permit):
+    owner = accounts.add()
+
+    deadline, v, r, s = sign_permit(token, owner, accounts[1], 10 ** 18)
+    with brownie.reverts():
+        token.permit(owner, accounts[1], 10 ** 19, deadline, v, r, s, {"from": accounts[2]})
+
+
+def test_permit_after_deadline(accounts, token, sign_permit, chain):
+    owner = accounts.add()
+
+    deadline, v, r, s = sign_permit(token, owner, accounts[1], 10 ** 18, chain.time() - 1)
+    with brownie.reverts():
+        token.permit(owner, accounts[1], 10 ** 18, deadline, v, r, s, {"from": accounts[2]})
+
+
+def test_permit_rejects_high_s_signature(accounts, token, sign_permit):
+    # (r, n - s) with the other recovery id recovers the same signer
+    owner = accounts.add()
+    n = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+
+    deadline, v, r, s = sign_permit(token, owner, accounts[1], 10 ** 18)
+    high_s = (n - int.from_bytes(s, "big")).to_bytes(32, "big")
+    with brownie.reverts("Invalid signature"):
+        token.permit(owner, accounts[1], 10 ** 18, deadline, 55 - v, r, high_s, {"from": accounts[2]})
+
+    token.permit(owner, accounts[1], 10 ** 18, deadline, v, r, s, {"from": accounts[2]})
+    assert token.allowance(owner, accounts[1]) == 10 ** 18
+
+
+def test_domain_separator_matches_chain(token, web3):
+    domain = keccak(encode(
+        ["bytes32", "bytes32", "bytes32", "uint256", "address"],
+        [
+            keccak(text="EIP712Domain(string name,string version,uint256 chainId,address verifyingContract)"),
+            keccak(text=token.name()),
+            keccak(text="1"),
+            web3.eth.chain_id,
+            str(token),
+        ],
+    ))
+    assert bytes(HexBytes(token.DOMAIN_SEPARATOR())) == domain
+
+
+# mintBatch Function
+
+
+def test_mint_batch_balances_increase(accounts, token):
+    balances = [token.balanceOf(accounts[1]), token.balanceOf(accounts[2])]
+    token.mintBatch([accounts[1], accounts[2]], [10 ** 18, 2 * 10 ** 18], {"from": accounts[0]})
+
+    assert token.balanceOf(accounts[1]) == balances[0] + 10 ** 18
+    assert token.balanceOf(accounts[2]) == balances[1] + 2 * 10 ** 18
+
+
+def test_mint_batch_total_supply_increases(accounts, token):
+    total_supply = token.totalSupply()
+    token.mintBatch([accounts[1], accounts[2]], [10 ** 18, 2 * 10 ** 18], {"from": accounts[0]})
+
+    assert token.totalSupply() == total_supply + 3 * 10 ** 18
+
+
+def test_mint_batch_events_fire(accounts, token):
+    tx = token.mintBatch([accounts[1], accounts[2]], [10 ** 18, 2 * 10 ** 18], {"from": accounts[0]})
+
+    assert len(tx.events) == 2
+    assert list(tx.events["Transfer"][0].values()) == [ZERO_ADDRESS, accounts[1], 10 ** 18]
+    assert list(tx.events["Transfer"][1].values()) == [ZERO_ADDRESS, accounts[2], 2 * 10 ** 18]
+
+
+def test_mint_batch_length_mismatch(accounts, token):
+    with brownie.reverts("Length mismatch"):
+        token.mintBatch([accounts[1], accounts[2]], [10 ** 18], {"from": accounts[0]})
+
+
+def test_nonwand_cannot_mint_batch(accounts, token):
+    with brownie.reverts():
+        token.mintBatch([accounts[1]], [10 ** 18], {"from": accounts[1]})
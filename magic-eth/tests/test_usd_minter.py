@@ -44,6 +44,49 @@ def test_contract_values_update_on_open_loan(token, usd_token, usd_wand, eth_ora
     pass
 
 
+def test_loan_of_returns_unpacked_loan(token, usd_wand, accounts):
+    amount = 2e21
+
+    token.approve(usd_wand, 1e20, {"from": accounts[0]})
+    usd_wand.open_loan(1e20, amount, {"from": accounts[0]})
+    assert usd_wand.loan_of(accounts[0]) == (1e20, amount * 201 / 200 + 2e20, True)
+    assert usd_wand.loan_of(accounts[1]) == (0, 0, False)
+
+
+def test_loans_of_returns_loans_in_order(token, usd_wand, accounts):
+    token.transfer(accounts[1], 2e20, {"from": accounts[0]})
+    token.approve(usd_wand, 1e20, {"from": accounts[0]})
+    token.approve(usd_wand, 2e20, {"from": accounts[1]})
+    usd_wand.open_loan(1e20, 2e21, {"from": accounts[0]})
+    usd_wand.open_loan(2e20, 2e21, {"from": accounts[1]})
+    debt = 2e21 * 201 / 200 + 2e20
+    assert usd_wand.loans_of([accounts[1], accounts[2], accounts[0]]) == [(2e20, debt, True), (0, 0, False), (1e20, debt, True)]
+    assert usd_wand.loans_of([]) == []
+
+
+def test_system_snapshot_returns_globals(token, usd_token, usd_wand, usd_stability_pool, eth_oracle, accounts):
+    snapshot = usd_wand.system_snapshot()
+    assert snapshot["total_debt"] == 0
+    assert snapshot["lq_price"] == 0
+    assert snapshot["collateral_price"] == 1e21
+
+    token.approve(usd_wand, 1e20, {"from": accounts[0]})
+    usd_wand.open_loan(1e20, 2e21, {"from": accounts[0]})
+    usd_token.approve(usd_stability_pool, 2e21, {"from": accounts[0]})
+    usd_stability_pool.open_deposit(2e21, {"from": accounts[0]})
+    snapshot = usd_wand.system_snapshot()
+    assert snapshot["total_collateral"] == usd_wand.total_collateral() == 1e20
+    assert snapshot["total_debt"] == usd_wand.total_debt()
+    assert snapshot["total_stablecoin"] == 2e21
+    assert snapshot["max_ltv_ratio"] == 9000
+    assert snapshot["borrow_fee"] == 50
+    assert snapshot["lq_reserve_fee"] == 2e20
+    assert snapshot["min_debt_value"] == 2e21
+    assert snapshot["lowest_loan"] == snapshot["highest_loan"] == accounts[0]
+    # 1e20 Collateral at 1e21 is worth 1e23, 2.21e21 of debt puts the liquidation price at 2.431e19
+    assert 2.43e19 < snapshot["lq_price"] < 2.44e19
+
+
 def test_open_loan_with_active_loan(token, usd_wand, accounts):
     amount = 1e20
 
@@ -69,11 +112,19 @@ def test_open_loan_with_insufficent_balance(token, usd_wand, accounts):
         usd_wand.open_loan(amount * 2, 2e21, {"from": accounts[0]})
 
 
+def test_open_loan_with_insufficent_balance_and_approval(token, usd_wand, accounts):
+    amount = token.balanceOf(accounts[0])
+
+    token.approve(usd_wand, amount * 2, {"from": accounts[0]})
+    with brownie.reverts("Insufficient balance"):
+        usd_wand.open_loan(amount * 2, 2e21, {"from": accounts[0]})
+
+
 def test_open_loan_without_approval(token, usd_wand, accounts):
     amount = 1e20
 
     token.approve(usd_wand, amount, {"from": accounts[0]})
-    with brownie.reverts():
+    with brownie.reverts("Insufficient allowance"):
         usd_wand.open_loan(amount * 2, 2e21, {"from": accounts[0]})
 
 
@@ -85,6 +136,37 @@ def test_open_loan_below_lq_price(token, usd_wand, accounts):
         usd_wand.open_loan(amount, 2e21, {"from": accounts[0]})
 
 
+def test_open_loan_with_permit(token, usd_token, usd_wand, accounts, sign_permit):
+    user = accounts.add()
+    token.transfer(user, 1e20, {"from": accounts[0]})
+
+    deadline, v, r, s = sign_permit(token, user, usd_wand, 1e20)
+    usd_wand.open_loan_with_permit(1e20, 2e21, deadline, v, r, s, {"from": user})
+    assert token.balanceOf(usd_wand) == 1e20
+    assert usd_token.balanceOf(user) == 2e21
+    assert usd_wand.loan_of(user)["active"] == True
+
+
+def test_open_loan_with_permit_already_submitted(token, usd_wand, accounts, sign_permit):
+    user = accounts.add()
+    token.transfer(user, 1e20, {"from": accounts[0]})
+
+    # Someone Else Submits The Permit First
+    deadline, v, r, s = sign_permit(token, user, usd_wand, 1e20)
+    token.permit(user, usd_wand, 1e20, deadline, v, r, s, {"from": accounts[1]})
+    usd_wand.open_loan_with_permit(1e20, 2e21, deadline, v, r, s, {"from": user})
+    assert usd_wand.loan_of(user)["active"] == True
+
+
+def test_open_loan_with_permit_for_other_spender(token, usd_wand, accounts, sign_permit):
+    user = accounts.add()
+    token.transfer(user, 1e20, {"from": accounts[0]})
+
+    deadline, v, r, s = sign_permit(token, user, accounts[1], 1e20)
+    with brownie.reverts():
+        usd_wand.open_loan_with_permit(1e20, 2e21, deadline, v, r, s, {"from": user})
+
+
 # close_loan Function
 
 
@@ -107,6 +189,7 @@ def test_collateral_balance_updates_on_close_loan(token, usd_wand, accounts):
     usd_wand.close_loan({"from": accounts[0]})
     assert token.balanceOf(accounts[0]) == init_bal
     assert token.balanceOf(usd_wand) == 0
+    assert usd_wand.loan_of(accounts[0]) == (0, 0, False)
 
 
 def test_stablecoin_balance_updates_on_close_loan(token, usd_token, usd_wand, accounts):
@@ -145,7 +228,7 @@ def test_close_loan_with_insufficient_balance(token, usd_token, usd_wand, accoun
     usd_token.burnFrom(accounts[0], usd_token.balanceOf(accounts[0]), {"from": usd_wand})
     token.approve(usd_wand, amount, {"from": accounts[0]})
     usd_wand.open_loan(amount, 2e21, {"from": accounts[0]})
-    with brownie.reverts():
+    with brownie.reverts("Insufficient balance"):
         usd_wand.close_loan({"from": accounts[0]})
 
 
@@ -197,8 +280,8 @@ def test_collateral_deposit_with_insufficient_balance(token, wand, usd_wand, acc
     amount = 1e18
 
     token.burnFrom(accounts[0], token.balanceOf(accounts[0]) - amount, {"from": wand})
-    token.approve(usd_wand, amount, {"from": accounts[0]})
-    with brownie.reverts():
+    token.approve(usd_wand, amount * 2, {"from": accounts[0]})
+    with brownie.reverts("Insufficient balance"):
         usd_wand.deposit_collateral(amount * 2, {"from": accounts[0]})
 
 
@@ -209,10 +292,22 @@ def test_collateral_deposit_without_approval(token, usd_wand, accounts):
     amount = 1e18
 
     token.approve(usd_wand, amount, {"from": accounts[0]})
-    with brownie.reverts():
+    with brownie.reverts("Insufficient allowance"):
         usd_wand.deposit_collateral(amount * 2, {"from": accounts[0]})
 
 
+def test_collateral_deposit_with_permit(token, usd_wand, accounts, sign_permit):
+    user = accounts.add()
+    token.transfer(user, 2e20, {"from": accounts[0]})
+    token.approve(usd_wand, 1e20, {"from": user})
+    usd_wand.open_loan(1e20, 2e21, {"from": user})
+
+    deadline, v, r, s = sign_permit(token, user, usd_wand, 1e20)
+    usd_wand.deposit_collateral_with_permit(1e20, deadline, v, r, s, {"from": user})
+    assert usd_wand.loan_of(user)["collateral_value"] == 2e20
+    assert token.nonces(user) == 1
+
+
 # withdraw_collateral Function
 
 
@@ -307,6 +402,31 @@ def test_stablecoin_borrow_below_lq_price(token, usd_wand, accounts):
         usd_wand.borrow_stablecoin(amount, {"from": accounts[0]})
 
 
+def test_stablecoin_borrow_checks_lq_price_with_new_debt(token, usd_wand, accounts):
+    # Borrowing less than the current debt must still leave the Loan healthy
+    token.approve(usd_wand, 3e18, {"from": accounts[0]})
+    usd_wand.open_loan(3e18, 2e21, {"from": accounts[0]})
+
+    amount = 1e21
+
+    with brownie.reverts():
+        usd_wand.borrow_stablecoin(amount, {"from": accounts[0]})
+
+
+def test_stablecoin_borrow_checks_lq_price_with_borrow_fee(token, usd_wand, eth_oracle, accounts):
+    # 1e19 Collateral at 1e21 is worth 1e22, which covers up to ~9.09e21 of debt
+    eth_oracle.setCurrentPrice(1e21, {"from": eth_oracle.deployer()})
+    token.approve(usd_wand, 1e19, {"from": accounts[0]})
+    usd_wand.open_loan(1e19, 2e21, {"from": accounts[0]})
+
+    # Healthy without the 0.5% fee, risky with it
+    with brownie.reverts():
+        usd_wand.borrow_stablecoin(6.86e21, {"from": accounts[0]})
+
+    usd_wand.borrow_stablecoin(6.84e21, {"from": accounts[0]})
+    assert usd_wand.loan_of(accounts[0])["debt_value"] == 2.21e21 + 6.84e21 * 201 / 200
+
+
 # repay_stablecoin Function
 
 
@@ -350,7 +470,7 @@ def test_stablecoin_repay_with_insufficient_balance(token, usd_token, usd_wand,
     amount = 1e21
 
     usd_token.burnFrom(accounts[0], usd_token.balanceOf(accounts[0]), {"from": usd_wand})
-    with brownie.reverts():
+    with brownie.reverts("Insufficient balance"):
         usd_wand.repay_stablecoin(amount, {"from": accounts[0]})
 
 
@@ -443,6 +563,357 @@ def test_liquidation_above_lq_price(token, usd_token, usd_wand, usd_stability_po
         usd_wand.liquidate(accounts[0], {"from": accounts[2]})
 
 
+# batch_liquidate Function
+
+
+def test_batch_liquidation_skips_healthy_and_inactive_loans(token, usd_token, usd_wand, usd_stability_pool, eth_oracle, accounts):
+    # Account 0 has a risky Loan, 1 has a healthy Loan, 2 is the liquidator and 3 has no Loan
+    token.transfer(accounts[1], 5e20, {"from": accounts[0]})
+    token.approve(usd_wand, 2e20, {"from": accounts[0]})
+    token.approve(usd_wand, 5e20, {"from": accounts[1]})
+    usd_wand.open_loan(2e20, 2e21, {"from": accounts[0]})
+    usd_wand.open_loan(5e20, 2e21, {"from": accounts[1]})
+
+    usd_token.mintTo(accounts[4], 1e24, {"from": usd_wand})
+    usd_token.approve(usd_stability_pool, 1e24, {"from": accounts[4]})
+    usd_stability_pool.open_deposit(1e24, {"from": accounts[4]})
+
+    init_bal = token.balanceOf(accounts[2])
+
+    eth_oracle.setCurrentPrice(1.2e19, {"from": eth_oracle.deployer()})
+    tx = usd_wand.batch_liquidate([accounts[0], accounts[1], accounts[3]], {"from": accounts[2]})
+    assert tx.return_value == 1
+    assert usd_wand.user_loans(accounts[0])["active"] == False
+    assert usd_wand.user_loans(accounts[1])["active"] == True
+    assert token.balanceOf(accounts[2]) == init_bal + 2e20 / 200
+
+
+def test_batch_liquidation_settles_all_loans_once(token, usd_token, usd_wand, usd_stability_pool, eth_oracle, accounts):
+    # Accounts 0 and 1 have risky Loans, 2 is the liquidator and 4 has a deposit in Stability Pool
+    amount = 2e21
+
+    token.transfer(accounts[1], 1e20, {"from": accounts[0]})
+    token.approve(usd_wand, 1e20, {"from": accounts[0]})
+    token.approve(usd_wand, 1e20, {"from": accounts[1]})
+    usd_wand.open_loan(1e20, amount, {"from": accounts[0]})
+    usd_wand.open_loan(1e20, amount, {"from": accounts[1]})
+
+    usd_token.mintTo(accounts[4], 1e24, {"from": usd_wand})
+    usd_token.approve(usd_stability_pool, 1e24, {"from": accounts[4]})
+    usd_stability_pool.open_deposit(1e24, {"from": accounts[4]})
+
+    init_bal = usd_token.balanceOf(usd_stability_pool)
+    init_bal2 = usd_token.balanceOf(accounts[2])
+    init_bal3 = token.balanceOf(usd_stability_pool)
+
+    eth_oracle.setCurrentPrice(1e18, {"from": eth_oracle.deployer()})
+    tx = usd_wand.batch_liquidate([accounts[0], accounts[1], accounts[0]], {"from": accounts[2]})
+    assert tx.return_value == 2
+    assert usd_token.balanceOf(usd_stability_pool) == init_bal - 2 * ((amount * 201 / 200) + 2e20)
+    assert usd_token.balanceOf(accounts[2]) == init_bal2 + 2 * 2e20
+    assert token.balanceOf(usd_stability_pool) == init_bal3 + 2e20 * 199 / 200
+    assert usd_wand.total_debt() == 0
+    assert usd_wand.total_collateral() == 0
+
+
+def test_batch_liquidation_without_risky_loans(token, usd_wand, accounts):
+    token.approve(usd_wand, 1e21, {"from": accounts[0]})
+    usd_wand.open_loan(1e21, 2e21, {"from": accounts[0]})
+
+    tx = usd_wand.batch_liquidate([accounts[0], accounts[1]], {"from": accounts[2]})
+    assert tx.return_value == 0
+    assert usd_wand.user_loans(accounts[0])["active"] == True
+
+
+def test_batch_liquidation_takes_loans_with_ratio_rounded_to_zero(token, usd_token, usd_wand, usd_stability_pool, eth_oracle, accounts):
+    # At 1 wei every Loan's collateral ratio rounds to zero, which get_lq_price cannot divide by
+    open_sorted_loans(token, usd_wand, accounts)
+
+    usd_token.mintTo(accounts[4], 1e24, {"from": usd_wand})
+    usd_token.approve(usd_stability_pool, 1e24, {"from": accounts[4]})
+    usd_stability_pool.open_deposit(1e24, {"from": accounts[4]})
+
+    eth_oracle.setCurrentPrice(1, {"from": eth_oracle.deployer()})
+    tx = usd_wand.batch_liquidate([accounts[0], accounts[1]], {"from": accounts[3]})
+    assert tx.return_value == 2
+    assert usd_wand.lowest_ratio_loans(3) == [accounts[2]]
+
+    usd_wand.liquidate(accounts[2], {"from": accounts[3]})
+    assert usd_wand.total_debt() == 0
+
+
+# Sorted Loans
+
+
+def open_sorted_loans(token, usd_wand, accounts):
+    # Accounts 0, 1 and 2 open Loans with the same debt and increasing collateral
+    for i in range(3):
+        if i > 0:
+            token.transfer(accounts[i], 1e20 * (i + 1), {"from": accounts[0]})
+        token.approve(usd_wand, 1e20 * (i + 1), {"from": accounts[i]})
+        usd_wand.open_loan(1e20 * (i + 1), 2e21, {"from": accounts[i]})
+
+
+def test_loans_are_sorted_by_ratio(token, usd_wand, accounts):
+    open_sorted_loans(token, usd_wand, accounts)
+
+    assert usd_wand.lowest_ratio_loans(3) == [accounts[0], accounts[1], accounts[2]]
+    assert usd_wand.lowest_ratio_loans(1) == [accounts[0]]
+    assert usd_wand.lowest_loan() == accounts[0]
+    assert usd_wand.highest_loan() == accounts[2]
+
+
+def test_sorted_loans_update_on_collateral_deposit(token, usd_wand, accounts):
+    open_sorted_loans(token, usd_wand, accounts)
+
+    token.approve(usd_wand, 3e20, {"from": accounts[0]})
+    usd_wand.deposit_collateral(3e20, {"from": accounts[0]})
+    assert usd_wand.lowest_ratio_loans(3) == [accounts[1], accounts[2], accounts[0]]
+
+
+def test_sorted_loans_update_on_close_loan(token, usd_token, usd_wand, accounts):
+    open_sorted_loans(token, usd_wand, accounts)
+
+    usd_token.transfer(accounts[1], 1e19, {"from": accounts[0]})
+    usd_wand.close_loan({"from": accounts[1]})
+    assert usd_wand.lowest_ratio_loans(3) == [accounts[0], accounts[2]]
+    assert usd_wand.next_loan(accounts[0]) == accounts[2]
+    assert usd_wand.prev_loan(accounts[2]) == accounts[0]
+
+
+def test_open_loan_with_hints(token, usd_wand, accounts):
+    open_sorted_loans(token, usd_wand, accounts)
+
+    token.transfer(accounts[3], 1.5e20, {"from": accounts[0]})
+    token.approve(usd_wand, 1.5e20, {"from": accounts[3]})
+    (prev, next) = usd_wand.find_insert_position(1.5e20, 2e21 * 201 / 200 + 2e20, accounts[0], accounts[2])
+    assert (prev, next) == (accounts[0], accounts[1])
+
+    usd_wand.open_loan(1.5e20, 2e21, prev, next, {"from": accounts[3]})
+    assert usd_wand.lowest_ratio_loans(4) == [accounts[0], accounts[3], accounts[1], accounts[2]]
+
+
+def test_liquidate_lowest_stops_at_healthy_loan(token, usd_token, usd_wand, usd_stability_pool, eth_oracle, accounts):
+    open_sorted_loans(token, usd_wand, accounts)
+
+    usd_token.mintTo(accounts[4], 1e24, {"from": usd_wand})
+    usd_token.approve(usd_stability_pool, 1e24, {"from": accounts[4]})
+    usd_stability_pool.open_deposit(1e24, {"from": accounts[4]})
+
+    eth_oracle.setCurrentPrice(1e19, {"from": eth_oracle.deployer()})
+    tx = usd_wand.liquidate_lowest(10, {"from": accounts[3]})
+    assert tx.return_value == 2
+    assert usd_wand.lowest_ratio_loans(3) == [accounts[2]]
+    assert usd_wand.loan_of(accounts[2])["active"] == True
+
+
+def test_liquidate_lowest_takes_loans_with_ratio_rounded_to_zero(token, usd_token, usd_wand, usd_stability_pool, eth_oracle, accounts):
+    open_sorted_loans(token, usd_wand, accounts)
+
+    usd_token.mintTo(accounts[4], 1e24, {"from": usd_wand})
+    usd_token.approve(usd_stability_pool, 1e24, {"from": accounts[4]})
+    usd_stability_pool.open_deposit(1e24, {"from": accounts[4]})
+
+    eth_oracle.setCurrentPrice(1, {"from": eth_oracle.deployer()})
+    tx = usd_wand.liquidate_lowest(10, {"from": accounts[3]})
+    assert tx.return_value == 3
+    assert usd_wand.lowest_ratio_loans(3) == []
+
+
+def test_liquidate_lowest_ignores_stablecoins_sent_to_pool(token, usd_token, usd_wand, usd_stability_pool, eth_oracle, accounts):
+    open_sorted_loans(token, usd_wand, accounts)
+    debt = 2e21 * 201 / 200 + 2e20
+
+    # The pool's deposits cover one loan, the donation would cover a second one by balance alone
+    usd_token.mintTo(accounts[4], debt * 2, {"from": usd_wand})
+    usd_token.approve(usd_stability_pool, debt, {"from": accounts[4]})
+    usd_stability_pool.open_deposit(debt, {"from": accounts[4]})
+    usd_token.transfer(usd_stability_pool, debt, {"from": accounts[4]})
+
+    eth_oracle.setCurrentPrice(1e19, {"from": eth_oracle.deployer()})
+    tx = usd_wand.liquidate_lowest(10, {"from": accounts[3]})
+    assert tx.return_value == 1
+    assert usd_wand.lowest_ratio_loans(3) == [accounts[1], accounts[2]]
+    assert usd_stability_pool.total_stablecoin() == 0
+
+
+# Events
+
+
+def test_loan_events_carry_loan_values(token, usd_token, usd_wand, accounts):
+    debt = 2e21 * 201 / 200 + 2e20
+
+    token.approve(usd_wand, 2e20, {"from": accounts[0]})
+    tx = usd_wand.open_loan(1e20, 2e21, {"from": accounts[0]})
+    assert tx.events["LoanOpened"].values() == [accounts[0], 1e20, debt]
+
+    tx = usd_wand.deposit_collateral(1e20, {"from": accounts[0]})
+    assert tx.events["CollateralDeposited"].values() == [accounts[0], 1e20, 2e20, debt]
+
+    tx = usd_wand.withdraw_collateral(5e19, {"from": accounts[0]})
+    assert tx.events["CollateralWithdrawn"].values() == [accounts[0], 5e19, 1.5e20, debt]
+
+    tx = usd_wand.borrow_stablecoin(2e21, {"from": accounts[0]})
+    debt += 2e21 * 201 / 200
+    assert tx.events["DebtBorrowed"].values() == [accounts[0], 2e21, 1.5e20, debt]
+
+    tx = usd_wand.repay_stablecoin(1e21, {"from": accounts[0]})
+    debt -= 1e21
+    assert tx.events["DebtRepaid"].values() == [accounts[0], 1e21, 1.5e20, debt]
+
+    tx = usd_wand.close_loan({"from": accounts[0]})
+    assert tx.events["LoanClosed"].values() == [accounts[0], 1.5e20, debt]
+
+
+def test_liquidation_events_carry_liquidated_values(token, usd_token, usd_wand, usd_stability_pool, eth_oracle, accounts):
+    open_sorted_loans(token, usd_wand, accounts)
+
+    usd_token.mintTo(accounts[4], 1e24, {"from": usd_wand})
+    usd_token.approve(usd_stability_pool, 1e24, {"from": accounts[4]})
+    usd_stability_pool.open_deposit(1e24, {"from": accounts[4]})
+
+    debt = 2e21 * 201 / 200 + 2e20
+    eth_oracle.setCurrentPrice(1e19, {"from": eth_oracle.deployer()})
+    tx = usd_wand.liquidate(accounts[0], {"from": accounts[3]})
+    assert tx.events["Liquidated"].values() == [accounts[0], accounts[3], 1e20, debt, 1e19]
+
+    tx = usd_wand.liquidate_lowest(10, {"from": accounts[3]})
+    assert len(tx.events["Liquidated"]) == 1
+    assert tx.events["Liquidated"][0]["user"] == accounts[1]
+    assert tx.events["PoolAbsorbed"][0]["debt_value"] == debt
+
+
+# Oracle Price
+
+
+def test_price_is_cached_with_round_and_block(usd_wand, eth_oracle, accounts):
+    tx = usd_wand.refresh_collateral_price({"from": accounts[0]})
+    assert usd_wand.cached_collateral_price() == (1e21, eth_oracle.round_id(), tx.block_number)
+
+
+def test_price_is_refreshed_in_a_new_block(usd_wand, eth_oracle, accounts):
+    usd_wand.refresh_collateral_price({"from": accounts[0]})
+    eth_oracle.setCurrentPrice(2e21, {"from": eth_oracle.deployer()})
+    assert usd_wand.system_snapshot()["collateral_price"] == 2e21
+
+    tx = usd_wand.refresh_collateral_price({"from": accounts[0]})
+    assert usd_wand.cached_collateral_price() == (2e21, eth_oracle.round_id(), tx.block_number)
+
+
+def open_caller_loan(token, usd_wand, eth_oracle, SameBlockCaller, accounts):
+    # A loan owned by a contract that can update the oracle and use the loan in one transaction
+    caller = SameBlockCaller.deploy({"from": accounts[0]})
+    eth_oracle.setDeployer(caller, {"from": eth_oracle.deployer()})
+    token.transfer(caller, 1e20, {"from": accounts[0]})
+    caller.open_loan(usd_wand, token, 1e20, 2e21, {"from": accounts[0]})
+    return caller
+
+
+def test_borrow_reads_round_published_in_same_block(token, usd_wand, eth_oracle, SameBlockCaller, accounts):
+    caller = open_caller_loan(token, usd_wand, eth_oracle, SameBlockCaller, accounts)
+
+    # Solvent at the cached price, insolvent at the new round
+    with brownie.reverts():
+        caller.refresh_update_and_borrow(usd_wand, eth_oracle, 5e20, 5e22, {"from": accounts[0]})
+
+    caller.refresh_update_and_borrow(usd_wand, eth_oracle, 1e21, 5e22, {"from": accounts[0]})
+    assert usd_wand.loan_of(caller)["debt_value"] > 5e22
+
+
+def test_withdraw_reads_round_published_in_same_block(token, usd_wand, eth_oracle, SameBlockCaller, accounts):
+    caller = open_caller_loan(token, usd_wand, eth_oracle, SameBlockCaller, accounts)
+
+    with brownie.reverts():
+        caller.refresh_update_and_withdraw(usd_wand, eth_oracle, 5e19, 6e19, {"from": accounts[0]})
+
+    caller.refresh_update_and_withdraw(usd_wand, eth_oracle, 1e21, 6e19, {"from": accounts[0]})
+    assert usd_wand.loan_of(caller)["collateral_value"] == 4e19
+
+
+def hand_oracle_to_caller_at_risky_price(token, usd_token, usd_wand, usd_stability_pool, eth_oracle, SameBlockCaller, accounts):
+    # Risky loans at the price the caller caches, before it publishes a new round in the same transaction
+    open_sorted_loans(token, usd_wand, accounts)
+    usd_token.mintTo(accounts[4], 1e24, {"from": usd_wand})
+    usd_token.approve(usd_stability_pool, 1e24, {"from": accounts[4]})
+    usd_stability_pool.open_deposit(1e24, {"from": accounts[4]})
+
+    caller = SameBlockCaller.deploy({"from": accounts[0]})
+    eth_oracle.setCurrentPrice(1e19, {"from": eth_oracle.deployer()})
+    eth_oracle.setDeployer(caller, {"from": eth_oracle.deployer()})
+    return caller
+
+
+def test_liquidate_reads_round_published_in_same_block(token, usd_token, usd_wand, usd_stability_pool, eth_oracle, SameBlockCaller, accounts):
+    caller = hand_oracle_to_caller_at_risky_price(token, usd_token, usd_wand, usd_stability_pool, eth_oracle, SameBlockCaller, accounts)
+
+    # Risky at the cached price, healthy at the new round
+    with brownie.reverts():
+        caller.refresh_update_and_liquidate(usd_wand, eth_oracle, 1e21, accounts[0], {"from": accounts[0]})
+
+    caller.refresh_update_and_liquidate(usd_wand, eth_oracle, 1e19, accounts[0], {"from": accounts[0]})
+    assert usd_wand.loan_of(accounts[0])["active"] == False
+
+
+def test_batch_liquidate_reads_round_published_in_same_block(token, usd_token, usd_wand, usd_stability_pool, eth_oracle, SameBlockCaller, accounts):
+    caller = hand_oracle_to_caller_at_risky_price(token, usd_token, usd_wand, usd_stability_pool, eth_oracle, SameBlockCaller, accounts)
+
+    caller.refresh_update_and_batch_liquidate(usd_wand, eth_oracle, 1e21, [accounts[0], accounts[1]], {"from": accounts[0]})
+    assert usd_wand.loan_of(accounts[0])["active"] == True
+    assert usd_wand.loan_of(accounts[1])["active"] == True
+
+    caller.refresh_update_and_batch_liquidate(usd_wand, eth_oracle, 1e19, [accounts[0], accounts[1]], {"from": accounts[0]})
+    assert usd_wand.loan_of(accounts[0])["active"] == False
+    assert usd_wand.loan_of(accounts[1])["active"] == False
+
+
+def test_liquidate_lowest_reads_round_published_in_same_block(token, usd_token, usd_wand, usd_stability_pool, eth_oracle, SameBlockCaller, accounts):
+    caller = hand_oracle_to_caller_at_risky_price(token, usd_token, usd_wand, usd_stability_pool, eth_oracle, SameBlockCaller, accounts)
+
+    caller.refresh_update_and_liquidate_lowest(usd_wand, eth_oracle, 1e21, 10, {"from": accounts[0]})
+    assert usd_wand.lowest_ratio_loans(3) == [accounts[0], accounts[1], accounts[2]]
+
+    caller.refresh_update_and_liquidate_lowest(usd_wand, eth_oracle, 1e19, 10, {"from": accounts[0]})
+    assert usd_wand.loan_of(accounts[0])["active"] == False
+
+
+def test_stale_price_reverts(token, usd_wand, chain, accounts):
+    token.approve(usd_wand, 1e20, {"from": accounts[0]})
+    chain.sleep(usd_wand.max_price_age() + 1)
+    with brownie.reverts("Stale price"):
+        usd_wand.open_loan(1e20, 2e21, {"from": accounts[0]})
+
+
+def test_incomplete_round_reverts(usd_wand, eth_oracle, chain, accounts):
+    eth_oracle.setRoundData(5, 1e21, chain.time(), 4, {"from": eth_oracle.deployer()})
+    with brownie.reverts("Stale round"):
+        usd_wand.refresh_collateral_price({"from": accounts[0]})
+
+
+def test_nonpositive_price_reverts(usd_wand, eth_oracle, accounts):
+    eth_oracle.setCurrentPrice(0, {"from": eth_oracle.deployer()})
+    with brownie.reverts("Invalid price"):
+        usd_wand.refresh_collateral_price({"from": accounts[0]})
+
+
+# set_max_price_age Function
+
+
+def test_deployer_can_set_max_price_age(usd_wand, chain, accounts):
+    usd_wand.set_max_price_age(7200, {"from": usd_wand.deployer()})
+    assert usd_wand.max_price_age() == 7200
+
+    chain.sleep(3601)
+    usd_wand.refresh_collateral_price({"from": accounts[0]})
+
+
+def test_nondeployer_cannot_set_max_price_age(usd_wand, accounts):
+    hacker = accounts[1]
+    assert hacker != usd_wand.deployer()
+
+    with brownie.reverts():
+        usd_wand.set_max_price_age(10 ** 9, {"from": hacker})
+
+
 # set_rewards Function
 
 